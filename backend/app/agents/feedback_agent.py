@@ -1,13 +1,25 @@
 # backend/app/agents/feedback_agent.py
 
-import openai
+import asyncio
 import json
+from collections import deque
 from pathlib import Path
-from .. import schemas, config
+from typing import Deque, Optional, Tuple
+from .. import schemas
+from ..config import settings
+from ..services.keyed_lock import KeyedLocks
+from ..services.llm_gateway import llm_gateway
+from ..services.metrics import metrics
+
+FEEDBACK_ERROR_MESSAGE = "Could not generate feedback due to an internal error."
+PREFETCH_PRIORITY = 9 #behind every pipeline stage, prefetch only uses spare capacity
+
+ResultKey = Tuple[str, str, str] #job_id, student_id, question_id
 
 class FeedbackAgent:
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=config.settings.OPENAI_API_KEY)
+    def __init__(self, storage_agent=None):
+        self.llm = llm_gateway
+        self.storage = storage_agent #needed for lazy mode (get_or_generate_feedback / prefetch)
         
         current_dir = Path(__file__).parent
         prompt_file = current_dir.parent.parent / "prompts" / "feedback_prompt.txt"
@@ -15,7 +27,18 @@ class FeedbackAgent:
         with open(prompt_file, "r", encoding="utf-8") as f:
             self.feedback_prompt_template = f.read()
 
-    def generate_feedback_for_question(self, grading_result: schemas.GradingResult, student_answer_text: str, question_text: str) -> str:
+        #one generation per card even if the teacher clicks twice or prefetch gets there first
+        self._locks = KeyedLocks()
+        self._prefetch_queue: Deque[ResultKey] = deque()
+        self._prefetch_task: Optional[asyncio.Task] = None
+
+    async def generate_feedback_for_question(
+        self,
+        grading_result: schemas.GradingResult,
+        student_answer_text: str,
+        question_text: str,
+        priority: Optional[int] = None
+    ) -> str:
         prompt = self.feedback_prompt_template.format(
             question_text=question_text,
             student_answer_text=student_answer_text,
@@ -26,7 +49,9 @@ class FeedbackAgent:
             rubric_breakdown=json.dumps(grading_result.rubric_breakdown)
         )
         try:
-            response = self.client.chat.completions.create(
+            response = await self.llm.chat(
+                "feedback",
+                priority=priority,
                 model="gpt-4o-mini",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.2
@@ -34,4 +59,48 @@ class FeedbackAgent:
             return response.choices[0].message.content.strip()
         except Exception as e:
             print(f"Error generating feedback: {e}")
-            return "Could not generate feedback due to an internal error."
\ No newline at end of file
+            return FEEDBACK_ERROR_MESSAGE
+
+    async def get_or_generate_feedback(
+        self, job_id: str, student_id: str, question_id: str, priority: Optional[int] = None
+    ) -> Optional[str]:
+        """
+        Lazy mode: returns the stored feedback of a result, generating and storing it
+        on first request. None if there is no such result.
+        """
+        async with self._locks.hold((job_id, student_id, question_id)):
+            result = await asyncio.to_thread(self.storage.get_result, job_id, student_id, question_id)
+            if result is None:
+                return None
+            if result.friendly_feedback:
+                return result.friendly_feedback
+            with metrics.span("feedback", job_id):
+                feedback = await self.generate_feedback_for_question(
+                    result, result.student_answer_text, result.question_text, priority=priority
+                )
+            if feedback == FEEDBACK_ERROR_MESSAGE:
+                return feedback #not stored, the next request tries again
+            updated = result.model_copy(update={"friendly_feedback": feedback})
+            #staged, so a pending copy without feedback cannot overwrite it on the next flush
+            self.storage.stage_result(updated)
+            await asyncio.to_thread(self.storage.flush)
+            return feedback
+
+    def schedule_prefetch(self, result: schemas.GradingResult):
+        """FEEDBACK_PREFETCH: generates the feedback in the background while the LLM budget is idle."""
+        if not settings.FEEDBACK_PREFETCH:
+            return
+        self._prefetch_queue.append((result.job_id, result.student_id, result.question_id))
+        if self._prefetch_task is None or self._prefetch_task.done():
+            self._prefetch_task = asyncio.create_task(self._prefetch_loop())
+
+    async def _prefetch_loop(self):
+        while self._prefetch_queue:
+            if not self.llm.scheduler.is_idle():
+                await asyncio.sleep(settings.FEEDBACK_PREFETCH_POLL_INTERVAL)
+                continue
+            key = self._prefetch_queue.popleft()
+            try:
+                await self.get_or_generate_feedback(*key, priority=PREFETCH_PRIORITY)
+            except Exception as e:
+                print(f"Feedback prefetch for {key} failed: {e}")
\ No newline at end of file
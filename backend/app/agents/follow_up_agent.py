@@ -1,64 +1,175 @@
 # backend/app/agents/follow_up_agent.py
 
-import openai
+import asyncio
+import hashlib
+import json
 from pathlib import Path
-from .. import schemas, config
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from .. import schemas
+from ..config import settings
+from ..services.cache import TieredCache
+from ..services.keyed_lock import KeyedLocks
+from ..services.llm_gateway import llm_gateway
+from ..services.llm_scheduler import approx_tokens
 from .storage_agent import StorageAgent
 
+NO_RESULT_MESSAGE = "İlgili soru için bir değerlendirme sonucu bulunamadı."
+ERROR_MESSAGE = "Takip sorusuna cevap üretilirken bir hata oluştu."
+#older messages are summarized this many at a time (two turns), so the summary of
+#a given prefix is reused by every later question instead of being rebuilt
+HISTORY_FOLD_STEP = 4
+
 class FollowUpAgent:
     def __init__(self, storage_agent: StorageAgent):
-        self.client = openai.OpenAI(api_key=config.settings.OPENAI_API_KEY)
+        self.llm = llm_gateway
         self.storage_agent = storage_agent
-        
-        prompt_file = Path(__file__).parent.parent.parent / "prompts" / "follow_up_prompt.txt"
-        with open(prompt_file, "r", encoding="utf-8") as f:
+
+        prompts_dir = Path(__file__).parent.parent.parent / "prompts"
+        with open(prompts_dir / "follow_up_prompt.txt", "r", encoding="utf-8") as f:
             self.prompt_template = f.read()
+        with open(prompts_dir / "follow_up_history_prompt.txt", "r", encoding="utf-8") as f:
+            self.history_prompt_template = f.read()
 
-    def _format_history_for_prompt(self, history):
-        if not history:
-            return "No previous conversation."
+        #rolling summaries of older messages, keyed by a hash of the summarized prefix
+        self.summary_cache = TieredCache(max_items=settings.FOLLOWUP_SUMMARY_CACHE_ITEMS, name="followup_summary")
+        #one question at a time per card, so two answers never overwrite each other's history
+        self._locks = KeyedLocks()
+
+    def _format_history_for_prompt(self, history: List[Dict[str, Any]]) -> str:
         return "\n".join([f"{msg['role']}: {msg['content']}" for msg in history])
 
-    def answer_query(self, job_id: str, student_id: str, question_id: str, user_question: str) -> str:
+    def _split_history(self, history: List[Dict[str, Any]]) -> int:
+        """
+        Index where the verbatim part starts: the newest messages that fit
+        FOLLOWUP_HISTORY_TOKEN_BUDGET stay as they are, older ones are summarized.
+        Rounded down to HISTORY_FOLD_STEP so the summarized prefix changes rarely.
+        """
+        used = 0
+        cut = len(history)
+        while cut > 0:
+            cost = approx_tokens(history[cut - 1]["content"])
+            kept = len(history) - cut
+            if used + cost > settings.FOLLOWUP_HISTORY_TOKEN_BUDGET and kept >= settings.FOLLOWUP_MIN_RECENT_MESSAGES:
+                break
+            used += cost
+            cut -= 1
+        return cut - cut % HISTORY_FOLD_STEP
+
+    def _prefix_keys(self, history: List[Dict[str, Any]], cut: int) -> Dict[int, str]:
+        """Content hash of history[:end] for every fold boundary up to cut."""
+        digest = hashlib.sha256()
+        keys = {}
+        for i, msg in enumerate(history[:cut], start=1):
+            digest.update(json.dumps([msg["role"], msg["content"]], ensure_ascii=False).encode("utf-8"))
+            if i % HISTORY_FOLD_STEP == 0:
+                keys[i] = digest.copy().hexdigest()
+        return keys
+
+    async def _summarize_older(self, history: List[Dict[str, Any]], cut: int) -> str:
+        """Rolling summary of history[:cut]: the newest cached summary is extended with the messages after it."""
+        if cut == 0:
+            return ""
+        keys = self._prefix_keys(history, cut)
+        start, summary = 0, ""
+        for end in range(cut, 0, -HISTORY_FOLD_STEP):
+            cached = self.summary_cache.get(keys[end])
+            if cached is not None:
+                if end == cut:
+                    return cached
+                start, summary = end, cached
+                break
+
+        prompt = self.history_prompt_template.format(
+            previous_summary=summary or "-",
+            messages=self._format_history_for_prompt(history[start:cut])
+        )
+        try:
+            response = await self.llm.chat(
+                "followup",
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.0
+            )
+            summary = response.choices[0].message.content.strip()
+        except Exception as e:
+            #answer with the older summary (or none) rather than failing the question
+            print(f"Error summarizing follow-up history: {e}")
+            return summary
+        self.summary_cache.set(keys[cut], summary)
+        return summary
+
+    async def _prepare(self, job_id: str, student_id: str, question_id: str, user_question: str) -> Optional[Tuple[List[Dict[str, Any]], List[Dict[str, str]]]]:
+        """Returns (stored chat_history, messages for the llm), or None if there is no such result."""
         #get from storage
-        context_result = self.storage_agent.get_result(job_id, student_id, question_id)
-        chat_history = self.storage_agent.get_chat_history(job_id, student_id, question_id)
+        context_result = await asyncio.to_thread(self.storage_agent.get_result, job_id, student_id, question_id)
+        chat_history = await asyncio.to_thread(self.storage_agent.get_chat_history, job_id, student_id, question_id)
 
         if not context_result:
-            return "İlgili soru için bir değerlendirme sonucu bulunamadı."
-            
-        #add to history
-        chat_history.append({"role": "user", "content": user_question})
-        
-        #prepare prompt
-        prompt = self.prompt_template.format(
+            return None
+
+        #stable prefix first (same for every question on this card, so provider prompt caching applies),
+        #then what changes: summary of older messages, recent messages verbatim, the new question
+        system_prompt = self.prompt_template.format(
             question_text=context_result.question_text,
             student_answer_text=context_result.student_answer_text,
             score=context_result.score,
             max_score=context_result.max_score,
             justification=context_result.justification,
-            advice_for_full_marks=context_result.advice_for_full_marks,
-            history=self._format_history_for_prompt(chat_history),
-            user_question=user_question,
             student_id=student_id,
             question_id=question_id
         )
+        messages = [{"role": "system", "content": system_prompt}]
 
-        #llm call
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            ai_response = response.choices[0].message.content.strip()
-            
-            #save answer
-            chat_history.append({"role": "ai", "content": ai_response})
-            self.storage_agent.save_chat_history(job_id, student_id, question_id, chat_history)
-            
-            return ai_response
-        except Exception as e:
-            chat_history.pop()
-            print(f"Error generating follow-up answer: {e}")
-            return "Takip sorusuna cevap üretilirken bir hata oluştu."
\ No newline at end of file
+        cut = self._split_history(chat_history)
+        summary = await self._summarize_older(chat_history, cut)
+        if summary:
+            messages.append({"role": "system", "content": f"<conversation_summary>\n{summary}\n</conversation_summary>"})
+        for msg in chat_history[cut:]:
+            messages.append({"role": "assistant" if msg["role"] == "ai" else "user", "content": msg["content"]})
+        messages.append({"role": "user", "content": user_question})
+        return chat_history, messages
+
+    def _request(self, messages: List[Dict[str, str]]) -> dict:
+        return {"model": "gpt-4o-mini", "messages": messages, "temperature": 0.3}
+
+    async def _save_answer(self, job_id: str, student_id: str, question_id: str, chat_history, user_question: str, ai_response: str):
+        #new list, the one read from storage is left untouched
+        new_history = chat_history + [
+            {"role": "user", "content": user_question},
+            {"role": "ai", "content": ai_response}
+        ]
+        await asyncio.to_thread(self.storage_agent.save_chat_history, job_id, student_id, question_id, new_history)
+
+    async def answer_query(self, job_id: str, student_id: str, question_id: str, user_question: str) -> str:
+        async with self._locks.hold((job_id, student_id, question_id)):
+            prepared = await self._prepare(job_id, student_id, question_id, user_question)
+            if prepared is None:
+                return NO_RESULT_MESSAGE
+            chat_history, messages = prepared
+
+            #llm call
+            try:
+                response = await self.llm.chat("followup", **self._request(messages))
+                ai_response = response.choices[0].message.content.strip()
+
+                #save answer
+                await self._save_answer(job_id, student_id, question_id, chat_history, user_question, ai_response)
+                return ai_response
+            except Exception as e:
+                print(f"Error generating follow-up answer: {e}")
+                return ERROR_MESSAGE
+
+    async def stream_answer(self, job_id: str, student_id: str, question_id: str, user_question: str) -> AsyncIterator[str]:
+        """Like answer_query, but yields the answer piece by piece; history is saved once the answer is complete."""
+        async with self._locks.hold((job_id, student_id, question_id)):
+            prepared = await self._prepare(job_id, student_id, question_id, user_question)
+            if prepared is None:
+                yield NO_RESULT_MESSAGE
+                return
+            chat_history, messages = prepared
+
+            parts = []
+            async for delta in self.llm.stream_chat("followup", **self._request(messages)):
+                parts.append(delta)
+                yield delta
+            await self._save_answer(job_id, student_id, question_id, chat_history, user_question, "".join(parts).strip())
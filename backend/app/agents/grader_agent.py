@@ -1,74 +1,184 @@
 # backend/app/agents/grader_agent.py
 
-import openai
 import json
+import asyncio
+import hashlib
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
 
 from .. import schemas
 from ..config import settings
+from ..services.cache import TieredCache
+from ..services.audit_store import make_prompt_ref
+from ..services.llm_gateway import llm_gateway
+from .normalizer_agent import NormalizerAgent
+
+#bumped when the layout of a cache entry changes, older entries are then never read
+CACHE_ENTRY_FORMAT = 2
+
+#extra prompt parts for FUSED_FEEDBACK, so feedback comes back in the same JSON
+FUSED_FEEDBACK_TASK = (
+    "\n6.  Write a brief, student-friendly feedback message: acknowledge the student's effort, "
+    "explain in one or two sentences why the score was given, and turn the advice for full marks "
+    "into actionable steps. Keep the tone positive and constructive."
+)
+FUSED_FEEDBACK_FIELD = ',\n  "friendly_feedback": "<string, the feedback message addressed directly to the student.>"'
 
 class GraderAgent:
     def __init__(self):
-        if not settings.OPENAI_API_KEY:
-            raise ValueError("OPENAI_API_KEY environment variable not set!")
-        self.client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-        
+        self.llm = llm_gateway
+        self.normalizer = NormalizerAgent()
+        self.model = "gpt-4o-mini"
+        self.model_params = {"temperature": 0.0, "response_format": {"type": "json_object"}}
+
         current_dir = Path(__file__).parent
         prompt_file = current_dir.parent.parent / "prompts" / "grader_prompt.txt"
-        
+
         with open(prompt_file, "r", encoding="utf-8") as f:
             self.prompt_template = f.read()
+        with open(current_dir.parent.parent / "prompts" / "grader_batch_prompt.txt", "r", encoding="utf-8") as f:
+            self.batch_prompt_template = f.read()
+
+        self.fused_feedback = settings.FUSED_FEEDBACK
+        self.prompt_parts = {"feedback_task": "", "feedback_field": ""}
+        if self.fused_feedback:
+            self.prompt_parts = {"feedback_task": FUSED_FEEDBACK_TASK, "feedback_field": FUSED_FEEDBACK_FIELD}
+        self.batch_prompt_parts = {
+            "feedback_task": self.prompt_parts["feedback_task"],
+            "feedback_field": self.prompt_parts["feedback_field"].replace("\n  ", "\n      ")
+        }
+
+        #any edit to a template (or switching fused mode) invalidates cached grades
+        mode = "fused" if self.fused_feedback else "plain"
+        self.prompt_version = hashlib.sha256(f"{mode}|{self.prompt_template}".encode("utf-8")).hexdigest()[:12]
+        self.batch_prompt_version = hashlib.sha256(f"{mode}|{self.batch_prompt_template}".encode("utf-8")).hexdigest()[:12]
+
+        #temperature=0.0, so the same answer to the same question grades the same
+        self.cache: Optional[TieredCache] = None
+        if settings.GRADING_CACHE_ENABLED:
+            self.cache = TieredCache(
+                max_items=settings.GRADING_CACHE_MAX_ITEMS,
+                disk_dir=settings.GRADING_CACHE_DIR,
+                max_disk_bytes=settings.GRADING_CACHE_MAX_DISK_MB * 1024 * 1024,
+                name="grading"
+            )
 
+    def _cache_key(self, question: schemas.QuestionObject, answer_text: str, prompt_version: str) -> str:
+        """Soru, rubrik, normalize edilmiş cevap, model ve prompt versiyonundan içerik tabanlı anahtar üretir."""
+        payload = {
+            "answer": self.normalizer.normalize(answer_text),
+            "question_text": question.question_text,
+            "expected_answer": question.expected_answer,
+            "max_score": question.max_score,
+            "rubric": question.rubric,
+            "model": self.model,
+            "model_params": self.model_params,
+            "prompt_version": prompt_version,
+            "entry_format": CACHE_ENTRY_FORMAT,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
 
-    def grade_question(
+    async def _get_cached(self, key: str, question: schemas.QuestionObject, student_answer: schemas.StudentAnswerObject, job_id: str) -> Optional[schemas.GradingResult]:
+        if not self.cache:
+            return None
+        cached_json = await asyncio.to_thread(self.cache.get, key)
+        if cached_json is None:
+            return None
+        entry = json.loads(cached_json)
+        cached = schemas.GradingResult.model_validate(entry["result"])
+        #re-key the stored grade to this job/student, verification runs again
+        result = cached.model_copy(update={
+            "job_id": job_id,
+            "student_id": student_answer.student_id,
+            "question_id": question.question_id,
+            "student_answer_text": student_answer.student_answer_text,
+            "timestamp": datetime.utcnow(),
+            "verifier_status": schemas.VerifierStatus(valid=False, issues=["Verification has not been run yet."])
+        })
+        #the prompt that produced this grade, written to this run's audit store with the result
+        result._audit_texts = entry["audit_texts"]
+        return result
+
+    async def _set_cached(self, key: str, result: schemas.GradingResult):
+        #audit texts are not serialized with the model, they are cached next to it
+        entry = {"result": result.model_dump(mode="json"), "audit_texts": result._audit_texts}
+        await asyncio.to_thread(self.cache.set, key, json.dumps(entry, ensure_ascii=False))
+
+    async def grade_question(
         self,
         question: schemas.QuestionObject,
         student_answer: schemas.StudentAnswerObject,
         job_id: str
     ) -> schemas.GradingResult:
-        
-        prompt = self.prompt_template.format(
+
+        cache_key = self._cache_key(question, student_answer.student_answer_text, self.prompt_version)
+        cached_result = await self._get_cached(cache_key, question, student_answer, job_id)
+        if cached_result:
+            return cached_result
+
+        variables = dict(
             question_text=question.question_text,
             expected_answer=question.expected_answer,
             max_score=question.max_score,
             rubric=json.dumps(question.rubric),
-            student_answer=student_answer.student_answer_text
+            student_answer=student_answer.student_answer_text,
+            **self.prompt_parts
         )
+        prompt = self.prompt_template.format(**variables)
+        #stored as template + values, the rendered prompt is rebuilt only for the audit view
+        prompt_ref = make_prompt_ref("grader", self.prompt_template, variables)
 
         llm_raw_response = ""
         llm_response_data = {}
-        
+        llm_failed = False
+
         #not verified, it only retrieves data from the LLM
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
+            response = await self.llm.chat(
+                "grader",
+                model=self.model,
                 messages=[
                     {"role": "system", "content": "You are an expert exam grader AI."},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.0,
-                response_format={"type": "json_object"}
+                **self.model_params
             )
             llm_raw_response = response.choices[0].message.content
             llm_response_data = json.loads(llm_raw_response)
 
         except Exception as e:
             print(f"LLM call or JSON parsing failed: {e}")
+            llm_failed = True
             llm_response_data = {
                 "justification": f"LLM Error: {str(e)}",
                 "score": 0,
                 "rubric_breakdown": {}
             }
-        
+
+        result = self._build_result(question, student_answer, job_id, llm_response_data, prompt_ref, llm_raw_response)
+
+        #errors are never cached, the next attempt should call the LLM again
+        if self.cache and not llm_failed:
+            await self._set_cached(cache_key, result)
+        return result
+
+    def _build_result(
+        self,
+        question: schemas.QuestionObject,
+        student_answer: schemas.StudentAnswerObject,
+        job_id: str,
+        llm_response_data: Dict[str, Any],
+        prompt_ref: Tuple[schemas.PromptRef, Dict[str, str]],
+        llm_raw_response: str
+    ) -> schemas.GradingResult:
         #verifier agent start
         initial_verifier_status = schemas.VerifierStatus(
-            valid=False, 
+            valid=False,
             issues=["Verification has not been run yet."]
         )
 
-        return schemas.GradingResult(
+        result = schemas.GradingResult(
             job_id=job_id,
             student_id=student_answer.student_id,
             question_id=question.question_id,
@@ -80,10 +190,97 @@ class GraderAgent:
             rubric_breakdown=llm_response_data.get("rubric_breakdown", {}),
             justification=llm_response_data.get("justification", "No justification provided."),
             advice_for_full_marks=llm_response_data.get("advice_for_full_marks", ""),
-            llm_prompt=prompt,
+            friendly_feedback=(llm_response_data.get("friendly_feedback") or None) if self.fused_feedback else None,
+            prompt_ref=prompt_ref[0],
             llm_raw_response=llm_raw_response,
-            model="gpt-4o-mini",
-            model_params={"temperature": 0.0, "response_format": {"type": "json_object"}},
+            model=self.model,
+            model_params=self.model_params,
             timestamp=datetime.utcnow(),
             verifier_status=initial_verifier_status
-        )
\ No newline at end of file
+        )
+        #written to the audit store together with the result (StorageAgent)
+        result._audit_texts = prompt_ref[1]
+        return result
+
+    async def grade_questions_batch(
+        self,
+        items: List[Tuple[schemas.QuestionObject, schemas.StudentAnswerObject]],
+        job_id: str
+    ) -> List[schemas.GradingResult]:
+        """
+        Bir öğrencinin birden fazla sorusunu tek bir JSON-mode çağrısında notlandırır.
+        Eksik veya bozuk gelen sorular tek tek grade_question ile yeniden denenir.
+        Sonuçlar `items` ile aynı sırada döner.
+        """
+        results: Dict[str, schemas.GradingResult] = {}
+        cache_keys: Dict[str, str] = {}
+        pending = []
+        for question, student_answer in items:
+            key = self._cache_key(question, student_answer.student_answer_text, self.batch_prompt_version)
+            cached_result = await self._get_cached(key, question, student_answer, job_id)
+            if cached_result:
+                results[question.question_id] = cached_result
+            else:
+                cache_keys[question.question_id] = key
+                pending.append((question, student_answer))
+
+        if pending:
+            questions_json = json.dumps([
+                {
+                    "question_id": question.question_id,
+                    "question_text": question.question_text,
+                    "expected_answer": question.expected_answer,
+                    "max_score": question.max_score,
+                    "rubric": question.rubric,
+                    "student_answer": student_answer.student_answer_text
+                }
+                for question, student_answer in pending
+            ], ensure_ascii=False, indent=2)
+            variables = dict(questions_json=questions_json, **self.batch_prompt_parts)
+            prompt = self.batch_prompt_template.format(**variables)
+            #the questions_json text is shared by every result of this call, stored once
+            prompt_ref = make_prompt_ref("grader_batch", self.batch_prompt_template, variables)
+
+            items_by_id: Dict[str, Dict[str, Any]] = {}
+            try:
+                response = await self.llm.chat(
+                    "grader",
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": "You are an expert exam grader AI."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    **self.model_params
+                )
+                response_data = json.loads(response.choices[0].message.content)
+                for item in response_data.get("results", []):
+                    if isinstance(item, dict) and "score" in item and isinstance(item.get("rubric_breakdown"), dict):
+                        items_by_id[str(item.get("question_id"))] = item
+            except Exception as e:
+                print(f"Batch grading failed, falling back to single calls: {e}")
+
+            fallback = []
+            for question, student_answer in pending:
+                item = items_by_id.get(question.question_id)
+                if item is None:
+                    fallback.append((question, student_answer))
+                    continue
+                try:
+                    #the item itself is the raw response, so the corrector sees only this question
+                    result = self._build_result(question, student_answer, job_id, item, prompt_ref, json.dumps(item, ensure_ascii=False))
+                except Exception as e:
+                    print(f"Batch item {question.question_id} is invalid, falling back: {e}")
+                    fallback.append((question, student_answer))
+                    continue
+                results[question.question_id] = result
+                if self.cache:
+                    await self._set_cached(cache_keys[question.question_id], result)
+
+            if fallback:
+                single_results = await asyncio.gather(*(
+                    self.grade_question(question, student_answer, job_id) for question, student_answer in fallback
+                ))
+                for result in single_results:
+                    results[result.question_id] = result
+
+        return [results[question.question_id] for question, _ in items]
@@ -1,84 +1,182 @@
 # backend/app/agents/pdf_parser_agent.py
 
-import pdfplumber
 import re
 import json
-import openai
-from typing import List
-from io import BytesIO
+import asyncio
+import hashlib
+from typing import List, Optional, Tuple
 from pathlib import Path
-from .. import schemas, config
+from .. import schemas
+from ..config import settings
+from ..services.cache import TieredCache
+from ..services.llm_gateway import llm_gateway
+from ..services.metrics import metrics
+from ..services.pdf_extract import extract_pages, get_pdf_pool
 from .normalizer_agent import NormalizerAgent
 
 class PDFParserAgent:
     def __init__(self):
         self.normalizer = NormalizerAgent()
         
-        self.client = openai.OpenAI(api_key=config.settings.OPENAI_API_KEY)
+        self.llm = llm_gateway
         prompt_file = Path(__file__).parent.parent.parent / "prompts" / "parser_prompt.txt"
         with open(prompt_file, "r", encoding="utf-8") as f:
             self.parser_prompt_template = f.read()
+        self.model = "gpt-4o-mini"
+        self.prompt_version = hashlib.sha256(self.parser_prompt_template.encode("utf-8")).hexdigest()[:12]
 
-    def parse_answer_key(self, file_content: bytes) -> List[schemas.QuestionObject]:
-        #extract questions and answers
-        file = BytesIO(file_content)
-        raw_text = ""
-        with pdfplumber.open(file) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text(x_tolerance=1, y_tolerance=3)
-                if page_text:
-                    raw_text += page_text + "\n"
-        
+        #same key pdf for every section / re-run -> parse once, survives restarts
+        self.answer_key_cache: Optional[TieredCache] = None
+        if settings.ANSWER_KEY_CACHE_ENABLED:
+            self.answer_key_cache = TieredCache(
+                max_items=settings.ANSWER_KEY_CACHE_MAX_ITEMS,
+                disk_dir=settings.ANSWER_KEY_CACHE_DIR,
+                max_disk_bytes=settings.ANSWER_KEY_CACHE_MAX_DISK_MB * 1024 * 1024,
+                name="answer_key"
+            )
+
+    async def _extract_pages(self, file_path: Path, layout_tolerance: bool = False) -> List[str]:
+        #CPU-bound, runs in the process pool so sheets are really extracted in parallel
+        loop = asyncio.get_running_loop()
+        with metrics.span("pdf_extract"):
+            return await loop.run_in_executor(
+                get_pdf_pool(settings.PDF_WORKERS),
+                extract_pages, str(file_path), settings.PDF_TEXT_BACKEND, layout_tolerance
+            )
+
+    def _split_answer_key(self, pages: List[str]) -> List[str]:
+        """
+        Uzun cevap anahtarlarını soru sınırlarından ("Soru N:") parçalara böler; hiç soru başlığı
+        yoksa sayfa gruplarına böler. Her parça en fazla ANSWER_KEY_CHUNK_CHARS karakterdir
+        (tek bir soru bu sınırdan uzunsa bölünmez).
+        """
+        raw_text = "".join(page_text + "\n" for page_text in pages if page_text)
+        max_chars = settings.ANSWER_KEY_CHUNK_CHARS
+        if len(raw_text) <= max_chars:
+            return [raw_text]
+
+        blocks = re.split(r'(?=Soru \d+:)', raw_text)
+        if len(blocks) > 2:
+            #text before the first question (title etc.) rides along with it
+            blocks = [blocks[0] + blocks[1]] + blocks[2:]
+        else:
+            blocks = [page_text + "\n" for page_text in pages if page_text]
+
+        chunks = []
+        current = ""
+        for block in blocks:
+            if current and len(current) + len(block) > max_chars:
+                chunks.append(current)
+                current = ""
+            current += block
+        if current:
+            chunks.append(current)
+        return chunks
+
+    @staticmethod
+    def _question_order(question: schemas.QuestionObject):
+        number = re.search(r'\d+', question.question_id or "")
+        return (int(number.group()) if number else float("inf"), question.question_id)
+
+    async def _extract_questions(self, raw_text: str) -> List[schemas.QuestionObject]:
         prompt = self.parser_prompt_template.format(raw_text=raw_text)
+
+        response = await self.llm.chat(
+            "parser",
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.0,
+            response_format={"type": "json_object"}
+        )
+        response_data = json.loads(response.choices[0].message.content)
         
-        questions = []
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.0,
-                response_format={"type": "json_object"}
-            )
-            response_data = json.loads(response.choices[0].message.content)
-            
-            #key or list?
-            if isinstance(response_data, dict):
-                #(example 'questions', 'data', veya first key))
-                key_to_list = next((k for k in response_data if isinstance(response_data[k], list)), None)
-                if key_to_list:
-                    extracted_list = response_data[key_to_list]
-                else:
-                    raise ValueError("LLM response did not contain a JSON array.")
-            elif isinstance(response_data, list):
-                extracted_list = response_data
+        #key or list?
+        if isinstance(response_data, dict):
+            #(example 'questions', 'data', veya first key))
+            key_to_list = next((k for k in response_data if isinstance(response_data[k], list)), None)
+            if key_to_list:
+                extracted_list = response_data[key_to_list]
             else:
-                raise ValueError("LLM response is not a valid JSON array or object containing an array.")
-
-            for item in extracted_list:
-                questions.append(schemas.QuestionObject(
-                    question_id=item.get("question_id"),
-                    question_text=self.normalizer.normalize(item.get("question_text")),
-                    expected_answer=self.normalizer.normalize(item.get("expected_answer")),
-                    max_score=10,
-                    rubric={"dogruluk_ve_detay": 10},
-                    metadata=schemas.PDFMetadata(page=1, raw_confidence=0.98) #trust score
-                ))
+                raise ValueError("LLM response did not contain a JSON array.")
+        elif isinstance(response_data, list):
+            extracted_list = response_data
+        else:
+            raise ValueError("LLM response is not a valid JSON array or object containing an array.")
+
+        questions = []
+        for item in extracted_list:
+            questions.append(schemas.QuestionObject(
+                question_id=item.get("question_id"),
+                question_text=self.normalizer.normalize(item.get("question_text")),
+                expected_answer=self.normalizer.normalize(item.get("expected_answer")),
+                max_score=10,
+                rubric={"dogruluk_ve_detay": 10},
+                metadata=schemas.PDFMetadata(page=1, raw_confidence=0.98) #trust score
+            ))
+        return questions
+
+    async def _extract_chunk(self, chunk: str) -> List[schemas.QuestionObject]:
+        """Bir parçayı parse eder; bozuk JSON gibi hatalarda ANSWER_KEY_CHUNK_RETRIES kez yeniden dener."""
+        for attempt in range(settings.ANSWER_KEY_CHUNK_RETRIES + 1):
+            try:
+                return await self._extract_questions(chunk)
+            except Exception as e:
+                if attempt >= settings.ANSWER_KEY_CHUNK_RETRIES:
+                    raise
+                print(f"Uyarı: cevap anahtarı parçası yeniden deneniyor ({attempt + 1}). Hata: {e}")
+
+    async def parse_answer_key(self, file_path: Path) -> List[schemas.QuestionObject]:
+        #extract questions and answers
+        pages = await self._extract_pages(file_path, layout_tolerance=True)
+        chunks = self._split_answer_key(pages)
         
+        #one call per chunk, all at once: latency follows the largest chunk, not the whole key
+        tasks = [asyncio.create_task(self._extract_chunk(chunk)) for chunk in chunks]
+        try:
+            chunk_results = await asyncio.gather(*tasks)
         except Exception as e:
+            #the key is unusable without every chunk, stop paying for the others
+            for task in tasks:
+                task.cancel()
             print(f"Hata: LLM tabanlı cevap anahtarı parse edilirken sorun oluştu. Hata: {e}")
             return []
-            
-        return questions
 
-    def parse_student_answers(self, file_content: bytes, student_id: str) -> List[schemas.StudentAnswerObject]:
-        file = BytesIO(file_content)
+        #a question cut across two chunks may come back twice, keep the first one
+        questions = {}
+        for question in (q for chunk_questions in chunk_results for q in chunk_questions):
+            questions.setdefault(question.question_id, question)
+        return sorted(questions.values(), key=self._question_order)
+
+    async def load_answer_key(self, answer_key: schemas.StoredFile) -> Tuple[List[schemas.QuestionObject], bool]:
+        """
+        Cevap anahtarını PDF içeriğinin SHA-256'sı, parser prompt versiyonu ve metin çıkarma ayarlarına göre önbellekten getirir,
+        yoksa parse edip önbelleğe yazar. (sorular, önbellekten_mi) döner.
+        """
+        if not self.answer_key_cache:
+            return await self.parse_answer_key(answer_key.path), False
+
+        #text backend and chunk size change the text the questions are parsed from
+        cache_key = hashlib.sha256(
+            f"{answer_key.sha256}|{self.model}|{self.prompt_version}|{settings.PDF_TEXT_BACKEND}|{settings.ANSWER_KEY_CHUNK_CHARS}".encode("utf-8")
+        ).hexdigest()
+        cached_json = await asyncio.to_thread(self.answer_key_cache.get, cache_key)
+        if cached_json is not None:
+            return [schemas.QuestionObject.model_validate(item) for item in json.loads(cached_json)], True
+
+        questions = await self.parse_answer_key(answer_key.path)
+        #an empty list means the parse failed, try again next time
+        if questions:
+            payload = json.dumps([q.model_dump(mode="json") for q in questions], ensure_ascii=False)
+            await asyncio.to_thread(self.answer_key_cache.set, cache_key, payload)
+        return questions, False
+
+    async def parse_student_answers(self, file_path: Path, student_id: str) -> List[schemas.StudentAnswerObject]:
+        pages = await self._extract_pages(file_path)
         text = ""
-        with pdfplumber.open(file) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    #normalizer agent
-                    text += self.normalizer.normalize(page_text) + "\n"
+        for page_text in pages:
+            if page_text:
+                #normalizer agent
+                text += self.normalizer.normalize(page_text) + "\n"
 
         answers = []
         question_blocks = re.split(r'(?=Soru \d+:)', text)[1:]
@@ -1,34 +1,175 @@
 # backend/app/agents/storage_agent.py
 
-from typing import Dict, List, Any
+import threading
+from typing import Dict, Iterator, List, Any, Optional, Tuple
 from .. import schemas
+from ..config import settings
+from ..services.storage_backends import StorageBackend, InMemoryStorageBackend, SQLiteStorageBackend
+from ..services.audit_store import compact
+
+def create_storage_backend() -> StorageBackend:
+    """settings.STORAGE_BACKEND'e göre depolama arka ucunu seçer."""
+    if settings.STORAGE_BACKEND == "memory":
+        return InMemoryStorageBackend()
+    return SQLiteStorageBackend(settings.STORAGE_DB_PATH, pool_size=settings.STORAGE_POOL_SIZE)
 
 class StorageAgent:
-    def __init__(self):
-        self.results_db: Dict[str, schemas.GradingResult] = {}
-        self.chat_histories: Dict[str, List[Dict[str, Any]]] = {}
+    def __init__(self, backend: Optional[StorageBackend] = None):
+        self.backend = backend or create_storage_backend()
+        #results staged by the orchestrator, written in one transaction on flush()
+        self._pending: Dict[Tuple[str, str, str], schemas.GradingResult] = {}
+        #audit texts (prompt parts, raw responses) of the staged results, content key -> text
+        self._pending_texts: Dict[str, str] = {}
+        self._pending_lock = threading.Lock()
+
+    def save_result(self, result: schemas.GradingResult) -> schemas.GradingResult:
+        stored, texts = compact(result)
+        self.backend.save_results([stored], texts)
+        print(f"Result for {result.job_id}_{result.student_id}_{result.question_id} saved.")
+        return stored
+
+    def save_results(self, results: List[schemas.GradingResult]) -> List[schemas.GradingResult]:
+        """Birden fazla sonucu tek bir transaction ile yazar."""
+        stored, texts = [], {}
+        for result in results:
+            compacted, result_texts = compact(result)
+            stored.append(compacted)
+            texts.update(result_texts)
+        self.backend.save_results(stored, texts)
+        return stored
 
-    def _get_key(self, job_id: str, student_id: str, question_id: str) -> str:
-        """Tüm metodlarda kullanılacak standart bir anahtar oluşturur."""
-        return f"{job_id}_{student_id}_{question_id}"
+    def stage_result(self, result: schemas.GradingResult) -> schemas.GradingResult:
+        """
+        Sonucu bir sonraki flush()'a kadar bellekte tutar; okumalar onu hemen görür.
+        Ham LLM cevabı audit deposuna taşınır; dönen (kompakt) sonuç yayınlanacak olandır.
+        """
+        stored, texts = compact(result)
+        with self._pending_lock:
+            self._pending[(stored.job_id, stored.student_id, stored.question_id)] = stored
+            self._pending_texts.update(texts)
+        return stored
 
-    def save_result(self, result: schemas.GradingResult):
-        #for key _get_key
-        key = self._get_key(result.job_id, result.student_id, result.question_id)
-        self.results_db[key] = result
-        print(f"Result for {key} saved.")
+    def flush(self):
+        with self._pending_lock:
+            batch = list(self._pending.values())
+            texts = dict(self._pending_texts)
+        if not batch and not texts:
+            return
+        self.backend.save_results(batch, texts)
+        with self._pending_lock:
+            for result in batch:
+                key = (result.job_id, result.student_id, result.question_id)
+                #a newer version may have been staged while we were writing
+                if self._pending.get(key) is result:
+                    del self._pending[key]
+            #content-keyed, so a text staged again meanwhile is the same one just written
+            for key in texts:
+                self._pending_texts.pop(key, None)
+        print(f"{len(batch)} results saved.")
 
     def get_result(self, job_id: str, student_id: str, question_id: str) -> schemas.GradingResult | None:
-        #for key _get_key
-        key = self._get_key(job_id, student_id, question_id)
-        return self.results_db.get(key)
-        
+        with self._pending_lock:
+            pending = self._pending.get((job_id, student_id, question_id))
+        if pending:
+            return pending
+        return self.backend.get_result(job_id, student_id, question_id)
+
+    def list_results(self, job_id: str) -> List[schemas.GradingResult]:
+        """Bir işin tüm sonuçları (indeksli sorgu, tam tarama yok)."""
+        return self._merge_pending(self.backend.list_results(job_id), job_id)
+
+    def list_student(self, job_id: str, student_id: str) -> List[schemas.GradingResult]:
+        """Bir öğrencinin bir işteki tüm sonuçları."""
+        return self._merge_pending(self.backend.list_student(job_id, student_id), job_id, student_id)
+
+    def iter_results(self, job_id: str, page_size: int = 500, with_audit: bool = False) -> Iterator[List[schemas.GradingResult]]:
+        """
+        Bir işin sonuçlarını sayfa sayfa döner (tüm iş belleğe alınmaz); henüz flush edilmemiş
+        sonuçlar da dahildir. İş sürerken çağrılırsa o ana kadar biten sonuçları kapsar.
+        `with_audit` ile llm_prompt ve llm_raw_response audit deposundan doldurulur.
+        """
+        seen = set()
+        cursor = 0
+        while True:
+            page, cursor = self.backend.results_page(job_id, cursor, page_size)
+            if not page:
+                break
+            with self._pending_lock:
+                #a staged newer version wins over the stored one, as in get_result
+                page = [self._pending.get((r.job_id, r.student_id, r.question_id), r) for r in page]
+            seen.update((r.student_id, r.question_id) for r in page)
+            yield self.with_audit(page) if with_audit else page
+        with self._pending_lock:
+            pending = [r for key, r in self._pending.items() if key[0] == job_id and key[1:] not in seen]
+        for start in range(0, len(pending), page_size):
+            page = pending[start:start + page_size]
+            yield self.with_audit(page) if with_audit else page
+
+    def get_audit_texts(self, keys: List[str]) -> Dict[str, str]:
+        """Audit texts by content key: staged ones from memory, the rest from the backend."""
+        with self._pending_lock:
+            texts = {key: self._pending_texts[key] for key in keys if key in self._pending_texts}
+        missing = [key for key in keys if key not in texts]
+        if missing:
+            texts.update(self.backend.get_audit_texts(missing))
+        return texts
+
+    def with_audit(self, results: List[schemas.GradingResult]) -> List[schemas.GradingResult]:
+        """Copies with the rendered prompt and the raw response filled in (one lookup for all of them)."""
+        texts = self.get_audit_texts(list(dict.fromkeys(key for r in results for key in r.audit_keys())))
+        hydrated = []
+        for result in results:
+            try:
+                prompt = result.render_prompt(texts)
+            except KeyError: #a text missing from the audit store
+                prompt = None
+            raw_response = result.llm_raw_response
+            if raw_response is None and result.raw_response_ref:
+                raw_response = texts.get(result.raw_response_ref)
+            hydrated.append(result.model_copy(update={"llm_prompt": prompt, "llm_raw_response": raw_response}))
+        return hydrated
+
+    def get_audit(self, job_id: str, student_id: str, question_id: str) -> Optional[schemas.AuditRecord]:
+        """Tek bir sonucun tam prompt'u ve ham cevabı; metinler yalnızca burada açılır."""
+        result = self.get_result(job_id, student_id, question_id)
+        if result is None:
+            return None
+        hydrated = self.with_audit([result])[0]
+        prompt_ref = result.prompt_ref
+        variables = {}
+        if prompt_ref is not None:
+            texts = self.get_audit_texts(list(prompt_ref.variables.values()))
+            variables = {name: texts[key] for name, key in prompt_ref.variables.items() if key in texts}
+        return schemas.AuditRecord(
+            job_id=job_id,
+            student_id=student_id,
+            question_id=question_id,
+            model=result.model,
+            model_params=result.model_params,
+            prompt_template_id=prompt_ref.template_id if prompt_ref else None,
+            prompt_version=prompt_ref.version if prompt_ref else None,
+            prompt_variables=variables,
+            llm_prompt=hydrated.llm_prompt,
+            llm_raw_response=hydrated.llm_raw_response
+        )
+
+    def _merge_pending(self, stored: List[schemas.GradingResult], job_id: str, student_id: Optional[str] = None) -> List[schemas.GradingResult]:
+        with self._pending_lock:
+            pending = {
+                key: result for key, result in self._pending.items()
+                if key[0] == job_id and (student_id is None or key[1] == student_id)
+            }
+        if not pending:
+            return stored
+        merged = [pending.pop((r.job_id, r.student_id, r.question_id), r) for r in stored]
+        return merged + list(pending.values())
+
     def get_chat_history(self, job_id: str, student_id: str, question_id: str) -> List[Dict[str, Any]]:
-        #for key _get_key
-        key = self._get_key(job_id, student_id, question_id)
-        return self.chat_histories.get(key, [])
+        return self.backend.get_chat_history(job_id, student_id, question_id)
 
     def save_chat_history(self, job_id: str, student_id: str, question_id: str, history: List[Dict[str, Any]]):
-        #for key _get_key
-        key = self._get_key(job_id, student_id, question_id)
-        self.chat_histories[key] = history
\ No newline at end of file
+        self.backend.save_chat_history(job_id, student_id, question_id, history)
+
+    def close(self):
+        self.flush()
+        self.backend.close()
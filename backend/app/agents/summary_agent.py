@@ -1,14 +1,14 @@
 # backend/app/agents/summary_agent.py
 
-import openai
 import json
-from typing import List
+from typing import Callable, List, Optional
 from pathlib import Path
-from .. import schemas, config
+from .. import schemas
+from ..services.llm_gateway import llm_gateway
 
 class SummaryAgent:
     def __init__(self):
-        self.client = openai.OpenAI(api_key=config.settings.OPENAI_API_KEY)
+        self.llm = llm_gateway
 
         current_dir = Path(__file__).parent
         prompt_file = current_dir.parent.parent / "prompts" / "summary_prompt.txt"
@@ -16,22 +16,34 @@ class SummaryAgent:
         with open(prompt_file, "r", encoding="utf-8") as f:
             self.summary_prompt_template = f.read()
 
-    def generate_summary_report(self, all_graded_results: List[schemas.GradingResult]) -> str:
+    async def generate_summary_report(
+        self,
+        all_graded_results: List[schemas.GradingResult],
+        on_delta: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Returns the full report; with `on_delta` the completion is streamed and every text piece is passed to it."""
         results_for_prompt = [
-            result.model_dump(mode='json', exclude={'llm_prompt', 'llm_raw_response'}) 
+            result.model_dump(mode='json', exclude={'llm_prompt', 'llm_raw_response', 'prompt_ref', 'raw_response_ref', 'friendly_feedback'}) 
             for result in all_graded_results
         ]
         
         prompt = self.summary_prompt_template.format(
             all_graded_results=json.dumps(results_for_prompt, indent=2)
         )
+        request = {
+            "model": "gpt-4o-mini",
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.3
+        }
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            return response.choices[0].message.content.strip()
+            if on_delta is None:
+                response = await self.llm.chat("summary", **request)
+                return response.choices[0].message.content.strip()
+            parts = []
+            async for delta in self.llm.stream_chat("summary", **request):
+                parts.append(delta)
+                on_delta(delta)
+            return "".join(parts).strip()
         except Exception as e:
             print(f"Error generating summary: {e}")
-            return "Could not generate summary report due to an internal error."
\ No newline at end of file
+            return "Could not generate summary report due to an internal error."
@@ -1,30 +1,58 @@
 # backend/app/agents/verifier_agent.py
 
 import json
-import openai
 from pathlib import Path
-from .. import schemas, config
-from typing import List
+from .. import schemas
+from ..config import settings
+from ..services.llm_gateway import llm_gateway
+from ..services.metrics import metrics
+from typing import List, Dict
 
 
 class VerifierAgent:
     def __init__(self):
-        self.client = openai.OpenAI(api_key=config.settings.OPENAI_API_KEY)
+        self.llm = llm_gateway
+        self.local_repair_enabled = settings.VERIFIER_LOCAL_REPAIR
+        #how often each path was taken, "llm_corrections_avoided" = fixed by rules alone
+        self.stats: Dict[str, int] = {
+            "verified": 0,
+            "invalid": 0,
+            "local_repairs": 0,
+            "llm_corrections": 0,
+            "llm_corrections_avoided": 0,
+        }
         prompt_file = Path(__file__).parent.parent.parent / "prompts" / "corrector_prompt.txt"
         with open(prompt_file, "r", encoding="utf-8") as f:
             self.corrector_prompt_template = f.read()
 
-    def _attempt_correction(self, result: schemas.GradingResult, issues: List[str]) -> schemas.GradingResult:
+    def _count(self, outcome: str):
+        #per agent here, process-wide in metrics (/api/llm/stats, /metrics)
+        self.stats[outcome] += 1
+        metrics.record_verifier(outcome)
+
+    async def _attempt_correction(self, result: schemas.GradingResult, issues: List[str]) -> schemas.GradingResult:
         """LLM kullanarak hatalı sonucu düzeltmeye çalışır."""
         print(f"--- VerifierAgent: Correction attempt for Q{result.question_id} ---")
         
+        original_json = result.llm_raw_response #grader output
+        if result.verifier_status.repairs or original_json is None:
+            #send the locally repaired values so the corrector does not undo them
+            #(or the parsed ones, if the raw response was already moved to the audit store)
+            original_json = json.dumps({
+                "score": result.score,
+                "rubric_breakdown": result.rubric_breakdown,
+                "justification": result.justification,
+                "advice_for_full_marks": result.advice_for_full_marks
+            }, ensure_ascii=False)
+
         prompt = self.corrector_prompt_template.format(
-            original_json=result.llm_raw_response, #grader output
+            original_json=original_json,
             issues="\n- ".join(issues)
         )
         
         try:
-            response = self.client.chat.completions.create(
+            response = await self.llm.chat(
+                "verifier",
                 model="gpt-4o-mini",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.0,
@@ -60,31 +88,98 @@ class VerifierAgent:
             return result
 
 
-    def verify_grading_result(self, result: schemas.GradingResult) -> schemas.GradingResult:
+    def _find_issues(self, result: schemas.GradingResult) -> List[str]:
         issues = []
-        is_valid = True
 
         rubric_sum = sum(result.rubric_breakdown.values())
         if round(rubric_sum, 2) != round(result.score, 2):
             issues.append(f"Score-Rubric mismatch: Rubric sum is {rubric_sum}, but score is {result.score}.")
-            is_valid = False
 
         if result.score < 0:
             issues.append(f"Invalid score: Score {result.score} is negative.")
-            is_valid = False
         if result.score > result.max_score:
             issues.append(f"Invalid score: Score {result.score} is higher than max_score {result.max_score}.")
-            is_valid = False
 
         if not result.justification or len(result.justification) < 10:
             issues.append("Justification is missing or too short.")
-            is_valid = False
-            
-        result.verifier_status.valid = is_valid
+        return issues
+
+    def _attempt_local_repair(self, result: schemas.GradingResult) -> schemas.GradingResult:
+        """
+        Puan/rubrik tutarsızlıklarını LLM çağırmadan, kurallarla düzeltir.
+        Uygulanan her kural verifier_status.repairs listesine yazılır.
+        Gerekçe eksikliği gibi kurallarla çözülemeyen sorunlar olduğu gibi kalır.
+        """
+        repairs = result.verifier_status.repairs
+        max_score = result.max_score
+        breakdown = dict(result.rubric_breakdown)
+        score = result.score
+
+        #negative rubric items are never valid
+        negative_keys = [key for key, value in breakdown.items() if value < 0]
+        for key in negative_keys:
+            breakdown[key] = 0.0
+        if negative_keys:
+            repairs.append(f"clamp_rubric_items: negative items {negative_keys} set to 0.")
+
+        if len(breakdown) == 1:
+            #a single rubric item is the score itself, trust the (clamped) score
+            key = next(iter(breakdown))
+            clamped = float(min(max(score, 0), max_score))
+            if clamped != score:
+                repairs.append(f"clamp_score: {score} clamped to {clamped} (max_score {max_score}).")
+                score = clamped
+            if round(breakdown[key], 2) != round(score, 2):
+                repairs.append(f"single_rubric_item: '{key}' set from {breakdown[key]} to the score {score}.")
+                breakdown[key] = score
+
+        elif len(breakdown) > 1:
+            rubric_sum = sum(breakdown.values())
+            if rubric_sum > max_score:
+                #keep the item proportions, scale them into the allowed range
+                factor = max_score / rubric_sum
+                breakdown = {key: round(value * factor, 2) for key, value in breakdown.items()}
+                repairs.append(f"rescale_rubric: items scaled by {factor:.4f} so their sum fits max_score {max_score}.")
+                rubric_sum = sum(breakdown.values())
+            if round(rubric_sum, 2) != round(score, 2):
+                repairs.append(f"trust_rubric_sum: score {score} replaced by rubric sum {round(rubric_sum, 2)}.")
+                score = round(rubric_sum, 2)
+
+        else:
+            #no breakdown to trust, only the range can be fixed here
+            clamped = float(min(max(score, 0), max_score))
+            if clamped != score:
+                repairs.append(f"clamp_score: {score} clamped to {clamped} (max_score {max_score}).")
+                score = clamped
+
+        result.rubric_breakdown = breakdown
+        result.score = score
+        return result
+
+    async def verify_grading_result(self, result: schemas.GradingResult) -> schemas.GradingResult:
+        self._count("verified")
+        issues = self._find_issues(result)
+
+        if issues and self.local_repair_enabled:
+            self._count("invalid")
+            result = self._attempt_local_repair(result)
+            if result.verifier_status.repairs:
+                self._count("local_repairs")
+                result.verifier_status.was_corrected = True
+                remaining_issues = self._find_issues(result)
+                if not remaining_issues:
+                    self._count("llm_corrections_avoided")
+                    print(f"--- VerifierAgent: Q{result.question_id} repaired locally: {result.verifier_status.repairs} ---")
+                issues = remaining_issues
+        elif issues:
+            self._count("invalid")
+
+        result.verifier_status.valid = not issues
         result.verifier_status.issues = issues
         
-        if not is_valid:
-            #if the result is invalid, attempt correction
-            return self._attempt_correction(result, issues)
+        if issues:
+            #rules could not fix everything, attempt correction with the LLM
+            self._count("llm_corrections")
+            return await self._attempt_correction(result, issues)
 
-        return result
\ No newline at end of file
+        return result
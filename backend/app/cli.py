@@ -0,0 +1,192 @@
+# backend/app/cli.py
+"""
+Offline bulk grading without the API server.
+
+    cd backend
+    python -m app.cli ../exams/final --output final.jsonl --students 8 --questions 5
+
+The directory holds the answer key (answer_key.pdf by default) and one PDF per
+student; the file name (without .pdf) is the student id. Every event of the job
+(partial_result = one GradingResult, student_summary, job_done, ...) is appended
+to the output as one JSON line as soon as it happens.
+
+Finished work is also recorded in a checkpoint file (<output>.checkpoint). Running
+the same command again after a crash or Ctrl+C resumes the same job: students
+with a summary are skipped and already graded questions are not graded again.
+Use --fresh to start over.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from . import schemas
+from .config import settings
+from .orchestrator import OrchestratorAgent
+from .services.event_bus import event_bus
+from .services.llm_gateway import llm_gateway
+from .services.pdf_extract import shutdown_pdf_pool
+
+class Checkpoint:
+    """
+    Append-only JSONL: first line {"job_id": ...}, then {"student_id", "question_id"}
+    per graded question and {"student_id", "summary": true} per finished student.
+    A line is written only after the matching output line, so a torn last line is
+    simply ignored on resume.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.job_id: Optional[str] = None
+        self.graded: Set[Tuple[str, str]] = set()
+        self.summarized: Set[str] = set()
+        self._file = None
+
+    def load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue #interrupted while writing
+                if "job_id" in entry:
+                    self.job_id = entry["job_id"]
+                elif entry.get("summary"):
+                    self.summarized.add(entry["student_id"])
+                else:
+                    self.graded.add((entry["student_id"], entry["question_id"]))
+
+    def open(self, job_id: str):
+        new_file = self.job_id is None
+        self.job_id = job_id
+        self._file = open(self.path, "a", encoding="utf-8")
+        if new_file:
+            self._append({"job_id": job_id})
+
+    def _append(self, entry: Dict):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def mark_graded(self, student_id: str, question_id: str):
+        self.graded.add((student_id, question_id))
+        self._append({"student_id": student_id, "question_id": question_id})
+
+    def mark_summarized(self, student_id: str):
+        self.summarized.add(student_id)
+        self._append({"student_id": student_id, "summary": True})
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+def load_previous_results(output_path: Path, checkpoint: Checkpoint) -> Dict[str, List[schemas.GradingResult]]:
+    """Graded-but-not-summarized results of the interrupted run, read back from its output."""
+    previous: Dict[str, Dict[str, schemas.GradingResult]] = {}
+    if not output_path.exists():
+        return {}
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if event.get("event") != "partial_result" or event["data"].get("job_id") != checkpoint.job_id:
+                continue
+            result = schemas.GradingResult.model_validate(event["data"])
+            key = (result.student_id, result.question_id)
+            if key in checkpoint.graded and result.student_id not in checkpoint.summarized:
+                previous.setdefault(result.student_id, {})[result.question_id] = result
+    return {student_id: list(results.values()) for student_id, results in previous.items()}
+
+def find_exam_files(exam_dir: Path, answer_key_name: str) -> Tuple[Path, List[Path]]:
+    answer_key = exam_dir / answer_key_name
+    if not answer_key.exists():
+        raise FileNotFoundError(f"Answer key not found: {answer_key}")
+    student_sheets = sorted(p for p in exam_dir.glob("*.pdf") if p.name != answer_key.name)
+    if not student_sheets:
+        raise FileNotFoundError(f"No student sheets (*.pdf) in {exam_dir}")
+    return answer_key, student_sheets
+
+async def write_events(subscriber, output, checkpoint: Checkpoint) -> bool:
+    """Appends every event of the job to the output; returns False if the job failed."""
+    succeeded = True
+    while (item := await subscriber.get()) is not None:
+        _, event_json = item
+        output.write(event_json + "\n")
+        output.flush()
+        event = json.loads(event_json)
+        data = event["data"]
+        if event["event"] == "partial_result":
+            checkpoint.mark_graded(data["student_id"], data["question_id"])
+        elif event["event"] == "student_summary":
+            checkpoint.mark_summarized(data["student_id"])
+            print(f"{data['student_id']}: {data['total_score']}/{data['total_max_score']}")
+        elif event["event"] == "error":
+            print(f"Job failed: {data.get('message')}", file=sys.stderr)
+            succeeded = False
+    return succeeded
+
+async def run(args: argparse.Namespace) -> int:
+    exam_dir = Path(args.exam_dir)
+    output_path = Path(args.output)
+    checkpoint = Checkpoint(Path(args.checkpoint) if args.checkpoint else output_path.with_name(output_path.name + ".checkpoint"))
+    if args.fresh:
+        output_path.unlink(missing_ok=True)
+        checkpoint.path.unlink(missing_ok=True)
+
+    settings.MAX_STUDENTS_IN_FLIGHT = args.students
+    settings.MAX_QUESTIONS_IN_FLIGHT = args.questions
+    answer_key, student_sheets = find_exam_files(exam_dir, args.answer_key)
+
+    checkpoint.load()
+    resume = schemas.ResumeState(
+        graded=load_previous_results(output_path, checkpoint),
+        summarized=checkpoint.summarized
+    )
+    if checkpoint.job_id:
+        print(f"Resuming job {checkpoint.job_id}: {len(checkpoint.summarized)} students done, "
+              f"{sum(len(r) for r in resume.graded.values())} questions reused.")
+
+    orchestrator = OrchestratorAgent()
+    try:
+        job = orchestrator.create_job(job_id=checkpoint.job_id)
+        checkpoint.open(job.job_id)
+        file_paths = await orchestrator.register_local_files(answer_key, student_sheets)
+        print(f"Job {job.job_id}: {len(student_sheets)} student sheets -> {output_path}")
+
+        #subscribed before the job starts, unbounded so no result is ever dropped
+        subscriber = event_bus.subscribe(job.job_id, bounded=False)
+        with open(output_path, "a", encoding="utf-8") as output:
+            writer = asyncio.create_task(write_events(subscriber, output, checkpoint))
+            await orchestrator.process_job(job.job_id, file_paths, resume=resume)
+            succeeded = await writer
+        return 0 if succeeded and job.status == "completed" else 1
+    finally:
+        checkpoint.close()
+        await llm_gateway.aclose()
+        await asyncio.to_thread(orchestrator.storage_agent.close)
+        shutdown_pdf_pool()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Grade a directory of exam PDFs offline, results as JSONL.")
+    parser.add_argument("exam_dir", help="directory with the answer key and one PDF per student")
+    parser.add_argument("--answer-key", default="answer_key.pdf", help="answer key file name inside exam_dir")
+    parser.add_argument("--output", default="results.jsonl", help="JSONL file the events are appended to")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--students", type=int, default=settings.MAX_STUDENTS_IN_FLIGHT, help="students graded at the same time")
+    parser.add_argument("--questions", type=int, default=settings.MAX_QUESTIONS_IN_FLIGHT, help="questions per student graded at the same time")
+    parser.add_argument("--fresh", action="store_true", help="delete output and checkpoint, start a new job")
+    args = parser.parse_args(argv)
+    try:
+        return asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("Interrupted, run the same command again to resume.", file=sys.stderr)
+        return 130
+
+#the pdf process pool spawns workers that re-import __main__
+if __name__ == "__main__":
+    sys.exit(main())
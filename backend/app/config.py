@@ -1,12 +1,142 @@
 #backend/app/config.py
 
+from typing import Dict, List, Literal, Optional
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
-    OPENAI_API_KEY: str
+    OPENAI_API_KEY: Optional[str] = None #required unless LLM_BACKEND=fake
+
+    #"fake" = built-in stand-in (app/services/fake_llm.py) for benchmarks and local runs without a key
+    LLM_BACKEND: Literal["openai", "fake"] = "openai"
+    FAKE_LLM_LATENCY_DISTRIBUTION: Literal["constant", "uniform", "lognormal"] = "lognormal"
+    FAKE_LLM_LATENCY_MEDIAN: float = 0.5 #seconds per call
+    FAKE_LLM_LATENCY_SIGMA: float = 0.4 #lognormal sigma, or +/- fraction of the median for uniform
+    FAKE_LLM_TOKENS_PER_SECOND: float = 0.0 #extra latency per completion token, 0 = off
+    FAKE_LLM_RATE_LIMIT_RATE: float = 0.0 #fraction of calls answered with 429
+    FAKE_LLM_ERROR_RATE: float = 0.0 #fraction of calls answered with 500
+    FAKE_LLM_SCORE_MISMATCH_RATE: float = 0.0 #fraction of grades whose score != rubric sum (exercises the verifier)
+    FAKE_LLM_SEED: Optional[int] = None #seeds latency and error draws
+
+    #pipeline concurrency (1 / 1 = old sequential behaviour)
+    MAX_STUDENTS_IN_FLIGHT: int = 4 #students graded at the same time in one job
+    MAX_QUESTIONS_IN_FLIGHT: int = 5 #questions of one student graded at the same time
+    PARSED_SHEETS_QUEUE_SIZE: int = 32 #student sheets parsed ahead while the answer key is parsed
+
+    #shared llm gateway (one pooled http client for the whole process)
+    LLM_MAX_CONNECTIONS: int = 50
+    LLM_DEFAULT_CONCURRENCY: int = 10
+    LLM_DEFAULT_TIMEOUT: float = 60.0 #seconds
+    #per-stage limits, e.g. LLM_STAGE_CONCURRENCY='{"summary": 2}' in .env
+    LLM_STAGE_CONCURRENCY: Dict[str, int] = {
+        "parser": 4, "grader": 20, "verifier": 10, "feedback": 10, "summary": 4, "followup": 8
+    }
+    LLM_STAGE_TIMEOUTS: Dict[str, float] = {
+        "parser": 120.0, "grader": 60.0, "verifier": 60.0, "feedback": 45.0, "summary": 90.0, "followup": 45.0
+    }
+
+    #provider budgets shared by every job (token buckets), adaptive concurrency and retries
+    LLM_RPM_LIMIT: int = 500 #requests per minute
+    LLM_TPM_LIMIT: int = 200000 #tokens per minute
+    LLM_COMPLETION_TOKEN_ESTIMATE: int = 600 #expected completion size when max_tokens is not set
+    LLM_AIMD_INITIAL: int = 8 #calls in flight at start, grows on success, halves on 429/timeout
+    LLM_AIMD_MIN: int = 1
+    LLM_AIMD_MAX: int = 64
+    LLM_MAX_RETRIES: int = 4
+    LLM_RETRY_BASE_DELAY: float = 1.0 #seconds, doubled per attempt (+/- 50% jitter)
+    LLM_RETRY_MAX_DELAY: float = 30.0
+    #lower = served first when calls queue up; interactive follow-ups jump ahead of bulk grading
+    LLM_STAGE_PRIORITY: Dict[str, int] = {
+        "followup": 0, "parser": 1, "summary": 2, "feedback": 3, "grader": 4, "verifier": 4
+    }
+
+    #estimated cost in USD per 1K tokens, per model (shown on /metrics and /api/jobs/{job_id}/timings)
+    LLM_PRICING_PER_1K: Dict[str, Dict[str, float]] = {
+        "gpt-4o-mini": {"prompt": 0.00015, "completion": 0.0006}
+    }
+    METRICS_MAX_JOBS: int = 200 #jobs whose stage breakdown is kept in memory
+    EXPORT_PAGE_SIZE: int = 500 #results read from storage per page while streaming an export
+    ANALYTICS_MAX_JOBS: int = 100 #jobs whose score matrix is kept in memory (older ones are rebuilt from storage)
+
+    #hedging: a temperature=0 call slower than the stage's LLM_HEDGE_PERCENTILE latency gets a duplicate, first answer wins
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_STAGES: List[str] = ["parser", "grader", "verifier"]
+    LLM_HEDGE_PERCENTILE: float = 95.0
+    LLM_HEDGE_MIN_SAMPLES: int = 20 #no hedging until the stage has this many latency samples
+    LLM_HEDGE_MAX_FRACTION: float = 0.1 #at most this share of a stage's calls gets a duplicate
+    LLM_LATENCY_WINDOW: int = 500 #recent calls per stage kept for the percentile
+
+    #"single" = one LLM call per question, "batch" = GRADING_BATCH_SIZE questions of a student per call
+    GRADING_MODE: Literal["single", "batch"] = "single"
+    GRADING_BATCH_SIZE: int = 5
+    #grader also returns friendly_feedback, FeedbackAgent is only the fallback
+    FUSED_FEEDBACK: bool = False
+    #"eager" = feedback before partial_result, "lazy" = on first GET .../feedback (stored afterwards)
+    FEEDBACK_MODE: Literal["eager", "lazy"] = "eager"
+    FEEDBACK_PREFETCH: bool = False #lazy mode: generate missing feedback while the llm budget is idle
+    FEEDBACK_PREFETCH_POLL_INTERVAL: float = 1.0
+    #follow-up chat: newest messages verbatim within this budget, older ones folded into a rolling summary
+    FOLLOWUP_HISTORY_TOKEN_BUDGET: int = 1500
+    FOLLOWUP_MIN_RECENT_MESSAGES: int = 2 #kept verbatim even if they alone exceed the budget
+    FOLLOWUP_SUMMARY_CACHE_ITEMS: int = 1000
+
+    #summary tokens are sent as student_summary_delta events before the final student_summary
+    STREAM_SUMMARIES: bool = True
+    SUMMARY_DELTA_MIN_CHARS: int = 40 #buffered characters per delta event
+
+    #"inline" = jobs run inside the API process, "queue" = API enqueues, `python -m app.worker` processes run them
+    JOB_EXECUTION: Literal["inline", "queue"] = "inline"
+    JOB_QUEUE_DB_PATH: str = "data/job_queue.db"
+    JOB_LEASE_SECONDS: float = 60.0 #a job whose worker stops heartbeating is re-queued after this
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_POLL_INTERVAL: float = 1.0 #idle worker checks the queue this often
+    JOB_EVENT_FLUSH_INTERVAL: float = 0.2 #worker writes buffered events this often
+    JOB_EVENT_POLL_INTERVAL: float = 0.25 #api relays worker events this often
+    WORKER_PROCESSES: int = 1
+
+    #storage: "sqlite" (persistent, WAL) or "memory" (tests / dev)
+    STORAGE_BACKEND: Literal["sqlite", "memory"] = "sqlite"
+    STORAGE_DB_PATH: str = "data/exam_evaluator.db"
+    STORAGE_POOL_SIZE: int = 4
+
+    #uploads are streamed to disk in chunks
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024 #1 MiB
+    UPLOAD_MAX_BYTES: int = 25 * 1024 * 1024 #per file
+
+    #pdf text extraction: "auto" = pypdfium2, pdfplumber if a file has no text for it
+    PDF_TEXT_BACKEND: Literal["auto", "pdfium", "pdfplumber"] = "auto"
+    PDF_WORKERS: int = 0 #process pool size, 0 = one per CPU
+    ANSWER_KEY_CHUNK_CHARS: int = 12000 #longer keys are split on "Soru N:" and parsed in parallel
+    ANSWER_KEY_CHUNK_RETRIES: int = 1 #a chunk whose reply cannot be parsed is asked again this many times
+
+    #job event streams
+    EVENT_REPLAY_BUFFER_SIZE: int = 1000 #events kept per job for late joiners / reconnects
+    EVENT_SUBSCRIBER_QUEUE_SIZE: int = 500 #live backlog per client before it is dropped
+    EVENT_BUS_MAX_JOBS: int = 200 #finished jobs whose replay is kept
+
+    #parsed answer keys by pdf hash + parser prompt version (disk tier keeps them across restarts)
+    ANSWER_KEY_CACHE_ENABLED: bool = True
+    ANSWER_KEY_CACHE_MAX_ITEMS: int = 128
+    ANSWER_KEY_CACHE_DIR: Optional[str] = "data/answer_key_cache"
+    ANSWER_KEY_CACHE_MAX_DISK_MB: int = 64
+
+    #rule-based score/rubric repair before the LLM corrector
+    VERIFIER_LOCAL_REPAIR: bool = True
+
+    #content-addressed grading cache (memory LRU + optional disk tier)
+    GRADING_CACHE_ENABLED: bool = True
+    GRADING_CACHE_MAX_ITEMS: int = 5000
+    GRADING_CACHE_DIR: Optional[str] = None #e.g. "cache/grading", None = memory only
+    GRADING_CACHE_MAX_DISK_MB: int = 256
     
     model_config = SettingsConfigDict(
         env_file=".env"
     )
 
-settings = Settings()
\ No newline at end of file
+    @model_validator(mode="after")
+    def check_llm_backend(self):
+        if self.LLM_BACKEND == "openai" and not self.OPENAI_API_KEY:
+            raise ValueError("OPENAI_API_KEY is required (or set LLM_BACKEND=fake).")
+        return self
+
+settings = Settings()
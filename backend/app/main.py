@@ -1,18 +1,28 @@
 #backend/app/main.py
 
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, UploadFile, File, BackgroundTasks, HTTPException, Header, Query
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import Dict, List, Literal, Optional
 from pathlib import Path
 
 from . import schemas
-from fastapi import WebSocket
-from .services.connection_manager import manager
+from fastapi import WebSocket, WebSocketDisconnect
+from .services.event_bus import event_bus
 from .orchestrator import OrchestratorAgent
 from .services.streamer_service import Job
-from .agents.follow_up_agent import FollowUpAgent #last added
+from .agents.follow_up_agent import FollowUpAgent, ERROR_MESSAGE #last added
+from .services.llm_gateway import llm_gateway
+from .services.pdf_extract import shutdown_pdf_pool
+from .services.job_queue import SQLiteJobQueue
+from .services.metrics import metrics
+from .services.score_matrix import ScoreMatrix, score_matrices
+from .services.export import MEDIA_TYPES, export_results, needs_audit, resolve_columns
+from .config import settings
 import asyncio
+import itertools
+import json
+import sqlite3
 
 app = FastAPI(
     title="AI-Driven Exam Evaluator Agent",
@@ -32,11 +42,95 @@ app.add_middleware(
 #one orchestrator
 orchestrator = OrchestratorAgent()
 follow_up_agent = FollowUpAgent(storage_agent=orchestrator.storage_agent)
+#queue mode: jobs are run by `python -m app.worker` processes
+job_queue = SQLiteJobQueue(settings.JOB_QUEUE_DB_PATH, max_attempts=settings.JOB_MAX_ATTEMPTS) if settings.JOB_EXECUTION == "queue" else None
+_relay_task: Optional[asyncio.Task] = None
+
+async def dispatch_job(background_tasks: BackgroundTasks, job: Job, file_paths: dict):
+    if job_queue is None:
+        background_tasks.add_task(orchestrator.process_job, job.job_id, file_paths)
+        return
+    payload = {"priority": job.priority, "files": orchestrator.dump_file_paths(file_paths)}
+    await asyncio.to_thread(job_queue.enqueue, job.job_id, payload, job.priority)
+    job.status = "queued"
+
+async def restore_queued_jobs():
+    """
+    Queue mode, API (re)start: jobs still queued or running in the workers get their Job entry
+    and channel back, their events are relayed from the first row. Events of finished jobs are dropped.
+    """
+    await asyncio.to_thread(job_queue.delete_inactive_events)
+    for job_id, priority, status in await asyncio.to_thread(job_queue.active_jobs):
+        if job_id not in orchestrator.jobs:
+            job = orchestrator.create_job(priority=priority, job_id=job_id)
+            job.status = "queued" if status == "queued" else "processing"
+
+async def relay_worker_events():
+    """Queue mode: feeds the events workers wrote to the queue database into this process's event bus."""
+    last_id = 0
+    #job_id -> newest attempt relayed; a re-claimed job's rows follow the dead attempt's rows
+    attempts: Dict[str, int] = {}
+    while True:
+        try:
+            rows = await asyncio.to_thread(job_queue.events_after, last_id)
+        except sqlite3.Error as e:
+            print(f"Reading worker events failed: {e}")
+            rows = []
+        for event_id, job_id, attempt, event_json in rows:
+            last_id = event_id
+            event = schemas.StreamEvent.model_validate_json(event_json)
+            job = orchestrator.jobs.get(job_id)
+            latest = attempts.setdefault(job_id, attempt)
+            if attempt < latest:
+                continue #late flush of a worker that lost the lease
+            attempts[job_id] = attempt
+            if event.event == "job_started" and latest < attempt:
+                #the job was re-claimed after its worker died, clients already saw it start
+                if job:
+                    job.status = "processing"
+                continue
+            event_bus.publish(job_id, event) #gets this process's seq
+            if event.event == "partial_result":
+                score_matrices.add(job_id, schemas.GradingResult.model_validate(event.data))
+            if event.event == "job_started" and job:
+                job.status = "processing"
+            elif event.event in ("job_done", "error"):
+                attempts.pop(job_id, None)
+                if job:
+                    job.status = "completed" if event.event == "job_done" else "failed"
+                    #spans were recorded in the worker process, keep its breakdown for /timings
+                    job.timings = event.data.get("timings", job.timings)
+                    job.stages = event.data.get("stages", job.stages)
+                event_bus.close_job(job_id)
+                #the bus keeps the replay from here on, the job's rows are not needed anymore
+                try:
+                    await asyncio.to_thread(job_queue.delete_events, event_id, job_id)
+                except sqlite3.Error as e:
+                    print(f"Deleting relayed events of {job_id} failed: {e}")
+        if not rows:
+            await asyncio.sleep(settings.JOB_EVENT_POLL_INTERVAL)
+
+@app.on_event("startup")
+async def start_worker_event_relay():
+    global _relay_task
+    if job_queue is not None:
+        await restore_queued_jobs()
+        _relay_task = asyncio.create_task(relay_worker_events())
 
 class FollowUpQuery(schemas.BaseModel):
     query: str
 
 
+@app.on_event("shutdown")
+async def close_llm_gateway():
+    await llm_gateway.aclose()
+    if _relay_task is not None:
+        _relay_task.cancel()
+    if job_queue is not None:
+        job_queue.close()
+    await asyncio.to_thread(orchestrator.storage_agent.close)
+    shutdown_pdf_pool()
+
 @app.post("/api/followup/{job_id}/{student_id}/{question_id}", tags=["Explainability"])
 async def handle_followup_query(
     job_id: str,
@@ -45,30 +139,185 @@ async def handle_followup_query(
     request: FollowUpQuery
 ):
     try:
-        answer = await asyncio.to_thread(
-            follow_up_agent.answer_query,
-            job_id, student_id, question_id, request.query
-        )
+        answer = await follow_up_agent.answer_query(job_id, student_id, question_id, request.query)
         return {"answer": answer}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/followup/{job_id}/{student_id}/{question_id}/stream", tags=["Explainability"])
+async def stream_followup_query(
+    job_id: str,
+    student_id: str,
+    question_id: str,
+    request: FollowUpQuery
+):
+    """SSE variant of the follow-up endpoint: `data: {"delta": ...}` frames, then `event: done` with the full answer."""
+    async def event_generator():
+        parts = []
+        try:
+            async for delta in follow_up_agent.stream_answer(job_id, student_id, question_id, request.query):
+                parts.append(delta)
+                yield f"data: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            print(f"Error streaming follow-up answer: {e}")
+            yield f"event: error\ndata: {json.dumps({'message': ERROR_MESSAGE}, ensure_ascii=False)}\n\n"
+            return
+        yield f"event: done\ndata: {json.dumps({'answer': ''.join(parts).strip()}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+@app.get("/api/jobs/{job_id}/results/{student_id}/{question_id}/feedback", tags=["Explainability"])
+async def get_question_feedback(job_id: str, student_id: str, question_id: str):
+    """Student feedback of one card; in lazy mode it is generated (and stored) on the first request."""
+    feedback = await orchestrator.feedback_agent.get_or_generate_feedback(job_id, student_id, question_id)
+    if feedback is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return {"job_id": job_id, "student_id": student_id, "question_id": question_id, "friendly_feedback": feedback}
+
+@app.get("/api/jobs/{job_id}/results/{student_id}/{question_id}/audit", response_model=schemas.AuditRecord, tags=["Explainability"])
+async def get_result_audit(job_id: str, student_id: str, question_id: str):
+    """Exact prompt (rebuilt from template + values) and raw LLM response of one card, loaded only here."""
+    audit = await asyncio.to_thread(orchestrator.storage_agent.get_audit, job_id, student_id, question_id)
+    if audit is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return audit
+
 @app.get("/", tags=["Health Check"])
 async def read_root():
     return {"status": "OK", "message": "Exam Evaluator Agent is running."}
 
+@app.get("/api/llm/stats", tags=["Health Check"])
+async def read_llm_stats():
+    """
+    Scheduler counters (retries, 429s, current concurrency limit), hedged-request counts per stage,
+    cache hit/miss counts and verifier outcomes (llm_corrections_avoided = fixed by local repair alone).
+    """
+    scheduler = llm_gateway.scheduler
+    caches = [
+        orchestrator.grader_agent.cache,
+        orchestrator.parser_agent.answer_key_cache,
+        follow_up_agent.summary_cache,
+    ]
+    return {
+        "scheduler": {**scheduler.stats, "concurrency_limit": round(scheduler.limiter.limit, 2), "queued": scheduler.limiter.queued,
+                      "waiting_for_budget": scheduler.requests.queued + scheduler.tokens.queued},
+        "hedging": llm_gateway.hedge_stats,
+        #disabled caches are None; with JOB_EXECUTION=queue grading runs in the worker, its caches are counted there
+        "caches": {cache.name: cache.stats() for cache in caches if cache is not None},
+        "verifier": metrics.verifier_stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Health Check"])
+async def read_metrics():
+    """Prometheus text format: stage latency histograms, LLM tokens/cost/retries/hedges, cache hits."""
+    scheduler = llm_gateway.scheduler
+    gauges = {
+        "exam_llm_concurrency_limit": ("Current adaptive LLM concurrency limit.", round(scheduler.limiter.limit, 2)),
+        "exam_llm_in_flight": ("LLM calls in flight.", scheduler.limiter.in_flight),
+        "exam_llm_queued": ("LLM calls waiting for a slot.", scheduler.limiter.queued),
+    }
+    return PlainTextResponse(metrics.render_prometheus(gauges), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/jobs/{job_id}/timings", tags=["Jobs"])
+async def get_job_timings(job_id: str):
+    """Milestones (seconds since start) and per-stage durations, tokens, cost, cache hits and retries."""
+    job = orchestrator.jobs.get(job_id)
+    stages = metrics.job_breakdown(job_id) or (job.stages if job else {})
+    if not job and not stages:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return {
+        "job_id": job_id,
+        "status": job.status if job else None,
+        "milestones": job.timings if job else {},
+        "stages": stages
+    }
+
+@app.get("/api/jobs/{job_id}/export", tags=["Jobs"])
+async def export_job_results(
+    job_id: str,
+    format: Literal["csv", "jsonl", "xlsx"] = "csv",
+    gzip: bool = False,
+    columns: Optional[str] = None,
+    include_audit: bool = False
+):
+    """
+    Streams the job's results page by page from storage (also while the job runs: whatever is finished).
+    `columns` = comma-separated GradingResult fields; by default all except the audit ones
+    (`include_audit=true` adds them, the prompt and raw response are rebuilt from the audit store).
+    """
+    try:
+        selected = resolve_columns(columns, include_audit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    pages = orchestrator.storage_agent.iter_results(job_id, settings.EXPORT_PAGE_SIZE, with_audit=needs_audit(selected))
+    first_page = await asyncio.to_thread(next, pages, None)
+    if first_page is None and job_id not in orchestrator.jobs:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    pages = itertools.chain([first_page] if first_page else [], pages)
+
+    try:
+        body = export_results(pages, format, selected, gzip=gzip)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    filename = f"{job_id}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        body,
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+async def get_score_matrix(job_id: str) -> ScoreMatrix:
+    """Score matrix kept since the job ran, or rebuilt from storage (restart, evicted job)."""
+    matrix = score_matrices.get(job_id)
+    if matrix is None:
+        results = await asyncio.to_thread(orchestrator.storage_agent.list_results, job_id)
+        if not results:
+            raise HTTPException(status_code=404, detail=f"No results for job '{job_id}'")
+        matrix = score_matrices.load(job_id, results)
+    return matrix
+
+@app.get("/api/jobs/{job_id}/analytics", tags=["Analytics"])
+async def get_job_analytics(job_id: str):
+    """Class totals and per-question mean/median/std, difficulty and discrimination (also while the job runs)."""
+    return (await get_score_matrix(job_id)).summary()
+
+@app.get("/api/jobs/{job_id}/analytics/histogram", tags=["Analytics"])
+async def get_score_histogram(job_id: str, bins: int = Query(10, ge=1, le=100), question_id: Optional[str] = None):
+    """Distribution of total scores, or of one question's scores with ?question_id=."""
+    matrix = await get_score_matrix(job_id)
+    if question_id is not None and question_id not in matrix.questions:
+        raise HTTPException(status_code=404, detail=f"Question '{question_id}' not found in job '{job_id}'")
+    return matrix.histogram(bins=bins, question_id=question_id)
+
+@app.get("/api/jobs/{job_id}/analytics/rankings", tags=["Analytics"])
+async def get_student_rankings(
+    job_id: str,
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    order: Literal["desc", "asc"] = "desc"
+):
+    """Students by total score with rank, percent of the max and percentile."""
+    matrix = await get_score_matrix(job_id)
+    return matrix.rankings(limit=limit, offset=offset, descending=order == "desc")
+
 @app.post("/api/jobs", status_code=202, response_model=schemas.JobStatus, tags=["Jobs"])
 async def create_assessment_job(
     background_tasks: BackgroundTasks,
     answer_key: UploadFile = File(...),
-    student_sheets: List[UploadFile] = File(...)
+    student_sheets: List[UploadFile] = File(...),
+    priority: int = 0
 ):
-    job = orchestrator.create_job()
+    job = orchestrator.create_job(priority=priority)
     try:
         file_paths = await orchestrator.save_uploaded_files(job.job_id, answer_key, student_sheets)
+    except HTTPException:
+        orchestrator.discard_job(job.job_id)
+        raise
     except Exception as e:
+        orchestrator.discard_job(job.job_id)
         raise HTTPException(status_code=500, detail=f"File saving failed: {e}")
-    background_tasks.add_task(orchestrator.process_job, job.job_id, file_paths)
+    await dispatch_job(background_tasks, job, file_paths)
     return schemas.JobStatus(job_id=job.job_id, status=job.status)
 
 @app.post("/api/dev/start-sample-job", response_model=schemas.JobStatus, tags=["Development"])
@@ -79,42 +328,74 @@ async def start_sample_job(background_tasks: BackgroundTasks):
     project_root = Path(__file__).parent.parent.parent
     base_path = project_root / "test_files"
     
-    file_paths = {
-        "answer_key": base_path / "answer_key.pdf",
-        "student_sheets": [
-            base_path / "student_1.pdf", base_path / "student_2.pdf",
-            base_path / "student_3.pdf", base_path / "student_4.pdf",
-        ]
-    }
+    answer_key_path = base_path / "answer_key.pdf"
+    student_paths = [
+        base_path / "student_1.pdf", base_path / "student_2.pdf",
+        base_path / "student_3.pdf", base_path / "student_4.pdf",
+    ]
     
-    if not all(p.exists() for p in [file_paths["answer_key"]] + file_paths["student_sheets"]):
+    if not all(p.exists() for p in [answer_key_path] + student_paths):
         raise HTTPException(status_code=404, 
             detail=f"Sample PDF files not found. Searched in: '{base_path.resolve()}'")
 
-    background_tasks.add_task(orchestrator.process_job, job.job_id, file_paths)
+    file_paths = await orchestrator.register_local_files(answer_key_path, student_paths)
+
+    await dispatch_job(background_tasks, job, file_paths)
     return schemas.JobStatus(job_id=job.job_id, status=job.status)
 
 @app.get("/api/jobs/{job_id}/stream", tags=["Jobs"])
-async def stream_job_results(job_id: str):
+async def stream_job_results(
+    job_id: str,
+    last_seq: Optional[int] = None,
+    last_event_id: Optional[str] = Header(default=None)
+):
     clean_job_id = job_id.strip().replace('"', '')
     job = orchestrator.jobs.get(clean_job_id)
     if not job:
         raise HTTPException(status_code=404, detail=f"Job '{clean_job_id}' not found")
 
+    #EventSource sends Last-Event-ID by itself when it reconnects
+    since_seq = last_seq
+    if since_seq is None and last_event_id and last_event_id.isdigit():
+        since_seq = int(last_event_id)
+    try:
+        subscriber = event_bus.subscribe(clean_job_id, since_seq)
+    except KeyError:
+        #finished long ago, its events were dropped from the bus
+        raise HTTPException(status_code=404, detail=f"No events left for job '{clean_job_id}'")
+
     async def event_generator():
-        while True:
-            event = await job.results_queue.get()
-            if event is None: break
-            yield f"data: {event.model_dump_json()}\n\n"
+        try:
+            while True:
+                item = await subscriber.get()
+                if item is None: break
+                seq, event_json = item
+                yield f"id: {seq}\ndata: {event_json}\n\n"
+        finally:
+            event_bus.unsubscribe(clean_job_id, subscriber)
             
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 @app.websocket("/api/jobs/{job_id}/ws")
-async def websocket_endpoint(websocket: WebSocket, job_id: str):
-    await manager.connect(websocket, job_id)
+async def websocket_endpoint(websocket: WebSocket, job_id: str, last_seq: Optional[int] = None):
+    #same check as the SSE endpoint; closing before accept rejects the handshake
+    if job_id not in orchestrator.jobs:
+        await websocket.close(code=1008, reason=f"Job '{job_id}' not found")
+        return
+    try:
+        subscriber = event_bus.subscribe(job_id, last_seq)
+    except KeyError:
+        await websocket.close(code=1008, reason=f"No events left for job '{job_id}'")
+        return
+    #any number of tabs can follow the same job, each resumes from its own last_seq
     try:
-        #connection is open and waiting
+        await websocket.accept()
         while True:
-            await websocket.receive_text()
-    except Exception:
-        manager.disconnect(job_id)
\ No newline at end of file
+            item = await subscriber.get()
+            if item is None: break
+            await websocket.send_text(item[1])
+        await websocket.close()
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        event_bus.unsubscribe(job_id, subscriber)
\ No newline at end of file
@@ -1,15 +1,18 @@
 # backend/app/orchestrator.py
 
 import asyncio
+import hashlib
+import shutil
 import uuid
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 import aiofiles
 import traceback
 
-from fastapi import UploadFile
+from fastapi import UploadFile, HTTPException
 
 from . import schemas
+from .config import settings
 from .agents.pdf_parser_agent import PDFParserAgent
 from .agents.grader_agent import GraderAgent
 from .agents.verifier_agent import VerifierAgent
@@ -17,7 +20,10 @@ from .agents.feedback_agent import FeedbackAgent
 from .agents.summary_agent import SummaryAgent
 from .agents.storage_agent import StorageAgent
 from .services.streamer_service import Job
-from .services.connection_manager import manager #conn manager
+from .services.event_bus import event_bus
+from .services.llm_scheduler import job_priority
+from .services.metrics import metrics, current_job_id
+from .services.score_matrix import score_matrices
 
 class OrchestratorAgent:
     def __init__(self):
@@ -28,107 +34,365 @@ class OrchestratorAgent:
         #agents
         self.parser_agent = PDFParserAgent()
         self.grader_agent = GraderAgent()
+        self.storage_agent = StorageAgent()
+        score_matrices.source = self.storage_agent.iter_results
         self.verifier_agent = VerifierAgent()
-        self.feedback_agent = FeedbackAgent()
+        self.feedback_agent = FeedbackAgent(storage_agent=self.storage_agent)
         self.summary_agent = SummaryAgent()
-        self.storage_agent = StorageAgent()
 
-    def create_job(self) -> Job:
-        job_id = str(uuid.uuid4())
-        job = Job(job_id)
+    def create_job(self, priority: int = 0, job_id: Optional[str] = None) -> Job:
+        job_id = job_id or str(uuid.uuid4())
+        job = Job(job_id, priority=priority)
         self.jobs[job_id] = job
+        event_bus.open_job(job_id)
+        score_matrices.open(job_id)
         return job
 
+    def discard_job(self, job_id: str):
+        """For a job that never started (e.g. its upload was rejected): forget it and end open streams."""
+        self.jobs.pop(job_id, None)
+        event_bus.close_job(job_id)
+
+    async def _stream_upload_to_disk(self, upload: UploadFile, target_path: Path) -> schemas.StoredFile:
+        """Dosyayı sabit boyutlu parçalar halinde diske yazar, yazarken SHA-256 hesaplar ve boyut sınırını uygular."""
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(target_path, 'wb') as f:
+                while chunk := await upload.read(settings.UPLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > settings.UPLOAD_MAX_BYTES:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"'{upload.filename}' is larger than {settings.UPLOAD_MAX_BYTES} bytes."
+                        )
+                    digest.update(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            #also on cancel, when a sibling upload was rejected
+            target_path.unlink(missing_ok=True)
+            raise
+        return schemas.StoredFile(path=target_path, sha256=digest.hexdigest(), size_bytes=size)
+
     async def save_uploaded_files(self, job_id: str, answer_key: UploadFile, student_sheets: List[UploadFile]) -> Dict:
         job_dir = self.upload_dir / job_id
         job_dir.mkdir(exist_ok=True)
-        
-        paths = {"answer_key": job_dir / answer_key.filename}
-        async with aiofiles.open(paths["answer_key"], 'wb') as f:
-            await f.write(await answer_key.read())
-            
-        paths["student_sheets"] = []
-        for student_file in student_sheets:
-            student_path = job_dir / student_file.filename
-            async with aiofiles.open(student_path, 'wb') as f:
-                await f.write(await student_file.read())
-            paths["student_sheets"].append(student_path)
-        return paths
-
-    async def process_job(self, job_id: str, file_paths: Dict):
+
+        uploads = [answer_key] + list(student_sheets)
+        with metrics.span("upload_save", job_id):
+            tasks = [
+                asyncio.create_task(self._stream_upload_to_disk(upload, job_dir / name))
+                for upload, name in zip(uploads, self._upload_names(uploads))
+            ]
+            try:
+                stored = await asyncio.gather(*tasks)
+            except BaseException:
+                #one file rejected (e.g. 413): stop writing the others and drop the partial job
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                shutil.rmtree(job_dir, ignore_errors=True)
+                raise
+        return {"answer_key": stored[0], "student_sheets": list(stored[1:])}
+
+    @staticmethod
+    def _upload_names(uploads: List[UploadFile]) -> List[str]:
+        """
+        File name for each upload inside job_dir. Only the base name, a client-supplied path must
+        not escape job_dir; a repeated name gets a suffix (student_1_2.pdf), the stem is the student id.
+        """
+        names = []
+        for i, upload in enumerate(uploads):
+            name = Path(upload.filename or "").name or f"upload_{i}.pdf"
+            stem, suffix = Path(name).stem, Path(name).suffix
+            n = 2
+            while name in names:
+                name = f"{stem}_{n}{suffix}"
+                n += 1
+            names.append(name)
+        return names
+
+    def _describe_file(self, path: Path) -> schemas.StoredFile:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(settings.UPLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+        return schemas.StoredFile(path=path, sha256=digest.hexdigest(), size_bytes=path.stat().st_size)
+
+    async def register_local_files(self, answer_key: Path, student_sheets: List[Path]) -> Dict:
+        """Diskte zaten bulunan PDF'ler için save_uploaded_files ile aynı yapıyı (hash'ler dahil) üretir."""
+        stored = await asyncio.gather(*(
+            asyncio.to_thread(self._describe_file, path) for path in [answer_key] + list(student_sheets)
+        ))
+        return {"answer_key": stored[0], "student_sheets": list(stored[1:])}
+
+    @staticmethod
+    def dump_file_paths(file_paths: Dict) -> Dict:
+        """JSON form of file_paths for the job queue; absolute paths, a worker may run in another directory."""
+        def dump(stored: schemas.StoredFile) -> Dict:
+            return stored.model_copy(update={"path": stored.path.resolve()}).model_dump(mode="json")
+        return {"answer_key": dump(file_paths["answer_key"]), "student_sheets": [dump(f) for f in file_paths["student_sheets"]]}
+
+    @staticmethod
+    def load_file_paths(data: Dict) -> Dict:
+        return {
+            "answer_key": schemas.StoredFile.model_validate(data["answer_key"]),
+            "student_sheets": [schemas.StoredFile.model_validate(f) for f in data["student_sheets"]]
+        }
+
+    async def process_job(self, job_id: str, file_paths: Dict, resume: Optional[schemas.ResumeState] = None):
+        """
+        Runs the whole pipeline for one job. `resume` skips what an interrupted run
+        of the same job_id already finished: summarized students are not even parsed,
+        graded questions are reused as-is for the student's summary.
+        """
         job = self.jobs.get(job_id)
         if not job: return
+        resume = resume or schemas.ResumeState()
         
         job.status = "processing"
+        job.start_timer()
+        #inherited by every task created below, the llm scheduler orders queued calls by it
+        job_priority.set(job.priority)
+        current_job_id.set(job_id)
         
+        #student sheets do not depend on the key: parse them while the key's LLM call runs
+        parsed_sheets: asyncio.Queue = asyncio.Queue(maxsize=settings.PARSED_SHEETS_QUEUE_SIZE)
+        key_task = asyncio.create_task(self._load_answer_key(file_paths["answer_key"]))
+        student_files = [f for f in file_paths["student_sheets"] if f.path.stem not in resume.summarized]
+        parse_task = asyncio.create_task(self._parse_student_sheets(job, student_files, parsed_sheets))
+        student_tasks: List[asyncio.Task] = []
         try:
-            with open(file_paths["answer_key"], "rb") as f:
-                key_content = f.read()
-            question_objects = await asyncio.to_thread(self.parser_agent.parse_answer_key, key_content)
+            question_objects, key_from_cache = await key_task
+            job.mark("answer_key_ready")
 
             total_questions = len(question_objects)
             initial_event = schemas.StreamEvent(
                 event="job_started",
-                data={"total_questions": total_questions}
+                data={"total_questions": total_questions, "answer_key_cached": key_from_cache}
             )
-            await manager.send_event_to_job(initial_event.model_dump_json(), job_id)
-            
-            for student_path in file_paths["student_sheets"]:
-                student_id = student_path.stem
-                
-                with open(student_path, "rb") as f:
-                    student_content = f.read()
-                student_answers = await asyncio.to_thread(self.parser_agent.parse_student_answers, student_content, student_id)
-                
-                all_results_for_student = []
-                
-                for question in question_objects:
-                    student_answer = next((ans for ans in student_answers if ans.question_id == question.question_id), None)
-                    if not student_answer: continue
-
-                    raw_result = await asyncio.to_thread(self.grader_agent.grade_question, question, student_answer, job_id)
-                    verified_result = await asyncio.to_thread(self.verifier_agent.verify_grading_result, raw_result)
-                    
-                    feedback_text = await asyncio.to_thread(
-                        self.feedback_agent.generate_feedback_for_question,
-                        verified_result,
-                        student_answer.student_answer_text,
-                        question.question_text
-                    )
-                    
-                    result_data = verified_result.model_dump(mode="json")
-                    result_data['friendly_feedback'] = feedback_text
-                    
-                    event = schemas.StreamEvent(event="partial_result", data=result_data)
-                    await manager.send_event_to_job(event.model_dump_json(), job_id)
-                    
-                    all_results_for_student.append(verified_result)
-                    await asyncio.to_thread(self.storage_agent.save_result, verified_result)
-
-                if all_results_for_student:
-                    total_score = sum(res.score for res in all_results_for_student)
-                    total_max_score = sum(res.max_score for res in all_results_for_student)
-
-                    summary_text = await asyncio.to_thread(self.summary_agent.generate_summary_report, all_results_for_student)
-                    student_done_event = schemas.StreamEvent(
-                        event="student_summary",
-                        data={
-                            "student_id": student_id, 
-                            "summary_report": summary_text,
-                            "total_score": total_score,
-                            "total_max_score": total_max_score
-                        }
+            event_bus.publish(job_id, initial_event)
+
+            #bounded number of students in flight, each with a bounded number of questions
+            student_slots = asyncio.Semaphore(settings.MAX_STUDENTS_IN_FLIGHT)
+            while True:
+                parsed = await parsed_sheets.get()
+                if parsed is None: break
+                student_id, student_answers = parsed
+                #wait for a free slot before taking the next sheet off the queue
+                await student_slots.acquire()
+                student_tasks.append(asyncio.create_task(
+                    self._process_student(
+                        job_id, student_id, student_answers, question_objects, student_slots,
+                        previous_results=resume.graded.get(student_id, [])
                     )
-                    await manager.send_event_to_job(student_done_event.model_dump_json(), job_id)
+                ))
+            await parse_task #re-raises a parse failure
+            await asyncio.gather(*student_tasks)
 
             job.status = "completed"
-            job_done_event = schemas.StreamEvent(event="job_done", data={"job_id": job_id})
-            await manager.send_event_to_job(job_done_event.model_dump_json(), job_id)
+            job.mark("completed")
+            job_done_event = schemas.StreamEvent(
+                event="job_done",
+                data={"job_id": job_id, "timings": job.timings, "stages": metrics.job_breakdown(job_id)}
+            )
+            event_bus.publish(job_id, job_done_event)
+            event_bus.close_job(job_id)
         
         except Exception as e:
             job.status = "failed"
             print(f"Job {job_id} failed with error: {e}")
             traceback.print_exc()
             error_event = schemas.StreamEvent(event="error", data={"message": str(e)})
-            await manager.send_event_to_job(error_event.model_dump_json(), job_id)
-        
\ No newline at end of file
+            event_bus.publish(job_id, error_event)
+            event_bus.close_job(job_id)
+        finally:
+            for task in [key_task, parse_task] + student_tasks:
+                task.cancel()
+            #keep whatever finished before a failure
+            await asyncio.to_thread(self.storage_agent.flush)
+
+    async def _load_answer_key(self, answer_key: schemas.StoredFile):
+        with metrics.span("key_parse"):
+            return await self.parser_agent.load_answer_key(answer_key)
+
+    async def _parse_student_sheets(self, job: Job, student_files: List[schemas.StoredFile], parsed_sheets: asyncio.Queue):
+        """Producer: parses every sheet concurrently (process pool) into the bounded queue, then sends None."""
+        async def parse_one(student_file: schemas.StoredFile):
+            student_id = student_file.path.stem
+            with metrics.span("sheet_parse"):
+                student_answers = await self.parser_agent.parse_student_answers(student_file.path, student_id)
+            job.mark("first_sheet_parsed")
+            await parsed_sheets.put((student_id, student_answers))
+
+        try:
+            await asyncio.gather(*(parse_one(student_file) for student_file in student_files))
+            job.mark("all_sheets_parsed")
+        finally:
+            #always unblock the consumer, even on failure
+            await parsed_sheets.put(None)
+
+    async def _process_student(
+        self,
+        job_id: str,
+        student_id: str,
+        student_answers: List[schemas.StudentAnswerObject],
+        question_objects: List[schemas.QuestionObject],
+        student_slots: asyncio.Semaphore,
+        previous_results: Optional[List[schemas.GradingResult]] = None
+    ):
+        """Grades one student; the slot was acquired by process_job and is released here."""
+        answers_by_id = {ans.question_id: ans for ans in student_answers}
+        #results of a previous run (resume), not graded nor published again
+        previous_by_id = {res.question_id: res for res in previous_results or []}
+
+        try:
+            pairs = [
+                (question, answers_by_id[question.question_id])
+                for question in question_objects
+                if question.question_id in answers_by_id and question.question_id not in previous_by_id
+            ]
+            for result in previous_by_id.values():
+                self.storage_agent.stage_result(result)
+            question_slots = asyncio.Semaphore(settings.MAX_QUESTIONS_IN_FLIGHT)
+            if settings.GRADING_MODE == "batch":
+                #one slot per batch call instead of per question
+                batch_size = max(1, settings.GRADING_BATCH_SIZE)
+                question_tasks = [
+                    asyncio.create_task(self._process_batch(job_id, pairs[i:i + batch_size], question_slots))
+                    for i in range(0, len(pairs), batch_size)
+                ]
+            else:
+                question_tasks = [
+                    asyncio.create_task(self._process_question(job_id, question, student_answer, question_slots))
+                    for question, student_answer in pairs
+                ]
+            try:
+                #gather keeps the answer key order for the summary
+                task_results = await asyncio.gather(*question_tasks)
+            except Exception:
+                for task in question_tasks:
+                    task.cancel()
+                raise
+            if settings.GRADING_MODE == "batch":
+                new_results = [result for batch in task_results for result in batch]
+            else:
+                new_results = task_results
+            results_by_id = {**previous_by_id, **{res.question_id: res for res in new_results}}
+            all_results_for_student = [
+                results_by_id[question.question_id] for question in question_objects
+                if question.question_id in results_by_id
+            ]
+
+            #one transaction per student instead of one write per question
+            await asyncio.to_thread(self.storage_agent.flush)
+
+            if all_results_for_student:
+                total_score = sum(res.score for res in all_results_for_student)
+                total_max_score = sum(res.max_score for res in all_results_for_student)
+
+                with metrics.span("summary"):
+                    if settings.STREAM_SUMMARIES:
+                        on_delta, flush_deltas = self._summary_delta_publisher(job_id, student_id)
+                        summary_text = await self.summary_agent.generate_summary_report(all_results_for_student, on_delta=on_delta)
+                        flush_deltas()
+                    else:
+                        summary_text = await self.summary_agent.generate_summary_report(all_results_for_student)
+                student_done_event = schemas.StreamEvent(
+                    event="student_summary",
+                    data={
+                        "student_id": student_id, 
+                        "summary_report": summary_text,
+                        "total_score": total_score,
+                        "total_max_score": total_max_score
+                    }
+                )
+                event_bus.publish(job_id, student_done_event)
+        finally:
+            student_slots.release()
+
+    def _summary_delta_publisher(self, job_id: str, student_id: str):
+        """
+        Returns (on_delta, flush): summary tokens are published as student_summary_delta
+        events, a few tokens per event so the stream and replay buffer are not flooded.
+        """
+        pending: List[str] = []
+
+        def flush():
+            if pending:
+                event = schemas.StreamEvent(event="student_summary_delta", data={"student_id": student_id, "delta": "".join(pending)})
+                event_bus.publish(job_id, event)
+                pending.clear()
+
+        def on_delta(delta: str):
+            pending.append(delta)
+            if sum(len(part) for part in pending) >= settings.SUMMARY_DELTA_MIN_CHARS:
+                flush()
+
+        return on_delta, flush
+
+    async def _process_question(
+        self,
+        job_id: str,
+        question: schemas.QuestionObject,
+        student_answer: schemas.StudentAnswerObject,
+        question_slots: asyncio.Semaphore
+    ) -> schemas.GradingResult:
+        async with question_slots:
+            with metrics.span("grade"):
+                raw_result = await self.grader_agent.grade_question(question, student_answer, job_id)
+            return await self._finish_question(job_id, question, student_answer, raw_result)
+
+    async def _process_batch(
+        self,
+        job_id: str,
+        pairs: List[Tuple[schemas.QuestionObject, schemas.StudentAnswerObject]],
+        question_slots: asyncio.Semaphore
+    ) -> List[schemas.GradingResult]:
+        async with question_slots:
+            with metrics.span("grade_batch"):
+                raw_results = await self.grader_agent.grade_questions_batch(pairs, job_id)
+            return await asyncio.gather(*(
+                self._finish_question(job_id, question, student_answer, raw_result)
+                for (question, student_answer), raw_result in zip(pairs, raw_results)
+            ))
+
+    async def _finish_question(
+        self,
+        job_id: str,
+        question: schemas.QuestionObject,
+        student_answer: schemas.StudentAnswerObject,
+        raw_result: schemas.GradingResult
+    ) -> schemas.GradingResult:
+        """Verify -> feedback -> publish -> save, shared by single and batch grading."""
+        with metrics.span("verify"):
+            verified_result = await self.verifier_agent.verify_grading_result(raw_result)
+        
+        #fused mode: reuse the grader's feedback unless it is missing or the score was corrected after it
+        feedback_text = verified_result.friendly_feedback
+        if not feedback_text or not feedback_text.strip() or verified_result.verifier_status.was_corrected:
+            if settings.FEEDBACK_MODE == "lazy":
+                #generated on first request (GET .../feedback) or by the idle-time prefetch
+                feedback_text = None
+            else:
+                with metrics.span("feedback"):
+                    feedback_text = await self.feedback_agent.generate_feedback_for_question(
+                        verified_result,
+                        student_answer.student_answer_text,
+                        question.question_text
+                    )
+        verified_result.friendly_feedback = feedback_text
+        
+        #staged first so a follow-up on this card can already read it, written on the student's flush;
+        #the staged copy has its raw response moved to the audit store, events carry that compact copy
+        verified_result = self.storage_agent.stage_result(verified_result)
+        result_data = verified_result.model_dump(mode="json")
+
+        #sent as soon as this question is done, not when the student is done
+        event = schemas.StreamEvent(event="partial_result", data=result_data)
+        event_bus.publish(job_id, event)
+        score_matrices.add(job_id, verified_result)
+        self.jobs[job_id].mark("first_partial_result")
+        if feedback_text is None:
+            self.feedback_agent.schedule_prefetch(verified_result)
+        return verified_result
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import List, Dict, Any, Optional, Set
 from datetime import datetime
+from pathlib import Path
 from typing import Union
 
 #nerden geliyor, ne kadar güvenli vs..
@@ -17,10 +18,18 @@ class VerifierStatus(BaseModel):
     valid: bool
     issues: List[str] = []
     was_corrected: bool = False
-    correction_attempts: int = 0
+    correction_attempts: int = 0 #LLM corrector calls
+    repairs: List[str] = [] #rule-based fixes applied before (or instead of) the LLM corrector
     suggested_correction: Optional[Dict[str, Any]] = None
 
 
+class StoredFile(BaseModel):
+    """Diske yazılmış bir yükleme: yol, içerik hash'i ve boyut."""
+    path: Path
+    sha256: str
+    size_bytes: int
+
+
 #agents 
 class QuestionObject(BaseModel):
     """PDFParserAgent tarafından üretilen, bir sorunun yapısal temsili."""
@@ -38,6 +47,22 @@ class StudentAnswerObject(BaseModel):
     student_answer_text: str
     metadata: OCRMetadata
 
+class PromptRef(BaseModel):
+    """
+    Bir prompt'un kompakt hali: şablon + değişken değerleri. Metinler audit deposunda
+    içerik anahtarıyla (aynı metin tek kez) sıkıştırılmış tutulur.
+    """
+    template_id: str #"grader", "grader_batch"
+    version: str #content key of the template text
+    variables: Dict[str, str] #placeholder -> content key of its value
+
+    def keys(self) -> List[str]:
+        return [self.version, *self.variables.values()]
+
+    def render(self, texts: Dict[str, str]) -> str:
+        """The exact prompt sent to the LLM; `texts` maps content keys to the stored texts."""
+        return texts[self.version].format(**{name: texts[key] for name, key in self.variables.items()})
+
 class GradingResult(BaseModel):
     """
     Sistemdeki en önemli veri yapısı. Bir sorunun değerlendirme sonucunu,
@@ -54,12 +79,43 @@ class GradingResult(BaseModel):
     rubric_breakdown: Dict[str, float]
     justification: str
     advice_for_full_marks: str
-    llm_prompt: str
-    llm_raw_response: str
+    friendly_feedback: Optional[str] = None #FeedbackAgent output, or the grader's own in fused mode
+    llm_prompt: Optional[str] = None #rendered prompt; only on results stored before prompt_ref, or filled in for the audit view
+    llm_raw_response: Optional[str] = None #kept until the result is stored, then moved to raw_response_ref
+    prompt_ref: Optional[PromptRef] = None
+    raw_response_ref: Optional[str] = None #content key of the compressed raw response in the audit store
     model: str
     model_params: Dict[str, Any]
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     verifier_status: VerifierStatus
+    #template/variable texts of prompt_ref that are not in the audit store yet (not serialized)
+    _audit_texts: Dict[str, str] = PrivateAttr(default_factory=dict)
+
+    def audit_keys(self) -> List[str]:
+        """Content keys needed to rebuild the prompt and the raw response."""
+        keys = self.prompt_ref.keys() if self.prompt_ref and self.llm_prompt is None else []
+        if self.raw_response_ref and self.llm_raw_response is None:
+            keys.append(self.raw_response_ref)
+        return keys
+
+    def render_prompt(self, texts: Dict[str, str]) -> Optional[str]:
+        """Rebuilds the exact prompt from prompt_ref (`texts`: content key -> text, e.g. from StorageAgent)."""
+        if self.llm_prompt is not None or self.prompt_ref is None:
+            return self.llm_prompt
+        return self.prompt_ref.render({**texts, **self._audit_texts})
+
+class AuditRecord(BaseModel):
+    """Denetim görünümü: bir sonucun tam prompt'u ve ham LLM cevabı."""
+    job_id: str
+    student_id: str
+    question_id: str
+    model: str
+    model_params: Dict[str, Any]
+    prompt_template_id: Optional[str] = None
+    prompt_version: Optional[str] = None
+    prompt_variables: Dict[str, str] = {}
+    llm_prompt: Optional[str] = None #None if the stored texts are missing
+    llm_raw_response: Optional[str] = None
 
 class QuestionFeedback(BaseModel):
     """Tek bir soru için üretilen zenginleştirilmiş geri bildirim."""
@@ -82,6 +138,12 @@ class StreamEvent(BaseModel):
     """
     event: str #example: "partial_result", "student_done", "job_done", "error"
     data: Dict[str, Any]
+    seq: Optional[int] = None #set by the event bus, used to resume a stream
+
+class ResumeState(BaseModel):
+    """Work an earlier, interrupted run of the same job already finished (offline CLI checkpoints, re-claimed queue jobs)."""
+    graded: Dict[str, List[GradingResult]] = {} #student_id -> results that must not be graded again
+    summarized: Set[str] = set() #students whose summary was already written, skipped entirely
 
 class JobStatus(BaseModel):
     job_id: str
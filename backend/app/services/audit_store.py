@@ -0,0 +1,49 @@
+# backend/app/services/audit_store.py
+
+import hashlib
+import zlib
+from typing import Any, Dict, Tuple
+
+from .. import schemas
+
+#prompts are mostly the same template and question texts, they compress well even at a low level
+COMPRESSION_LEVEL = 6
+
+def text_key(text: str) -> str:
+    """Content key of an audit text; the same text (template, question, rubric) is stored once."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+def compress(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)
+
+def decompress(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
+
+def make_prompt_ref(template_id: str, template: str, variables: Dict[str, Any]) -> Tuple[schemas.PromptRef, Dict[str, str]]:
+    """
+    Reference to `template.format(**variables)` and the texts it points to (content key -> text).
+    Values are kept as the strings `format` inserts, so rendering gives back the same prompt.
+    """
+    texts = {text_key(template): template}
+    keys = {}
+    for name, value in variables.items():
+        value = str(value)
+        keys[name] = text_key(value)
+        texts[keys[name]] = value
+    return schemas.PromptRef(template_id=template_id, version=text_key(template), variables=keys), texts
+
+def compact(result: schemas.GradingResult) -> Tuple[schemas.GradingResult, Dict[str, str]]:
+    """
+    The result as it is stored (raw response replaced by its content key) and the
+    texts to write to the audit store with it.
+    """
+    texts = dict(result._audit_texts)
+    update = {}
+    if result.llm_raw_response is not None:
+        update = {"llm_raw_response": None, "raw_response_ref": text_key(result.llm_raw_response)}
+        texts[update["raw_response_ref"]] = result.llm_raw_response
+    if not texts:
+        return result, texts
+    stored = result.model_copy(update=update)
+    stored._audit_texts = {}
+    return stored, texts
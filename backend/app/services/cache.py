@@ -0,0 +1,134 @@
+# backend/app/services/cache.py
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from .metrics import metrics
+
+class TieredCache:
+    """
+    String-valued LRU cache: an in-memory tier plus an optional on-disk tier.
+    Disk entries are evicted oldest-access-first once the directory grows past
+    `max_disk_bytes`. Thread-safe, so it can be used from `asyncio.to_thread`.
+    """
+    def __init__(self, max_items: int, disk_dir: Optional[str] = None, max_disk_bytes: int = 0, name: Optional[str] = None):
+        self.max_items = max_items
+        self.name = name #hits and misses are reported to metrics under this name
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_bytes = max_disk_bytes
+        self._disk_bytes = 0
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_bytes = sum(p.stat().st_size for p in self.disk_dir.glob("*/*.entry"))
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.entry"
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+        if value is not None:
+            self._report_hit()
+            return value
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.disk_hits += 1
+                self._remember(key, value)
+        if value is None:
+            if self.name:
+                metrics.record_cache_miss(self.name)
+            return None
+        self._report_hit()
+        return value
+
+    def _report_hit(self):
+        if self.name:
+            metrics.record_cache_hit(self.name)
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._remember(key, value)
+        self._write_disk(key, value)
+
+    def _remember(self, key: str, value: str):
+        #caller holds the lock
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            value = path.read_text(encoding="utf-8")
+            os.utime(path) #mtime doubles as last-access time for eviction
+            return value
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key: str, value: str):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        path.parent.mkdir(exist_ok=True)
+        old_size = path.stat().st_size if path.exists() else 0
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(value, encoding="utf-8")
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._disk_bytes += path.stat().st_size - old_size
+            over_limit = self.max_disk_bytes and self._disk_bytes > self.max_disk_bytes
+        if over_limit:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        #drop least recently used files until we are back under 90% of the limit
+        entries = []
+        for path in self.disk_dir.glob("*/*.entry"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        target = self.max_disk_bytes * 0.9
+        for _, path in entries:
+            with self._lock:
+                if self._disk_bytes <= target:
+                    break
+            try:
+                size = path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            with self._lock:
+                self._disk_bytes -= size
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
@@ -0,0 +1,125 @@
+# backend/app/services/event_bus.py
+
+import asyncio
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from .. import schemas
+from ..config import settings
+from .metrics import metrics
+
+#(seq, event json); None tells the subscriber to stop
+QueueItem = Optional[Tuple[int, str]]
+
+class Subscriber:
+    """One WebSocket/SSE client. Has its own bounded queue so a slow client never blocks publishers."""
+    def __init__(self, max_queue: int):
+        self.queue: "asyncio.Queue[QueueItem]" = asyncio.Queue(maxsize=max_queue)
+        self.lagged = False
+
+    def offer(self, item: QueueItem):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            #too slow: drop its backlog and end the stream, the client resumes from its last seq
+            self.lagged = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self) -> QueueItem:
+        return await self.queue.get()
+
+class JobChannel:
+    def __init__(self, replay_size: int):
+        self.next_seq = 1
+        self.replay: Deque[Tuple[int, str]] = deque(maxlen=replay_size)
+        self.subscribers: Set[Subscriber] = set()
+        self.closed = False
+
+class EventBus:
+    """
+    Per-job fan-out of StreamEvents to any number of subscribers. Every event
+    gets a sequence number and is kept in a bounded replay buffer, so late
+    joiners and reconnecting clients can resume from `since_seq`.
+    """
+    def __init__(self):
+        self.channels: "OrderedDict[str, JobChannel]" = OrderedDict()
+        #called with (job_id, event json) for every published event, e.g. to relay them out of a worker process
+        self.listeners: List[Callable[[str, str], None]] = []
+
+    def _channel(self, job_id: str) -> JobChannel:
+        channel = self.channels.get(job_id)
+        if channel is None:
+            channel = JobChannel(settings.EVENT_REPLAY_BUFFER_SIZE)
+            self.channels[job_id] = channel
+            #forget the oldest finished jobs; running ones are skipped, not waited for
+            excess = len(self.channels) - settings.EVENT_BUS_MAX_JOBS
+            if excess > 0:
+                finished = [old_id for old_id, old in self.channels.items() if old.closed and old_id != job_id]
+                for old_id in finished[:excess]:
+                    del self.channels[old_id]
+        else:
+            self.channels.move_to_end(job_id)
+        return channel
+
+    def open_job(self, job_id: str):
+        """Creates the job's channel, so clients can subscribe before its first event."""
+        self._channel(job_id)
+
+    def publish(self, job_id: str, event: schemas.StreamEvent) -> int:
+        """Never blocks: the event is queued for every subscriber and kept for replay."""
+        with metrics.span("event_send", job_id):
+            return self._publish(job_id, event)
+
+    def _publish(self, job_id: str, event: schemas.StreamEvent) -> int:
+        channel = self._channel(job_id)
+        event.seq = channel.next_seq
+        channel.next_seq += 1
+        item = (event.seq, event.model_dump_json())
+        channel.replay.append(item)
+        for listener in self.listeners:
+            listener(job_id, item[1])
+        for subscriber in list(channel.subscribers):
+            subscriber.offer(item)
+            if subscriber.lagged:
+                channel.subscribers.discard(subscriber)
+        return event.seq
+
+    def close_job(self, job_id: str):
+        """Called after the job's last event; open streams end, replay stays available."""
+        channel = self._channel(job_id)
+        channel.closed = True
+        for subscriber in channel.subscribers:
+            subscriber.offer(None)
+        channel.subscribers.clear()
+
+    def subscribe(self, job_id: str, since_seq: Optional[int] = None, bounded: bool = True) -> Subscriber:
+        """
+        Replays buffered events with seq > since_seq (all of them if None), then follows live events.
+        bounded=False is for in-process consumers that must see every event (e.g. the CLI writer).
+        Raises KeyError for a job that was never opened (or was already forgotten).
+        """
+        channel = self.channels.get(job_id)
+        if channel is None:
+            raise KeyError(f"No event channel for job '{job_id}'")
+        self.channels.move_to_end(job_id)
+        #room for the whole replay on top of the live backlog; 0 = unbounded asyncio.Queue
+        max_queue = settings.EVENT_SUBSCRIBER_QUEUE_SIZE + len(channel.replay) + 1 if bounded else 0
+        subscriber = Subscriber(max_queue)
+        for item in channel.replay:
+            if since_seq is None or item[0] > since_seq:
+                subscriber.offer(item)
+        if channel.closed:
+            subscriber.offer(None)
+        elif not subscriber.lagged:
+            channel.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, job_id: str, subscriber: Subscriber):
+        channel = self.channels.get(job_id)
+        if channel:
+            channel.subscribers.discard(subscriber)
+
+#bus instance
+event_bus = EventBus()
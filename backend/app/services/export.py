@@ -0,0 +1,120 @@
+# backend/app/services/export.py
+
+import asyncio
+import csv
+import io
+import json
+import os
+import tempfile
+import zlib
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from .. import schemas
+
+try:
+    import openpyxl
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+except ImportError: #xlsx export is optional
+    openpyxl = None
+
+ALL_COLUMNS = list(schemas.GradingResult.model_fields)
+#full prompt and raw llm output, several KB per row; only exported when asked for
+AUDIT_COLUMNS = ["llm_prompt", "llm_raw_response", "prompt_ref", "raw_response_ref"]
+#rebuilt from the audit store (StorageAgent.with_audit) when selected
+HYDRATED_COLUMNS = {"llm_prompt", "llm_raw_response"}
+DEFAULT_COLUMNS = [column for column in ALL_COLUMNS if column not in AUDIT_COLUMNS]
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+FILE_CHUNK_SIZE = 64 * 1024
+
+def resolve_columns(columns: Optional[str], include_audit: bool = False) -> List[str]:
+    """Comma-separated column list (in that order), or every column except the audit ones."""
+    if not columns:
+        return ALL_COLUMNS if include_audit else DEFAULT_COLUMNS
+    selected = [column.strip() for column in columns.split(",") if column.strip()]
+    unknown = [column for column in selected if column not in ALL_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}. Available: {', '.join(ALL_COLUMNS)}")
+    return selected
+
+def needs_audit(columns: List[str]) -> bool:
+    return bool(HYDRATED_COLUMNS.intersection(columns))
+
+def _row(result: schemas.GradingResult, columns: List[str]) -> Dict[str, Any]:
+    data = result.model_dump(mode="json", include=set(columns))
+    return {column: data.get(column) for column in columns}
+
+def _cell(value: Any) -> Any:
+    #dicts (rubric_breakdown, verifier_status, ...) go into one cell as json
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+async def _pages(pages: Iterator[List[schemas.GradingResult]]) -> AsyncIterator[List[schemas.GradingResult]]:
+    #storage reads block, each page is fetched in a worker thread
+    while (page := await asyncio.to_thread(next, pages, None)) is not None:
+        yield page
+
+async def _csv(pages: Iterator[List[schemas.GradingResult]], columns: List[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    #BOM so Excel opens the utf-8 (Turkish) text correctly
+    yield "\ufeff".encode("utf-8") + buffer.getvalue().encode("utf-8")
+    async for page in _pages(pages):
+        buffer.seek(0)
+        buffer.truncate()
+        for result in page:
+            row = _row(result, columns)
+            writer.writerow([_cell(row[column]) for column in columns])
+        yield buffer.getvalue().encode("utf-8")
+
+async def _jsonl(pages: Iterator[List[schemas.GradingResult]], columns: List[str]) -> AsyncIterator[bytes]:
+    async for page in _pages(pages):
+        yield "".join(json.dumps(_row(result, columns), ensure_ascii=False) + "\n" for result in page).encode("utf-8")
+
+def _write_xlsx(path: str, pages: Iterator[List[schemas.GradingResult]], columns: List[str]):
+    #write-only mode keeps one row in memory at a time
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("results")
+    sheet.append(columns)
+    for page in pages:
+        for result in page:
+            row = _row(result, columns)
+            sheet.append([
+                ILLEGAL_CHARACTERS_RE.sub("", value) if isinstance(value, str) else value
+                for value in (_cell(row[column]) for column in columns)
+            ])
+    workbook.save(path)
+
+async def _xlsx(pages: Iterator[List[schemas.GradingResult]], columns: List[str]) -> AsyncIterator[bytes]:
+    #a zip container cannot be written front to back, so it is built in a temp file and streamed from there
+    handle, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(handle)
+    try:
+        await asyncio.to_thread(_write_xlsx, path, pages, columns)
+        with open(path, "rb") as f:
+            while chunk := await asyncio.to_thread(f.read, FILE_CHUNK_SIZE):
+                yield chunk
+    finally:
+        os.unlink(path)
+
+async def _gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) #wbits 31 = gzip container
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def export_results(pages: Iterator[List[schemas.GradingResult]], format: str, columns: List[str], gzip: bool = False) -> AsyncIterator[bytes]:
+    """Byte stream of the results in `format` (csv, jsonl, xlsx), optionally gzip-compressed."""
+    if format == "xlsx" and openpyxl is None:
+        raise RuntimeError("xlsx export needs the openpyxl package (pip install openpyxl).")
+    writer = {"csv": _csv, "jsonl": _jsonl, "xlsx": _xlsx}[format]
+    chunks = writer(pages, columns)
+    return _gzip(chunks) if gzip else chunks
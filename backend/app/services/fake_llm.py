@@ -0,0 +1,242 @@
+# backend/app/services/fake_llm.py
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+import openai
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from ..config import settings
+from .llm_scheduler import approx_tokens
+
+#free-text answers (feedback, summary, follow-up) are built from these
+FILLER_SENTENCES = [
+    "Cevabın konunun temel noktalarına değiniyor.",
+    "Açıklamalarını bir örnekle desteklemen cevabı güçlendirirdi.",
+    "Kavramlar arasındaki ilişkiyi daha net kurabilirsin.",
+    "Neden-sonuç bağlantılarını kurmakta başarılısın.",
+    "Bazı önemli ayrıntılar eksik kalmış.",
+    "Genel olarak konuyu doğru anladığın görülüyor.",
+]
+
+QUESTION_INSTRUCTION = re.compile(r"\w+(?:ınız|iniz|unuz|ünüz|yın|yin|ayın|eyin)\.")
+
+_fake_request = httpx.Request("POST", "https://fake-llm.local/v1/chat/completions")
+
+class FakeChatCompletions:
+    """
+    Stand-in for `AsyncOpenAI().chat.completions`. Answers are derived from the
+    prompt itself (same request -> same answer), so grader, parser and corrector
+    output is valid for the pipeline. Latency, 429/500 errors and broken scores
+    are drawn from a seeded RNG using the FAKE_LLM_* settings.
+    """
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def _latency(self, completion_tokens: int) -> float:
+        median = settings.FAKE_LLM_LATENCY_MEDIAN
+        spread = settings.FAKE_LLM_LATENCY_SIGMA
+        if settings.FAKE_LLM_LATENCY_DISTRIBUTION == "constant":
+            latency = median
+        elif settings.FAKE_LLM_LATENCY_DISTRIBUTION == "uniform":
+            latency = self.rng.uniform(median * (1 - spread), median * (1 + spread))
+        else:
+            latency = self.rng.lognormvariate(math.log(median), spread) if median > 0 else 0.0
+        if settings.FAKE_LLM_TOKENS_PER_SECOND > 0:
+            latency += completion_tokens / settings.FAKE_LLM_TOKENS_PER_SECOND
+        return max(0.0, latency)
+
+    def _inject_error(self):
+        draw = self.rng.random()
+        if draw < settings.FAKE_LLM_RATE_LIMIT_RATE:
+            response = httpx.Response(429, request=_fake_request)
+            raise openai.RateLimitError("Rate limit reached (fake llm)", response=response, body=None)
+        if draw < settings.FAKE_LLM_RATE_LIMIT_RATE + settings.FAKE_LLM_ERROR_RATE:
+            response = httpx.Response(500, request=_fake_request)
+            raise openai.InternalServerError("Internal server error (fake llm)", response=response, body=None)
+
+    async def _wait(self, latency: float, timeout: Optional[float]):
+        if timeout is not None and latency > timeout:
+            await asyncio.sleep(timeout)
+            raise openai.APITimeoutError(request=_fake_request)
+        await asyncio.sleep(latency)
+
+    async def create(self, timeout: Optional[float] = None, stream: bool = False, stream_options: Optional[Dict] = None, **request):
+        self.calls += 1
+        messages = request.get("messages", [])
+        content = self._answer(messages, json_mode=bool(request.get("response_format")))
+        usage = {
+            "prompt_tokens": sum(approx_tokens(str(m.get("content", ""))) for m in messages),
+            "completion_tokens": approx_tokens(content),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        model = request.get("model", "fake")
+
+        #errors are returned after a short delay, like a real rejected request
+        latency = self._latency(usage["completion_tokens"])
+        try:
+            self._inject_error()
+        except openai.APIStatusError:
+            await asyncio.sleep(min(latency, 0.05))
+            raise
+
+        if stream:
+            include_usage = bool(stream_options and stream_options.get("include_usage"))
+            return self._stream(content, model, usage if include_usage else None, latency, timeout)
+
+        await self._wait(latency, timeout)
+        return ChatCompletion.model_validate({
+            "id": f"fake-{self.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        })
+
+    async def _stream(self, content: str, model: str, usage: Optional[Dict], latency: float, timeout: Optional[float]) -> AsyncIterator[ChatCompletionChunk]:
+        words = content.split(" ")
+        #time to first token is a fifth of the call, the rest is spread over the words
+        await self._wait(latency / 5, timeout)
+        per_word = latency * 4 / 5 / max(1, len(words))
+
+        def chunk(choices: List[Dict], chunk_usage: Optional[Dict] = None) -> ChatCompletionChunk:
+            return ChatCompletionChunk.model_validate({
+                "id": f"fake-{self.calls}", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model, "choices": choices, "usage": chunk_usage,
+            })
+
+        for i, word in enumerate(words):
+            text = word if i == len(words) - 1 else word + " "
+            yield chunk([{"index": 0, "delta": {"content": text}, "finish_reason": None}])
+            await asyncio.sleep(per_word)
+        yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if usage is not None:
+            yield chunk([], usage)
+
+    def _answer(self, messages: List[Dict[str, Any]], json_mode: bool) -> str:
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        #deterministic per prompt: the grading cache and hedged duplicates see the same answer
+        seed = int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "big")
+        local = random.Random(seed)
+        if "<raw_text_content>" in prompt:
+            return json.dumps({"questions": self._parse_answer_key(prompt)}, ensure_ascii=False)
+        if "<flawed_json>" in prompt:
+            return json.dumps(self._correct(prompt), ensure_ascii=False)
+        if "**Questions and Student's Answers (JSON array):**" in prompt:
+            return json.dumps({"results": self._grade_batch(prompt, local)}, ensure_ascii=False)
+        if "Exam Grader AI" in prompt:
+            return json.dumps(self._grade_single(prompt, local), ensure_ascii=False)
+        if json_mode:
+            return json.dumps({"text": self._text(local, 2)}, ensure_ascii=False)
+        if "Academic Advisor" in prompt:
+            return "\n\n".join([
+                "### Genel Bakış\n" + self._text(local, 3),
+                "### Güçlü Yönler\n" + self._text(local, 2),
+                "### Geliştirilmesi Gereken Alanlar\n" + self._text(local, 2),
+            ])
+        return self._text(local, 3)
+
+    def _text(self, local: random.Random, sentences: int) -> str:
+        return " ".join(local.choice(FILLER_SENTENCES) for _ in range(sentences))
+
+    @staticmethod
+    def _between(prompt: str, start: str, end: str) -> str:
+        match = re.search(re.escape(start) + r"(.*?)" + re.escape(end), prompt, re.DOTALL)
+        return match.group(1).strip() if match else ""
+
+    def _parse_answer_key(self, prompt: str) -> List[Dict[str, str]]:
+        raw_text = self._between(prompt, "<raw_text_content>", "</raw_text_content>")
+        questions = []
+        for number, block in re.findall(r"Soru (\d+):(.*?)(?=Soru \d+:|$)", raw_text, re.DOTALL):
+            block = " ".join(block.split())
+            #question ends at the last "?" or at an instruction like "Açıklayınız.", the rest is the expected answer
+            cut = block.rfind("?") + 1
+            instruction = QUESTION_INSTRUCTION.search(block, cut)
+            if instruction and (cut == 0 or not block[cut:instruction.start()].strip()):
+                cut = instruction.end()
+            questions.append({
+                "question_id": f"Q{number}",
+                "question_text": block[:cut] or block,
+                "expected_answer": block[cut:].strip() or block,
+            })
+        return questions
+
+    def _score(self, local: random.Random, expected: str, answer: str, max_score: float, rubric: Dict[str, float]) -> Dict[str, Any]:
+        #word overlap with the key plus a little noise; empty answers get 0
+        expected_words = set(re.findall(r"\w+", expected.lower()))
+        answer_words = set(re.findall(r"\w+", answer.lower()))
+        overlap = len(expected_words & answer_words) / len(expected_words) if expected_words else 0.0
+        fraction = min(1.0, overlap * 1.5 + local.uniform(-0.1, 0.1)) if answer_words else 0.0
+        rubric = rubric or {"dogruluk_ve_detay": max_score}
+        total_weight = sum(rubric.values()) or 1.0
+        breakdown = {name: round(max(0.0, fraction) * weight * max_score / total_weight, 1) for name, weight in rubric.items()}
+        score = round(sum(breakdown.values()), 1)
+        if local.random() < settings.FAKE_LLM_SCORE_MISMATCH_RATE:
+            score = round(min(max_score, score + 1.0), 1) #verifier should catch and correct this
+        return {
+            "score": score,
+            "rubric_breakdown": breakdown,
+            "justification": self._text(local, 2),
+            "advice_for_full_marks": self._text(local, 1),
+        }
+
+    def _grade_single(self, prompt: str, local: random.Random) -> Dict[str, Any]:
+        max_score = float(self._between(prompt, "- Maximum Score:", "\n") or 10)
+        try:
+            rubric = json.loads(self._between(prompt, "- Grading Rubric (JSON format):", "\n"))
+        except json.JSONDecodeError:
+            rubric = {}
+        result = self._score(
+            local,
+            self._between(prompt, "- Expected Key Concepts in Answer:", "\n"),
+            self._between(prompt, "**Student's Answer:**\n\"\"\"", "\"\"\""),
+            max_score, rubric
+        )
+        if "friendly_feedback" in prompt:
+            result["friendly_feedback"] = self._text(local, 2)
+        return result
+
+    def _grade_batch(self, prompt: str, local: random.Random) -> List[Dict[str, Any]]:
+        try:
+            items = json.loads(self._between(prompt, "**Questions and Student's Answers (JSON array):**\n\"\"\"", "\"\"\""))
+        except json.JSONDecodeError:
+            return []
+        results = []
+        for item in items:
+            result = {"question_id": item.get("question_id")}
+            result.update(self._score(
+                local, item.get("expected_answer", ""), item.get("student_answer", ""),
+                float(item.get("max_score", 10)), item.get("rubric") or {}
+            ))
+            if "friendly_feedback" in prompt:
+                result["friendly_feedback"] = self._text(local, 2)
+            results.append(result)
+        return results
+
+    def _correct(self, prompt: str) -> Dict[str, Any]:
+        try:
+            data = json.loads(self._between(prompt, "<flawed_json>", "</flawed_json>"))
+        except json.JSONDecodeError:
+            return {}
+        breakdown = data.get("rubric_breakdown") or {}
+        if isinstance(breakdown, dict):
+            data["score"] = round(sum(v for v in breakdown.values() if isinstance(v, (int, float))), 1)
+        return data
+
+class FakeLLMClient:
+    """Minimal AsyncOpenAI look-alike for LLM_BACKEND=fake: only `chat.completions.create` and `close`."""
+    def __init__(self, seed: Optional[int] = None):
+        self.chat = SimpleNamespace(completions=FakeChatCompletions(seed))
+
+    async def close(self):
+        pass
@@ -0,0 +1,194 @@
+# backend/app/services/job_queue.py
+
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+class SQLiteJobQueue:
+    """
+    Durable job queue in a local SQLite file (WAL), shared by the API process and
+    any number of worker processes; no broker needed.
+
+    A worker claims a job with a lease and keeps it alive with heartbeats. If the
+    worker dies the lease runs out and the next claim hands the job to another
+    worker, up to `max_attempts` times. Workers also append the job's events to
+    `job_events`, tagged with the attempt that produced them; the API process polls
+    them back into its event bus and deletes a job's rows once its last event is relayed.
+    All methods are blocking, call them through `asyncio.to_thread`.
+    """
+
+    def __init__(self, db_path: str, max_attempts: int = 3):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._lock = threading.Lock()
+        self._create_schema()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _create_schema(self):
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    lease_expires REAL,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority, created_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    attempt INTEGER NOT NULL DEFAULT 1,
+                    event TEXT NOT NULL
+                )
+            """)
+            #databases created before events carried their attempt
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(job_events)")]
+            if "attempt" not in columns:
+                conn.execute("ALTER TABLE job_events ADD COLUMN attempt INTEGER NOT NULL DEFAULT 1")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id)")
+
+    def enqueue(self, job_id: str, payload: Dict[str, Any], priority: int = 0):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, payload, priority, status, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, json.dumps(payload), priority, now, now)
+            )
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Tuple[str, Dict[str, Any], int]]:
+        """Takes the next queued job (or one whose lease ran out). Returns (job_id, payload, attempt) or None."""
+        now = time.time()
+        with self._transaction() as conn:
+            #jobs that already crashed their workers too often are given up
+            expired = conn.execute(
+                "SELECT job_id, attempts FROM jobs WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                (now, self.max_attempts)
+            ).fetchall()
+            for job_id, attempts in expired:
+                message = f"Job abandoned after {self.max_attempts} attempts (worker lease expired)."
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE job_id = ?",
+                    (message, now, job_id)
+                )
+                conn.execute(
+                    "INSERT INTO job_events (job_id, attempt, event) VALUES (?, ?, ?)",
+                    (job_id, attempts, json.dumps({"event": "error", "data": {"message": message}}))
+                )
+
+            row = conn.execute("""
+                SELECT job_id, payload, attempts FROM jobs
+                WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?)
+                ORDER BY priority, created_at LIMIT 1
+            """, (now,)).fetchone()
+            if row is None:
+                return None
+            job_id, payload, attempts = row
+            conn.execute("""
+                UPDATE jobs SET status = 'running', worker_id = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ?
+                WHERE job_id = ?
+            """, (worker_id, now + lease_seconds, now, job_id))
+        return job_id, json.loads(payload), attempts + 1
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """Extends the lease; False if the job is no longer ours (lease expired and was re-claimed)."""
+        now = time.time()
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE job_id = ? AND worker_id = ? AND status = 'running'",
+                (now + lease_seconds, now, job_id, worker_id)
+            ).rowcount
+        return updated == 1
+
+    def finish(self, job_id: str, worker_id: str, status: str, error: Optional[str] = None):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_expires = NULL, updated_at = ? WHERE job_id = ? AND worker_id = ?",
+                (status, error, time.time(), job_id, worker_id)
+            )
+
+    def get_status(self, job_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def active_jobs(self) -> List[Tuple[str, int, str]]:
+        """(job_id, priority, status) of jobs still queued or running, for an API process that restarts."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT job_id, priority, status FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+
+    def append_events(self, events: List[Tuple[str, int, str]]):
+        """(job_id, attempt, StreamEvent json) triples, written in one transaction."""
+        if not events:
+            return
+        with self._transaction() as conn:
+            conn.executemany("INSERT INTO job_events (job_id, attempt, event) VALUES (?, ?, ?)", events)
+
+    def events_after(self, last_id: int, limit: int = 500) -> List[Tuple[int, str, int, str]]:
+        """(id, job_id, attempt, event json) in insertion order, for the API-side relay."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, job_id, attempt, event FROM job_events WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit)
+            ).fetchall()
+
+    def job_events(self, job_id: str) -> List[Tuple[int, str]]:
+        """(attempt, event json) of one job not yet deleted by the relay, oldest first."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT attempt, event FROM job_events WHERE job_id = ? ORDER BY id", (job_id,)
+            ).fetchall()
+
+    def delete_events(self, up_to_id: int, job_id: Optional[str] = None):
+        """
+        Drops events the relay is done with: one job's events up to `up_to_id` (after its
+        job_done/error was relayed) or, with job_id None, every event up to `up_to_id`.
+        """
+        with self._transaction() as conn:
+            if job_id is None:
+                conn.execute("DELETE FROM job_events WHERE id <= ?", (up_to_id,))
+            else:
+                conn.execute("DELETE FROM job_events WHERE job_id = ? AND id <= ?", (job_id, up_to_id))
+
+    def delete_inactive_events(self):
+        """Drops the events of every job that is no longer queued or running (API restart: no client is waiting for them)."""
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM job_events WHERE job_id NOT IN (SELECT job_id FROM jobs WHERE status IN ('queued', 'running'))"
+            )
+
+    def last_event_id(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(id) FROM job_events").fetchone()
+        return row[0] or 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
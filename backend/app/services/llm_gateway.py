@@ -0,0 +1,205 @@
+# backend/app/services/llm_gateway.py
+
+import asyncio
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional
+
+import httpx
+import openai
+
+from ..config import settings
+from .fake_llm import FakeLLMClient
+from .llm_scheduler import LLMScheduler
+from .metrics import metrics
+
+class LatencyWindow:
+    """Durations of the last `size` successful calls of one stage, for percentile lookups."""
+    def __init__(self, size: int):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self.samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None #not enough data yet, do not hedge on a guess
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+class SentClock:
+    """When the current attempt of a call went out; None while it is queued or backing off."""
+    def __init__(self):
+        self.sent_at: Optional[float] = None
+        self.event = asyncio.Event()
+
+    def sent(self, at: float):
+        self.sent_at = at
+        self.event.set()
+
+    def failed(self):
+        self.sent_at = None
+        self.event.clear()
+
+class LLMGateway:
+    """
+    Process-wide async LLM client. Every agent awaits this gateway instead of
+    owning a blocking client, so all jobs share one pooled HTTP connection pool
+    and each stage (grader, summary, ...) gets its own concurrency limit and timeout.
+    On top of that the scheduler keeps the whole process inside the provider's
+    RPM/TPM budget and retries rate-limited calls.
+    """
+    def __init__(self):
+        self._client: Optional[openai.AsyncOpenAI] = None
+        self._stage_slots: Dict[str, asyncio.Semaphore] = {}
+        self.scheduler = LLMScheduler()
+        self._latency: Dict[str, LatencyWindow] = {}
+        #stage -> {"calls": hedgeable calls, "hedged": duplicates sent, "hedge_won": duplicates that answered first}
+        self.hedge_stats: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        #created lazily so it binds to the running event loop
+        if self._client is None:
+            if settings.LLM_BACKEND == "fake":
+                self._client = FakeLLMClient(seed=settings.FAKE_LLM_SEED)
+                return self._client
+            if not settings.OPENAI_API_KEY:
+                raise ValueError("OPENAI_API_KEY environment variable not set!")
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_MAX_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(settings.LLM_DEFAULT_TIMEOUT, connect=10.0)
+            )
+            #retries are done by the scheduler, which also backs off the other calls
+            self._client = openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY, http_client=http_client, max_retries=0)
+        return self._client
+
+    def _slots_for(self, stage: str) -> asyncio.Semaphore:
+        if stage not in self._stage_slots:
+            limit = settings.LLM_STAGE_CONCURRENCY.get(stage, settings.LLM_DEFAULT_CONCURRENCY)
+            self._stage_slots[stage] = asyncio.Semaphore(limit)
+        return self._stage_slots[stage]
+
+    def _timeout_for(self, stage: str) -> float:
+        return settings.LLM_STAGE_TIMEOUTS.get(stage, settings.LLM_DEFAULT_TIMEOUT)
+
+    def _window(self, stage: str) -> LatencyWindow:
+        if stage not in self._latency:
+            self._latency[stage] = LatencyWindow(settings.LLM_LATENCY_WINDOW)
+        return self._latency[stage]
+
+    async def _timed_create(self, stage: str, request: dict, clock: Optional[SentClock] = None):
+        started = time.monotonic()
+        if clock is not None:
+            clock.sent(started)
+        try:
+            response = await self.client.chat.completions.create(timeout=self._timeout_for(stage), **request)
+        except BaseException:
+            if clock is not None:
+                clock.failed() #backing off (or given up), not in flight anymore
+            raise
+        self._window(stage).record(time.monotonic() - started)
+        metrics.record_llm_call(stage, request.get("model"), getattr(response, "usage", None))
+        return response
+
+    async def _call(self, stage: str, priority: Optional[int], request: dict, clock: Optional[SentClock] = None):
+        async with self._slots_for(stage):
+            return await self.scheduler.run(
+                stage, request, lambda: self._timed_create(stage, request, clock), priority=priority
+            )
+
+    def _hedge_delay(self, stage: str, request: dict) -> Optional[float]:
+        #only deterministic calls: a duplicate must be allowed to win without changing the result
+        if not settings.LLM_HEDGE_ENABLED or stage not in settings.LLM_HEDGE_STAGES:
+            return None
+        if request.get("temperature") != 0.0 or request.get("stream"):
+            return None
+        return self._window(stage).percentile(settings.LLM_HEDGE_PERCENTILE)
+
+    async def _hedged_call(self, stage: str, priority: Optional[int], request: dict, delay: float):
+        """
+        Sends a duplicate if the first call has been in flight for longer than `delay`; the first
+        success wins, the other is cancelled. Time spent queued (stage slot, budgets, concurrency)
+        or backing off after an error does not count, so throttling never triggers duplicates.
+        """
+        stats = self.hedge_stats.setdefault(stage, {"calls": 0, "hedged": 0, "hedge_won": 0})
+        stats["calls"] += 1
+        clock = SentClock()
+        primary = asyncio.create_task(self._call(stage, priority, request, clock))
+        tasks = [primary]
+        try:
+            while not primary.done():
+                if clock.sent_at is None:
+                    waiter = asyncio.create_task(clock.event.wait())
+                    await asyncio.wait({primary, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                    waiter.cancel()
+                    continue
+                remaining = clock.sent_at + delay - time.monotonic()
+                if remaining <= 0:
+                    break
+                await asyncio.wait({primary}, timeout=remaining)
+            #at most LLM_HEDGE_MAX_FRACTION of the stage's calls get a duplicate
+            if not primary.done() and stats["hedged"] < settings.LLM_HEDGE_MAX_FRACTION * stats["calls"]:
+                stats["hedged"] += 1
+                metrics.record_hedge(stage, won=False)
+                tasks.append(asyncio.create_task(self._call(stage, priority, request)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            stats["hedge_won"] += 1
+                            metrics.record_hedge(stage, won=True)
+                        return task.result()
+            return primary.result() #both failed, raise the first call's error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def chat(self, stage: str, priority: Optional[int] = None, **request):
+        """
+        Runs one chat completion for the given pipeline stage.
+        `request` is passed as-is to `chat.completions.create` (model, messages, ...).
+        `priority` overrides settings.LLM_STAGE_PRIORITY for this call (lower = sooner).
+        """
+        delay = self._hedge_delay(stage, request)
+        if delay is None:
+            return await self._call(stage, priority, request)
+        return await self._hedged_call(stage, priority, request, delay)
+
+    async def stream_chat(self, stage: str, priority: Optional[int] = None, **request) -> AsyncIterator[str]:
+        """
+        Streamed chat completion: yields the text deltas as they arrive. The stage slot and the
+        scheduler's concurrency slot are held until the stream ends or is closed; budgets and
+        retries apply to opening the stream.
+        """
+        async with self._slots_for(stage):
+            chunks = self.scheduler.stream(
+                stage, request,
+                lambda: self.client.chat.completions.create(
+                    timeout=self._timeout_for(stage), stream=True, stream_options={"include_usage": True}, **request
+                ),
+                priority=priority
+            )
+            try:
+                async for chunk in chunks:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                    if getattr(chunk, "usage", None):
+                        #usage comes in the last chunk, without choices
+                        metrics.record_llm_call(stage, request.get("model"), chunk.usage)
+            finally:
+                await chunks.aclose() #closing the reply early gives the slots back now, not at garbage collection
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+#gateway instance
+llm_gateway = LLMGateway()
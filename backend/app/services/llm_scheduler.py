@@ -0,0 +1,256 @@
+# backend/app/services/llm_scheduler.py
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import openai
+
+from ..config import settings
+from .metrics import metrics
+
+#priority of the job the current task works for (lower = sooner), set by the orchestrator
+job_priority: contextvars.ContextVar[int] = contextvars.ContextVar("job_priority", default=0)
+
+#errors that mean "slow down" (shrink concurrency) vs. plain transient failures
+OVERLOAD_ERRORS = (openai.RateLimitError, openai.APITimeoutError, asyncio.TimeoutError)
+TRANSIENT_ERRORS = OVERLOAD_ERRORS + (openai.APIConnectionError, openai.InternalServerError)
+
+class TokenBucket:
+    """
+    Refills `per_minute` units per minute up to one minute's worth. A balance may go negative after a refund of actual usage.
+    When the budget runs out, waiters are served by priority, then arrival order (like AIMDLimiter).
+    """
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._waiters: List[Tuple[Tuple[int, ...], int, float, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float, priority: Tuple[int, ...] = ()):
+        amount = min(amount, self.capacity) #a huge request must not wait forever
+        self._refill()
+        if not self._waiters and self.tokens >= amount:
+            self.tokens -= amount
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), amount, future))
+        self._grant()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                #granted just before the cancel, give the units back
+                self.tokens = min(self.capacity, self.tokens + amount)
+            self._grant()
+            raise
+
+    def _grant(self):
+        """Serves waiters from the head of the heap while the balance covers them, then sleeps until the head fits."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        while self._waiters:
+            _, _, amount, future = self._waiters[0]
+            if future.done(): #cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            if self.tokens < amount:
+                #the head waits even if a smaller, lower-priority request would fit
+                self._timer = asyncio.get_running_loop().call_later((amount - self.tokens) / self.rate, self._grant)
+                return
+            heapq.heappop(self._waiters)
+            self.tokens -= amount
+            future.set_result(None)
+
+    def adjust(self, delta: float):
+        """delta > 0 gives tokens back (estimate was too high), delta < 0 charges the difference."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + delta)
+        if self._waiters:
+            self._grant()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, _, future in self._waiters if not future.done())
+
+class AIMDLimiter:
+    """
+    Concurrency gate with an adaptive limit: +1 per limit-many successes
+    (additive increase), halved on 429/timeout (multiplicative decrease).
+    Waiters are served by priority, then arrival order.
+    """
+    def __init__(self, initial: int, minimum: int, maximum: int, decrease_factor: float = 0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._waiters: List[Tuple[Tuple[int, ...], int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    async def acquire(self, priority: Tuple[int, ...]):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                #the slot was handed over just before the cancel, give it back
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue #cancelled while waiting
+            self.in_flight += 1
+            future.set_result(None)
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+        self._wake()
+
+    def on_overload(self):
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+def approx_tokens(text: str) -> int:
+    """~4 characters per token, close enough for budgeting without a tokenizer."""
+    return len(text) // 4 + 1
+
+def estimate_tokens(request: Dict[str, Any]) -> int:
+    """Rough pre-call estimate for the prompt plus the expected completion."""
+    prompt_tokens = sum(approx_tokens(str(message.get("content", ""))) for message in request.get("messages", []))
+    completion = request.get("max_tokens") or settings.LLM_COMPLETION_TOKEN_ESTIMATE
+    return prompt_tokens + completion
+
+class LLMScheduler:
+    """Sits in front of every LLM call: request/token budgets, adaptive concurrency, priorities and retries."""
+    def __init__(self):
+        self.requests = TokenBucket(settings.LLM_RPM_LIMIT)
+        self.tokens = TokenBucket(settings.LLM_TPM_LIMIT)
+        self.limiter = AIMDLimiter(settings.LLM_AIMD_INITIAL, settings.LLM_AIMD_MIN, settings.LLM_AIMD_MAX)
+        self.stats: Dict[str, int] = {"calls": 0, "retries": 0, "rate_limited": 0, "timeouts": 0, "failures": 0}
+
+    def priority_for(self, stage: str, priority: Optional[int] = None) -> Tuple[int, int]:
+        stage_priority = priority if priority is not None else settings.LLM_STAGE_PRIORITY.get(stage, 5)
+        return (stage_priority, job_priority.get())
+
+    def is_idle(self) -> bool:
+        """No call is waiting (for budget or a slot) and less than half of the current concurrency limit is in use."""
+        waiting = self.limiter.queued + self.requests.queued + self.tokens.queued
+        return waiting == 0 and self.limiter.in_flight < self.limiter.limit / 2
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                seconds = float(retry_after)
+            except ValueError:
+                seconds = None
+            if seconds is not None and math.isfinite(seconds) and seconds >= 0:
+                #the provider's hint, but never longer than our own cap; jitter so waiters do not wake together
+                return min(seconds, settings.LLM_RETRY_MAX_DELAY) * random.uniform(1.0, 1.2)
+        delay = min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.5) #jitter so retries do not arrive together
+
+    async def _send(self, stage: str, request: Dict[str, Any], call: Callable[[], Awaitable[Any]], priority: Optional[int], estimate: int):
+        """Budgets, concurrency slot and retries around `call`; on success the caller owns the slot and must release it."""
+        order = self.priority_for(stage, priority)
+        attempt = 0
+        while True:
+            #budgets are granted in priority order too, so a follow-up does not queue behind bulk grading
+            await self.requests.acquire(1, order)
+            await self.tokens.acquire(estimate, order)
+            await self.limiter.acquire(order)
+            self.stats["calls"] += 1
+            try:
+                response = await call()
+            except TRANSIENT_ERRORS as e:
+                self.limiter.release()
+                if isinstance(e, openai.RateLimitError):
+                    self.stats["rate_limited"] += 1
+                elif isinstance(e, (openai.APITimeoutError, asyncio.TimeoutError)):
+                    self.stats["timeouts"] += 1
+                if isinstance(e, OVERLOAD_ERRORS):
+                    self.limiter.on_overload()
+                if attempt >= settings.LLM_MAX_RETRIES:
+                    self.stats["failures"] += 1
+                    raise
+                attempt += 1
+                self.stats["retries"] += 1
+                metrics.record_retry(stage)
+                await asyncio.sleep(self._retry_delay(attempt, e))
+                continue
+            except BaseException:
+                self.limiter.release()
+                raise
+            return response
+
+    def _settle(self, estimate: int, usage: Any):
+        #charge the actual usage instead of the pre-call estimate
+        if usage is not None and getattr(usage, "total_tokens", None):
+            self.tokens.adjust(estimate - usage.total_tokens)
+
+    async def run(self, stage: str, request: Dict[str, Any], call: Callable[[], Awaitable[Any]], priority: Optional[int] = None):
+        estimate = estimate_tokens(request)
+        response = await self._send(stage, request, call, priority, estimate)
+        self.limiter.release()
+        self.limiter.on_success()
+        self._settle(estimate, getattr(response, "usage", None))
+        return response
+
+    async def stream(self, stage: str, request: Dict[str, Any], open_stream: Callable[[], Awaitable[Any]], priority: Optional[int] = None) -> AsyncIterator[Any]:
+        """
+        Like run() for a streamed completion: opening the stream is retried, the concurrency slot
+        is held until the stream ends or is closed, and the token budget is settled from the usage
+        chunk at the end of the stream.
+        """
+        estimate = estimate_tokens(request)
+        stream = await self._send(stage, request, open_stream, priority, estimate)
+        finished = False
+        try:
+            async for chunk in stream:
+                self._settle(estimate, getattr(chunk, "usage", None))
+                yield chunk
+            finished = True
+        except OVERLOAD_ERRORS:
+            self.limiter.on_overload() #timed out mid-stream
+            raise
+        finally:
+            if not finished:
+                close = getattr(stream, "close", None) or getattr(stream, "aclose", None)
+                if close is not None:
+                    await close()
+            self.limiter.release()
+            if finished:
+                self.limiter.on_success()
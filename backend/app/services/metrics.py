@@ -0,0 +1,247 @@
+# backend/app/services/metrics.py
+
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ..config import settings
+
+#job the current task works for, set by the orchestrator; spans without an explicit job_id use it
+current_job_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_job_id", default=None)
+
+#seconds; covers a fast cache hit up to a slow parser call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+class Histogram:
+    """Fixed-bucket latency histogram (Prometheus layout: cumulative buckets, sum, count)."""
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) #last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate by linear interpolation inside the bucket that holds the q-th observation."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, bound in enumerate(self.buckets):
+            if seen + self.counts[i] >= rank:
+                fraction = (rank - seen) / self.counts[i] if self.counts[i] else 0.0
+                return min(self.max, lower + (bound - lower) * fraction)
+            seen += self.counts[i]
+            lower = bound
+        return self.max
+
+class Span:
+    """One timed stage of a job, with the LLM usage, cache hits and retries that happened inside it."""
+    __slots__ = ("stage", "job_id", "duration", "prompt_tokens", "completion_tokens", "cost_usd", "cache_hits", "retries")
+
+    def __init__(self, stage: str, job_id: Optional[str]):
+        self.stage = stage
+        self.job_id = job_id
+        self.duration = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+        self.cache_hits = 0
+        self.retries = 0
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+class StageStats:
+    """Roll-up of all spans of one stage (in one job, or process-wide)."""
+    def __init__(self):
+        self.latency = Histogram()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+        self.cache_hits = 0
+        self.retries = 0
+
+    def add(self, span: Span):
+        self.latency.observe(span.duration)
+        self.prompt_tokens += span.prompt_tokens
+        self.completion_tokens += span.completion_tokens
+        self.cost_usd += span.cost_usd
+        self.cache_hits += span.cache_hits
+        self.retries += span.retries
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.latency.count,
+            "total_seconds": round(self.latency.sum, 3),
+            "mean_seconds": round(self.latency.sum / self.latency.count, 3) if self.latency.count else 0.0,
+            "p50_seconds": round(self.latency.quantile(0.5), 3),
+            "p95_seconds": round(self.latency.quantile(0.95), 3),
+            "max_seconds": round(self.latency.max, 3),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "cache_hits": self.cache_hits,
+            "retries": self.retries,
+        }
+
+class Metrics:
+    """
+    Process-wide instrumentation. Pipeline code wraps each stage in `span()`;
+    the LLM gateway, scheduler and caches report into the innermost open span.
+    Spans roll up per stage (process-wide) and per job.
+    """
+    def __init__(self):
+        self._lock = threading.Lock() #spans also close in worker threads (asyncio.to_thread)
+        self.stages: Dict[str, StageStats] = {}
+        self.jobs: "OrderedDict[str, Dict[str, StageStats]]" = OrderedDict()
+        #llm counters by llm stage (parser, grader, ...), independent of spans
+        self.llm_tokens: Dict[Tuple[str, str], int] = {}
+        self.llm_cost: Dict[str, float] = {}
+        self.llm_calls: Dict[str, int] = {}
+        self.llm_retries: Dict[str, int] = {}
+        self.cache_hits: Dict[str, int] = {}
+        self.cache_misses: Dict[str, int] = {}
+        self.verifier: Dict[str, int] = {} #VerifierAgent outcomes: verified, invalid, local_repairs, llm_corrections, llm_corrections_avoided
+        self.hedges: Dict[Tuple[str, str], int] = {}
+
+    @contextmanager
+    def span(self, stage: str, job_id: Optional[str] = None) -> Iterator[Span]:
+        span = Span(stage, job_id or current_job_id.get())
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - started
+            _current_span.reset(token)
+            self._finish(span)
+
+    def _finish(self, span: Span):
+        with self._lock:
+            self.stages.setdefault(span.stage, StageStats()).add(span)
+            if span.job_id:
+                job = self.jobs.get(span.job_id)
+                if job is None:
+                    job = self.jobs[span.job_id] = {}
+                    while len(self.jobs) > settings.METRICS_MAX_JOBS:
+                        self.jobs.popitem(last=False)
+                job.setdefault(span.stage, StageStats()).add(span)
+
+    def record_llm_call(self, stage: str, model: Optional[str], usage: Any):
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        price = settings.LLM_PRICING_PER_1K.get(model or "", {})
+        cost = (prompt_tokens * price.get("prompt", 0.0) + completion_tokens * price.get("completion", 0.0)) / 1000
+        with self._lock:
+            self.llm_calls[stage] = self.llm_calls.get(stage, 0) + 1
+            self.llm_tokens[(stage, "prompt")] = self.llm_tokens.get((stage, "prompt"), 0) + prompt_tokens
+            self.llm_tokens[(stage, "completion")] = self.llm_tokens.get((stage, "completion"), 0) + completion_tokens
+            self.llm_cost[stage] = self.llm_cost.get(stage, 0.0) + cost
+        span = _current_span.get()
+        if span is not None:
+            span.prompt_tokens += prompt_tokens
+            span.completion_tokens += completion_tokens
+            span.cost_usd += cost
+
+    def record_retry(self, stage: str):
+        with self._lock:
+            self.llm_retries[stage] = self.llm_retries.get(stage, 0) + 1
+        span = _current_span.get()
+        if span is not None:
+            span.retries += 1
+
+    def record_hedge(self, stage: str, won: bool):
+        """Called once when a duplicate is sent ("sent") and once more if it answered first ("won")."""
+        key = (stage, "won" if won else "sent")
+        with self._lock:
+            self.hedges[key] = self.hedges.get(key, 0) + 1
+
+    def record_cache_hit(self, cache: str):
+        with self._lock:
+            self.cache_hits[cache] = self.cache_hits.get(cache, 0) + 1
+        span = _current_span.get()
+        if span is not None:
+            span.cache_hits += 1
+
+    def record_cache_miss(self, cache: str):
+        with self._lock:
+            self.cache_misses[cache] = self.cache_misses.get(cache, 0) + 1
+
+    def record_verifier(self, outcome: str):
+        with self._lock:
+            self.verifier[outcome] = self.verifier.get(outcome, 0) + 1
+
+    def verifier_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.verifier)
+
+    def job_breakdown(self, job_id: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {stage: stats.summary() for stage, stats in self.jobs.get(job_id, {}).items()}
+
+    def render_prometheus(self, gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+        """Text exposition format; `gauges` = name -> (help, value) added by the caller."""
+        lines: List[str] = []
+
+        def header(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            header("exam_stage_duration_seconds", "histogram", "Duration of pipeline stages.")
+            for stage, stats in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, count in zip(stats.latency.buckets, stats.latency.counts):
+                    cumulative += count
+                    lines.append(f'exam_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'exam_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats.latency.count}')
+                lines.append(f'exam_stage_duration_seconds_sum{{stage="{stage}"}} {stats.latency.sum:.6f}')
+                lines.append(f'exam_stage_duration_seconds_count{{stage="{stage}"}} {stats.latency.count}')
+
+            header("exam_llm_calls_total", "counter", "Successful LLM calls by llm stage.")
+            for stage, value in sorted(self.llm_calls.items()):
+                lines.append(f'exam_llm_calls_total{{stage="{stage}"}} {value}')
+            header("exam_llm_tokens_total", "counter", "LLM tokens by llm stage and kind (prompt/completion).")
+            for (stage, kind), value in sorted(self.llm_tokens.items()):
+                lines.append(f'exam_llm_tokens_total{{stage="{stage}",kind="{kind}"}} {value}')
+            header("exam_llm_cost_usd_total", "counter", "Estimated LLM cost from LLM_PRICING_PER_1K.")
+            for stage, value in sorted(self.llm_cost.items()):
+                lines.append(f'exam_llm_cost_usd_total{{stage="{stage}"}} {value:.6f}')
+            header("exam_llm_retries_total", "counter", "LLM calls retried after a transient error.")
+            for stage, value in sorted(self.llm_retries.items()):
+                lines.append(f'exam_llm_retries_total{{stage="{stage}"}} {value}')
+            header("exam_llm_hedges_total", "counter", "Hedged duplicate requests sent / won by llm stage.")
+            for (stage, outcome), value in sorted(self.hedges.items()):
+                lines.append(f'exam_llm_hedges_total{{stage="{stage}",outcome="{outcome}"}} {value}')
+            header("exam_cache_hits_total", "counter", "Cache hits by cache.")
+            for cache, value in sorted(self.cache_hits.items()):
+                lines.append(f'exam_cache_hits_total{{cache="{cache}"}} {value}')
+            header("exam_cache_misses_total", "counter", "Cache misses by cache.")
+            for cache, value in sorted(self.cache_misses.items()):
+                lines.append(f'exam_cache_misses_total{{cache="{cache}"}} {value}')
+            header("exam_verifier_results_total", "counter", "Verifier outcomes (llm_corrections_avoided = fixed by local repair alone).")
+            for outcome, value in sorted(self.verifier.items()):
+                lines.append(f'exam_verifier_results_total{{outcome="{outcome}"}} {value}')
+
+        for name, (help_text, value) in (gauges or {}).items():
+            header(name, "gauge", help_text)
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+#metrics instance
+metrics = Metrics()
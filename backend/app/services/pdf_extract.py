@@ -0,0 +1,67 @@
+# backend/app/services/pdf_extract.py
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import pdfplumber
+import pypdfium2 as pdfium
+
+#functions below run inside worker processes: keep them top-level, picklable
+#and free of app imports so a worker starts fast
+
+def _extract_pdfium(file_path: str) -> List[str]:
+    pages = []
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        for page in pdf:
+            textpage = page.get_textpage()
+            pages.append(textpage.get_text_bounded().replace("\r\n", "\n"))
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+    return pages
+
+def _extract_pdfplumber(file_path: str, layout_tolerance: bool) -> List[str]:
+    pages = []
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages:
+            if layout_tolerance:
+                page_text = page.extract_text(x_tolerance=1, y_tolerance=3)
+            else:
+                page_text = page.extract_text()
+            pages.append(page_text or "")
+    return pages
+
+def extract_pages(file_path: str, backend: str = "auto", layout_tolerance: bool = False) -> List[str]:
+    """
+    Returns the text of every page. `backend` is "pdfium" (fast, C), "pdfplumber"
+    (pure Python, better on unusual layouts) or "auto": pdfium first, pdfplumber
+    if pdfium finds no text at all.
+    """
+    if backend == "pdfplumber":
+        return _extract_pdfplumber(file_path, layout_tolerance)
+    pages = _extract_pdfium(file_path)
+    if backend == "auto" and not any(text.strip() for text in pages):
+        return _extract_pdfplumber(file_path, layout_tolerance)
+    return pages
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def get_pdf_pool(max_workers: int = 0) -> ProcessPoolExecutor:
+    """Process-wide pool; text extraction is CPU-bound, threads would serialize on the GIL."""
+    global _pool
+    if _pool is None:
+        workers = max_workers or os.cpu_count() or 1
+        #spawn: forking a process that already runs threads is unsafe
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def shutdown_pdf_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
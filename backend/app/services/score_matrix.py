@@ -0,0 +1,259 @@
+# backend/app/services/score_matrix.py
+
+import asyncio
+import warnings
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+import numpy as np
+
+from .. import schemas
+from ..config import settings
+
+#share of students in the upper / lower group for the classical discrimination index
+UPPER_LOWER_FRACTION = 0.27
+
+def _values(array: np.ndarray, digits: int = 4) -> List[Optional[float]]:
+    """JSON-safe list: NaN (no data) becomes None."""
+    return [None if np.isnan(value) else round(float(value), digits) for value in array]
+
+class ScoreMatrix:
+    """
+    Scores of one job as a students x questions float matrix (NaN = not graded yet),
+    plus one matrix per rubric item. Rows/columns are appended as results arrive;
+    the arrays grow by doubling so adding a result is O(1) amortized.
+    """
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.students: List[str] = []
+        self.questions: List[str] = []
+        self._student_index: Dict[str, int] = {}
+        self._question_index: Dict[str, int] = {}
+        self._scores = np.full((16, 8), np.nan)
+        self._max_scores = np.full(8, np.nan)
+        self._rubric: Dict[str, np.ndarray] = {}
+
+    def _index(self, key: str, index: Dict[str, int], names: List[str]) -> int:
+        if key not in index:
+            index[key] = len(names)
+            names.append(key)
+        return index[key]
+
+    def _grow(self, array: np.ndarray, rows: int, cols: int) -> np.ndarray:
+        if rows <= array.shape[0] and cols <= array.shape[1]:
+            return array
+        new_rows = array.shape[0] if rows <= array.shape[0] else max(rows, array.shape[0] * 2)
+        new_cols = array.shape[1] if cols <= array.shape[1] else max(cols, array.shape[1] * 2)
+        grown = np.full((new_rows, new_cols), np.nan)
+        grown[:array.shape[0], :array.shape[1]] = array
+        return grown
+
+    def add(self, result: schemas.GradingResult):
+        """Sets (or overwrites, e.g. after a re-grade) one student's score for one question."""
+        row = self._index(result.student_id, self._student_index, self.students)
+        col = self._index(result.question_id, self._question_index, self.questions)
+        self._scores = self._grow(self._scores, row + 1, col + 1)
+        if col >= self._max_scores.shape[0]:
+            grown = np.full(self._scores.shape[1], np.nan)
+            grown[:self._max_scores.shape[0]] = self._max_scores
+            self._max_scores = grown
+        self._scores[row, col] = result.score
+        self._max_scores[col] = result.max_score
+        for item, value in result.rubric_breakdown.items():
+            matrix = self._grow(self._rubric.get(item, np.full((1, 1), np.nan)), *self._scores.shape)
+            matrix[row, col] = value
+            self._rubric[item] = matrix
+
+    @property
+    def scores(self) -> np.ndarray:
+        return self._scores[:len(self.students), :len(self.questions)]
+
+    @property
+    def max_scores(self) -> np.ndarray:
+        return self._max_scores[:len(self.questions)]
+
+    def rubric(self, item: str) -> np.ndarray:
+        #an item missing from later results has a smaller matrix, pad it to the current shape
+        self._rubric[item] = self._grow(self._rubric[item], len(self.students), len(self.questions))
+        return self._rubric[item][:len(self.students), :len(self.questions)]
+
+    def totals(self) -> np.ndarray:
+        """Sum of each student's graded questions (ungraded ones count as 0)."""
+        return np.nansum(self.scores, axis=1)
+
+    def question_stats(self) -> List[Dict[str, Any]]:
+        """
+        Per question: answered count, mean/median/std/min/max, difficulty (mean / max score),
+        discrimination (correlation with the rest of the exam) and the upper-lower index
+        (difference of the top and bottom 27% groups' means, as a share of max score).
+        """
+        scores = self.scores
+        max_scores = self.max_scores
+        graded = ~np.isnan(scores)
+        answered = graded.sum(axis=0)
+        with warnings.catch_warnings():
+            #columns without any grade yet give NaN, reported as None
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mean = np.nanmean(scores, axis=0)
+            median = np.nanmedian(scores, axis=0)
+            std = np.nanstd(scores, axis=0)
+            minimum = np.nanmin(scores, axis=0)
+            maximum = np.nanmax(scores, axis=0)
+
+            #corrected item-total correlation, each item against the total of the other items
+            filled = np.where(graded, scores, 0.0)
+            rest = self.totals()[:, None] - filled
+            count = np.maximum(answered, 1)
+            item_dev = np.where(graded, filled - filled.sum(axis=0) / count, 0.0)
+            rest_mean = np.where(graded, rest, 0.0).sum(axis=0) / count
+            rest_dev = np.where(graded, rest - rest_mean, 0.0)
+            covariance = (item_dev * rest_dev).sum(axis=0)
+            denominator = np.sqrt((item_dev ** 2).sum(axis=0) * (rest_dev ** 2).sum(axis=0))
+            discrimination = np.where(denominator > 0, covariance / np.where(denominator > 0, denominator, 1.0), np.nan)
+
+            group = max(1, int(round(len(self.students) * UPPER_LOWER_FRACTION)))
+            order = np.argsort(self.totals(), kind="stable")
+            upper = np.nanmean(scores[order[-group:]], axis=0)
+            lower = np.nanmean(scores[order[:group]], axis=0)
+            upper_lower = (upper - lower) / max_scores
+            rubric_means = {item: np.nanmean(self.rubric(item), axis=0) for item in self._rubric}
+
+        difficulty = mean / max_scores
+        stats = []
+        for col, question_id in enumerate(self.questions):
+            stats.append({
+                "question_id": question_id,
+                "answered": int(answered[col]),
+                "max_score": None if np.isnan(max_scores[col]) else float(max_scores[col]),
+                "rubric_means": {item: _values(means[col:col + 1])[0] for item, means in rubric_means.items()},
+            })
+        for name, values in (
+            ("mean", mean), ("median", median), ("std", std), ("min", minimum), ("max", maximum),
+            ("difficulty", difficulty), ("discrimination", discrimination), ("upper_lower_index", upper_lower),
+        ):
+            for entry, value in zip(stats, _values(values)):
+                entry[name] = value
+        return stats
+
+    def summary(self) -> Dict[str, Any]:
+        totals = self.totals()
+        total_max = float(np.nansum(self.max_scores))
+        has_students = len(self.students) > 0
+        return {
+            "job_id": self.job_id,
+            "students": len(self.students),
+            "questions": len(self.questions),
+            "graded": int((~np.isnan(self.scores)).sum()),
+            "total_max_score": total_max,
+            "mean_total": round(float(totals.mean()), 4) if has_students else None,
+            "median_total": round(float(np.median(totals)), 4) if has_students else None,
+            "std_total": round(float(totals.std()), 4) if has_students else None,
+            "question_stats": self.question_stats(),
+        }
+
+    def histogram(self, bins: int = 10, question_id: Optional[str] = None) -> Dict[str, Any]:
+        """Score distribution of totals, or of one question's graded scores; bins span 0..max score."""
+        if question_id is None:
+            values = self.totals()
+            upper = float(np.nansum(self.max_scores))
+        else:
+            col = self._question_index[question_id]
+            column = self.scores[:, col]
+            values = column[~np.isnan(column)]
+            upper = float(self.max_scores[col])
+        counts, edges = np.histogram(values, bins=bins, range=(0.0, upper or 1.0))
+        return {
+            "question_id": question_id,
+            "bin_edges": [round(float(edge), 4) for edge in edges],
+            "counts": counts.tolist(),
+        }
+
+    def rankings(self, limit: Optional[int] = None, offset: int = 0, descending: bool = True) -> Dict[str, Any]:
+        """Students by total; equal totals share a rank (1, 2, 2, 4)."""
+        totals = self.totals()
+        total_max = float(np.nansum(self.max_scores))
+        ascending = np.sort(totals)
+        #rank = 1 + number of students with a strictly higher total
+        ranks = len(totals) - np.searchsorted(ascending, totals, side="right") + 1
+        percentiles = np.searchsorted(ascending, totals, side="right") / max(len(totals), 1) * 100
+        order = np.lexsort((np.arange(len(totals)), -totals if descending else totals))
+        selected = order[offset:offset + limit if limit is not None else None]
+        return {
+            "total_students": len(totals),
+            "rankings": [
+                {
+                    "rank": int(ranks[i]),
+                    "student_id": self.students[i],
+                    "total_score": round(float(totals[i]), 4),
+                    "percent": round(float(totals[i]) / total_max * 100, 2) if total_max else None,
+                    "percentile": round(float(percentiles[i]), 2),
+                    "graded_questions": int((~np.isnan(self.scores[i])).sum()),
+                }
+                for i in selected
+            ],
+        }
+
+class ScoreMatrixStore:
+    """Score matrices of the most recent jobs (ANALYTICS_MAX_JOBS), updated as partial results arrive."""
+    def __init__(self):
+        self._matrices: "OrderedDict[str, ScoreMatrix]" = OrderedDict()
+        #pages of a job's stored results (StorageAgent.iter_results), set by the orchestrator
+        self.source: Optional[Callable[[str], Iterator[List[schemas.GradingResult]]]] = None
+        #job_id -> results that arrived while the job's evicted matrix is being rebuilt
+        self._rebuilding: Dict[str, List[schemas.GradingResult]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _put(self, matrix: ScoreMatrix) -> ScoreMatrix:
+        self._matrices[matrix.job_id] = matrix
+        while len(self._matrices) > settings.ANALYTICS_MAX_JOBS:
+            self._matrices.popitem(last=False)
+        return matrix
+
+    def open(self, job_id: str) -> ScoreMatrix:
+        """Empty matrix for a new job, so its results never trigger a storage read."""
+        return self._put(ScoreMatrix(job_id))
+
+    def add(self, job_id: str, result: schemas.GradingResult):
+        """Called on the event loop for every partial result; never reads storage here."""
+        matrix = self.get(job_id)
+        if matrix is not None:
+            matrix.add(result)
+            return
+        #evicted while the job still runs: rebuilt from storage in a thread, results arriving meanwhile go on top
+        if job_id in self._rebuilding:
+            self._rebuilding[job_id].append(result)
+            return
+        self._rebuilding[job_id] = [result]
+        task = asyncio.get_running_loop().create_task(self._rebuild(job_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _stored(self, job_id: str) -> List[schemas.GradingResult]:
+        return [r for page in self.source(job_id) for r in page] if self.source else []
+
+    async def _rebuild(self, job_id: str):
+        try:
+            stored = await asyncio.to_thread(self._stored, job_id)
+        except Exception as e:
+            print(f"Rebuilding the score matrix of {job_id} failed: {e}")
+            stored = []
+        matrix = ScoreMatrix(job_id)
+        for result in stored + self._rebuilding.pop(job_id):
+            matrix.add(result)
+        self._put(matrix)
+
+    def get(self, job_id: str) -> Optional[ScoreMatrix]:
+        matrix = self._matrices.get(job_id)
+        if matrix is not None:
+            self._matrices.move_to_end(job_id)
+        return matrix
+
+    def load(self, job_id: str, results: Iterable[schemas.GradingResult]) -> ScoreMatrix:
+        """Rebuilds a job's matrix from stored results (e.g. after a restart)."""
+        matrix = ScoreMatrix(job_id)
+        for result in results:
+            matrix.add(result)
+        return self._put(matrix)
+
+#score matrix store instance
+score_matrices = ScoreMatrixStore()
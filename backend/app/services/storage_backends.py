@@ -0,0 +1,256 @@
+# backend/app/services/storage_backends.py
+
+import json
+import queue
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .. import schemas
+from .audit_store import compress, decompress
+
+class StorageBackend(ABC):
+    """StorageAgent'ın kullandığı depolama arayüzü. Tüm metodlar thread'lerden çağrılabilir."""
+
+    @abstractmethod
+    def save_results(self, results: List[schemas.GradingResult], audit_texts: Optional[Dict[str, str]] = None):
+        """Writes the results and, in the same transaction, the audit texts they point to (content key -> text)."""
+
+    @abstractmethod
+    def get_audit_texts(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Decompressed audit texts for the keys that exist."""
+
+    @abstractmethod
+    def get_result(self, job_id: str, student_id: str, question_id: str) -> Optional[schemas.GradingResult]:
+        ...
+
+    @abstractmethod
+    def list_results(self, job_id: str) -> List[schemas.GradingResult]:
+        ...
+
+    @abstractmethod
+    def list_student(self, job_id: str, student_id: str) -> List[schemas.GradingResult]:
+        ...
+
+    @abstractmethod
+    def results_page(self, job_id: str, after: int, limit: int) -> Tuple[List[schemas.GradingResult], int]:
+        """Up to `limit` results stored after cursor `after` (0 = start), in insertion order, and the next cursor."""
+
+    @abstractmethod
+    def get_chat_history(self, job_id: str, student_id: str, question_id: str) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def save_chat_history(self, job_id: str, student_id: str, question_id: str, history: List[Dict[str, Any]]):
+        ...
+
+    def close(self):
+        pass
+
+
+class InMemoryStorageBackend(StorageBackend):
+    """Nested dicts (job -> student -> question), nothing survives a restart. Meant for tests and dev."""
+
+    def __init__(self):
+        self._results: Dict[str, Dict[str, Dict[str, schemas.GradingResult]]] = {}
+        self._order: Dict[str, List[Tuple[str, str]]] = {} #job -> (student, question) in first-save order, for paging
+        self._chat_histories: Dict[tuple, List[Dict[str, Any]]] = {}
+        self._audit_texts: Dict[str, bytes] = {} #content key -> zlib-compressed text
+        self._lock = threading.Lock()
+
+    def save_results(self, results: List[schemas.GradingResult], audit_texts: Optional[Dict[str, str]] = None):
+        compressed = {key: compress(text) for key, text in (audit_texts or {}).items() if key not in self._audit_texts}
+        with self._lock:
+            self._audit_texts.update(compressed)
+            for result in results:
+                student = self._results.setdefault(result.job_id, {}).setdefault(result.student_id, {})
+                if result.question_id not in student:
+                    self._order.setdefault(result.job_id, []).append((result.student_id, result.question_id))
+                student[result.question_id] = result
+
+    def get_result(self, job_id: str, student_id: str, question_id: str) -> Optional[schemas.GradingResult]:
+        with self._lock:
+            return self._results.get(job_id, {}).get(student_id, {}).get(question_id)
+
+    def list_results(self, job_id: str) -> List[schemas.GradingResult]:
+        with self._lock:
+            return [result for student in self._results.get(job_id, {}).values() for result in student.values()]
+
+    def list_student(self, job_id: str, student_id: str) -> List[schemas.GradingResult]:
+        with self._lock:
+            return list(self._results.get(job_id, {}).get(student_id, {}).values())
+
+    def results_page(self, job_id: str, after: int, limit: int) -> Tuple[List[schemas.GradingResult], int]:
+        with self._lock:
+            keys = self._order.get(job_id, [])[after:after + limit]
+            job = self._results.get(job_id, {})
+            return [job[student_id][question_id] for student_id, question_id in keys], after + len(keys)
+
+    def get_audit_texts(self, keys: Iterable[str]) -> Dict[str, str]:
+        with self._lock:
+            found = {key: self._audit_texts[key] for key in keys if key in self._audit_texts}
+        return {key: decompress(data) for key, data in found.items()}
+
+    def get_chat_history(self, job_id: str, student_id: str, question_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            #copy, callers must go through save_chat_history to change it
+            return [dict(msg) for msg in self._chat_histories.get((job_id, student_id, question_id), [])]
+
+    def save_chat_history(self, job_id: str, student_id: str, question_id: str, history: List[Dict[str, Any]]):
+        with self._lock:
+            self._chat_histories[(job_id, student_id, question_id)] = [dict(msg) for msg in history]
+
+
+class SQLiteStorageBackend(StorageBackend):
+    """
+    SQLite in WAL mode: readers never block the writer and results survive restarts.
+    A small pool of connections is shared by the worker threads (`asyncio.to_thread`).
+    """
+
+    def __init__(self, db_path: str, pool_size: int = 4):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        for _ in range(max(1, pool_size)):
+            self._pool.put(self._open_connection())
+        self._create_schema()
+
+    def _open_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        #a connection is only ever used by one thread at a time
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _transaction(self):
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _create_schema(self):
+        with self._transaction() as conn:
+            #rowid keeps insertion order, so questions come back in grading order (Q2 before Q10)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS grading_results (
+                    job_id TEXT NOT NULL,
+                    student_id TEXT NOT NULL,
+                    question_id TEXT NOT NULL,
+                    data TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_grading_results_key
+                ON grading_results (job_id, student_id, question_id)
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_histories (
+                    job_id TEXT NOT NULL,
+                    student_id TEXT NOT NULL,
+                    question_id TEXT NOT NULL,
+                    history TEXT NOT NULL,
+                    PRIMARY KEY (job_id, student_id, question_id)
+                )
+            """)
+            #prompt templates/values and raw llm responses, shared by every result that uses them
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS audit_texts (
+                    key TEXT PRIMARY KEY,
+                    data BLOB NOT NULL
+                ) WITHOUT ROWID
+            """)
+
+    def save_results(self, results: List[schemas.GradingResult], audit_texts: Optional[Dict[str, str]] = None):
+        if not results and not audit_texts:
+            return
+        rows = [(r.job_id, r.student_id, r.question_id, r.model_dump_json()) for r in results]
+        #compressed before the write lock is taken
+        blobs = [(key, compress(text)) for key, text in (audit_texts or {}).items()]
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR IGNORE INTO audit_texts (key, data) VALUES (?, ?)", blobs)
+            conn.executemany("""
+                INSERT INTO grading_results (job_id, student_id, question_id, data) VALUES (?, ?, ?, ?)
+                ON CONFLICT (job_id, student_id, question_id) DO UPDATE SET data = excluded.data
+            """, rows)
+
+    def get_result(self, job_id: str, student_id: str, question_id: str) -> Optional[schemas.GradingResult]:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT data FROM grading_results WHERE job_id = ? AND student_id = ? AND question_id = ?",
+                (job_id, student_id, question_id)
+            ).fetchone()
+        return schemas.GradingResult.model_validate_json(row[0]) if row else None
+
+    def list_results(self, job_id: str) -> List[schemas.GradingResult]:
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT data FROM grading_results WHERE job_id = ? ORDER BY rowid", (job_id,)
+            ).fetchall()
+        return [schemas.GradingResult.model_validate_json(row[0]) for row in rows]
+
+    def list_student(self, job_id: str, student_id: str) -> List[schemas.GradingResult]:
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT data FROM grading_results WHERE job_id = ? AND student_id = ? ORDER BY rowid",
+                (job_id, student_id)
+            ).fetchall()
+        return [schemas.GradingResult.model_validate_json(row[0]) for row in rows]
+
+    def results_page(self, job_id: str, after: int, limit: int) -> Tuple[List[schemas.GradingResult], int]:
+        #keyset paging on rowid: no connection is held between pages and rows added meanwhile are not skipped
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT rowid, data FROM grading_results WHERE job_id = ? AND rowid > ? ORDER BY rowid LIMIT ?",
+                (job_id, after, limit)
+            ).fetchall()
+        if not rows:
+            return [], after
+        return [schemas.GradingResult.model_validate_json(row[1]) for row in rows], rows[-1][0]
+
+    def get_audit_texts(self, keys: Iterable[str]) -> Dict[str, str]:
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._connection() as conn:
+            #chunks stay below sqlite's bound parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                found.update(conn.execute(
+                    f"SELECT key, data FROM audit_texts WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+        return {key: decompress(data) for key, data in found.items()}
+
+    def get_chat_history(self, job_id: str, student_id: str, question_id: str) -> List[Dict[str, Any]]:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT history FROM chat_histories WHERE job_id = ? AND student_id = ? AND question_id = ?",
+                (job_id, student_id, question_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def save_chat_history(self, job_id: str, student_id: str, question_id: str, history: List[Dict[str, Any]]):
+        with self._transaction() as conn:
+            conn.execute("""
+                INSERT INTO chat_histories (job_id, student_id, question_id, history) VALUES (?, ?, ?, ?)
+                ON CONFLICT (job_id, student_id, question_id) DO UPDATE SET history = excluded.history
+            """, (job_id, student_id, question_id, json.dumps(history, ensure_ascii=False)))
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
@@ -1,7 +1,21 @@
 # backend/app/services/streamer_service.py
 import asyncio
+import time
+from typing import Dict
 
 class Job:
-    def __init__(self, job_id: str):
+    def __init__(self, job_id: str, priority: int = 0):
         self.job_id = job_id
-        self.status: str = "starting"
\ No newline at end of file
+        self.priority = priority #lower = its LLM calls are served first when the provider budget is tight
+        self.status: str = "starting"
+        self.started_at: float = time.monotonic()
+        self.timings: Dict[str, float] = {} #stage -> seconds since processing started
+        self.stages: Dict[str, dict] = {} #per-stage breakdown sent with job_done (worker-run jobs)
+
+    def start_timer(self):
+        self.started_at = time.monotonic()
+        self.timings = {}
+
+    def mark(self, name: str):
+        """Records when a stage was first reached; later calls with the same name are ignored."""
+        self.timings.setdefault(name, round(time.monotonic() - self.started_at, 3))
@@ -0,0 +1,180 @@
+# backend/app/worker.py
+"""
+Grading worker for JOB_EXECUTION=queue.
+
+    cd backend
+    python -m app.worker --processes 4
+
+The API process only saves the uploads and puts the job on the SQLite queue
+(JOB_QUEUE_DB_PATH); workers claim jobs, run OrchestratorAgent's pipeline and
+write the job's events back to the queue database, from where the API relays
+them to its WebSocket/SSE clients. Results go to the shared SQLite storage, so
+STORAGE_BACKEND must be "sqlite". Workers can be started and stopped at any
+time; a job whose worker died is picked up again once its lease runs out.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import sys
+from typing import Dict, List, Tuple
+
+from . import schemas
+from .config import settings
+from .orchestrator import OrchestratorAgent
+from .services.event_bus import event_bus
+from .services.job_queue import SQLiteJobQueue
+from .services.llm_gateway import llm_gateway
+from .services.pdf_extract import shutdown_pdf_pool
+
+class EventRelay:
+    """Collects every event published in this process and appends them to the queue database in batches."""
+    def __init__(self, queue: SQLiteJobQueue):
+        self.queue = queue
+        self.buffer: List[Tuple[str, int, str]] = []
+        self.attempts: Dict[str, int] = {} #job_id -> attempt this worker runs, stored with each event
+        self._lock = asyncio.Lock() #one write at a time keeps the events in order
+
+    def offer(self, job_id: str, event_json: str):
+        self.buffer.append((job_id, self.attempts.get(job_id, 1), event_json))
+
+    async def flush(self):
+        async with self._lock:
+            batch, self.buffer = self.buffer, []
+            if batch:
+                await asyncio.to_thread(self.queue.append_events, batch)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(settings.JOB_EVENT_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                print(f"Event relay write failed, retrying: {e}")
+
+class Worker:
+    def __init__(self, worker_id: str):
+        if settings.STORAGE_BACKEND != "sqlite":
+            raise ValueError("Queue workers need STORAGE_BACKEND=sqlite, the API reads their results from it.")
+        self.worker_id = worker_id
+        self.queue = SQLiteJobQueue(settings.JOB_QUEUE_DB_PATH, max_attempts=settings.JOB_MAX_ATTEMPTS)
+        self.orchestrator = OrchestratorAgent()
+        self.relay = EventRelay(self.queue)
+        event_bus.listeners.append(self.relay.offer)
+
+    async def run(self):
+        relay_task = asyncio.create_task(self.relay.run())
+        print(f"Worker {self.worker_id} waiting for jobs.")
+        try:
+            while True:
+                claimed = await asyncio.to_thread(self.queue.claim, self.worker_id, settings.JOB_LEASE_SECONDS)
+                if claimed is None:
+                    await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+                    continue
+                await self.run_job(*claimed)
+        finally:
+            relay_task.cancel()
+            await self.relay.flush()
+            await llm_gateway.aclose()
+            await asyncio.to_thread(self.orchestrator.storage_agent.close)
+            self.queue.close()
+            shutdown_pdf_pool()
+
+    async def _resume_state(self, job_id: str) -> schemas.ResumeState:
+        """
+        A previous worker died mid-job: reuse what it already saved instead of grading it again.
+        Students whose student_summary event it already wrote are skipped entirely, clients have it.
+        """
+        graded: Dict[str, List[schemas.GradingResult]] = {}
+        for result in await asyncio.to_thread(self.orchestrator.storage_agent.list_results, job_id):
+            graded.setdefault(result.student_id, []).append(result)
+        summarized = set()
+        for _, event_json in await asyncio.to_thread(self.queue.job_events, job_id):
+            event = schemas.StreamEvent.model_validate_json(event_json)
+            if event.event == "student_summary":
+                summarized.add(event.data["student_id"])
+        return schemas.ResumeState(graded=graded, summarized=summarized)
+
+    async def run_job(self, job_id: str, payload: Dict, attempt: int):
+        print(f"Worker {self.worker_id} took job {job_id} (attempt {attempt}).")
+        self.relay.attempts[job_id] = attempt
+        job = self.orchestrator.create_job(priority=payload.get("priority", 0), job_id=job_id)
+        file_paths = self.orchestrator.load_file_paths(payload["files"])
+        resume = await self._resume_state(job_id) if attempt > 1 else None
+
+        job_task = asyncio.create_task(self.orchestrator.process_job(job_id, file_paths, resume=resume))
+        lease_lost = False
+        try:
+            while not job_task.done():
+                await asyncio.wait({job_task}, timeout=settings.JOB_LEASE_SECONDS / 3)
+                if job_task.done():
+                    break
+                try:
+                    alive = await asyncio.to_thread(self.queue.heartbeat, job_id, self.worker_id, settings.JOB_LEASE_SECONDS)
+                except sqlite3.Error as e:
+                    print(f"Heartbeat for {job_id} failed, retrying: {e}")
+                    continue
+                if not alive:
+                    #another worker owns the job now, stop duplicating its work
+                    print(f"Worker {self.worker_id} lost the lease on job {job_id}.")
+                    lease_lost = True
+                    job_task.cancel()
+                    await asyncio.gather(job_task, return_exceptions=True)
+        finally:
+            if not job_task.done():
+                job_task.cancel()
+                await asyncio.gather(job_task, return_exceptions=True)
+            await self.relay.flush()
+            self.relay.attempts.pop(job_id, None)
+            self.orchestrator.jobs.pop(job_id, None)
+
+        if not lease_lost:
+            await asyncio.to_thread(self.queue.finish, job_id, self.worker_id, job.status)
+            print(f"Job {job_id} {job.status}.")
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+def run_worker_process(index: int = 0):
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{index}"
+    #SIGTERM (systemd, docker stop) shuts down like Ctrl+C: the current job's lease simply runs out
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        asyncio.run(Worker(worker_id).run())
+    except KeyboardInterrupt:
+        pass
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Consume grading jobs from the SQLite job queue.")
+    parser.add_argument("--processes", type=int, default=settings.WORKER_PROCESSES, help="worker processes to start")
+    args = parser.parse_args(argv)
+
+    if args.processes <= 1:
+        run_worker_process()
+        return 0
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_worker_process, args=(i,)) for i in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    def forward_stop(signum, frame):
+        #Ctrl+C reaches the children by itself, SIGTERM only hits this parent
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    signal.signal(signal.SIGTERM, forward_stop)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+    return 0
+
+#spawned worker and pdf pool processes re-import __main__
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+# backend/benchmarks/bench_pdf_extract.py
+#
+# Pages per second for the pdf text backends on test_files/.
+# Run from backend/:  python -m benchmarks.bench_pdf_extract --rounds 20
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from app.services.pdf_extract import extract_pages
+
+TEST_FILES = Path(__file__).parent.parent.parent / "test_files"
+
+def run_serial(files, backend, rounds):
+    pages = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for path in files:
+            pages += len(extract_pages(str(path), backend))
+    return pages, time.perf_counter() - start
+
+def run_pool(files, backend, rounds, workers):
+    jobs = [str(path) for _ in range(rounds) for path in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(extract_pages, jobs[:workers], [backend] * workers)) #warm up the workers
+        start = time.perf_counter()
+        pages = sum(len(result) for result in pool.map(extract_pages, jobs, [backend] * len(jobs)))
+    return pages, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pdf text extraction backends on test_files/.")
+    parser.add_argument("--rounds", type=int, default=10, help="how many times every pdf is extracted")
+    parser.add_argument("--workers", type=int, default=0, help="process pool size, 0 = cpu count")
+    args = parser.parse_args()
+
+    files = sorted(TEST_FILES.glob("*.pdf"))
+    workers = args.workers or os.cpu_count() or 1
+    print(f"{len(files)} files x {args.rounds} rounds, {workers} workers")
+    print(f"{'backend':<12}{'mode':<8}{'pages':>8}{'seconds':>10}{'pages/s':>10}")
+    for backend in ("pdfium", "pdfplumber"):
+        for mode, (pages, seconds) in (
+            ("serial", run_serial(files, backend, args.rounds)),
+            ("pool", run_pool(files, backend, args.rounds, workers)),
+        ):
+            print(f"{backend:<12}{mode:<8}{pages:>8}{seconds:>10.2f}{pages / seconds:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+# backend/benchmarks/bench_pipeline.py
+#
+# End-to-end throughput of the grading pipeline on synthetic exams, against the
+# built-in fake LLM (LLM_BACKEND=fake, no API key needed). Measures the pipeline's
+# own overhead and concurrency: jobs/min, job latency, per-stage p50/p95, peak RSS.
+# Run from backend/:
+#   python -m benchmarks.bench_pipeline --students 500 --questions 20 --jobs 2
+#   python -m benchmarks.bench_pipeline --http --students 50 --jobs 6 --concurrency 3
+# Without --http the jobs run through OrchestratorAgent.process_job in this process;
+# with --http a uvicorn server is started and jobs go through POST /api/jobs + WebSocket.
+# Other settings can be overridden with the usual environment variables.
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+def configure_environment(args) -> Dict[str, str]:
+    """Has to run before anything from app is imported, settings are read once."""
+    env = {
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_LATENCY_MEDIAN": str(args.latency),
+        "FAKE_LLM_LATENCY_DISTRIBUTION": args.distribution,
+        "FAKE_LLM_RATE_LIMIT_RATE": str(args.rate_limit_rate),
+        "FAKE_LLM_ERROR_RATE": str(args.error_rate),
+        "FAKE_LLM_SEED": str(args.seed),
+        "JOB_EXECUTION": "inline",
+    }
+    if args.grading_mode:
+        env["GRADING_MODE"] = args.grading_mode
+    os.environ.update(env)
+    #the fake provider has no budget; keep real limits with e.g. LLM_RPM_LIMIT=500
+    os.environ.setdefault("LLM_RPM_LIMIT", "1000000")
+    os.environ.setdefault("LLM_TPM_LIMIT", "1000000000")
+    os.environ.setdefault("STORAGE_BACKEND", "memory")
+    if not args.cache:
+        #every job would otherwise be served from the grading cache after the first one
+        os.environ.setdefault("GRADING_CACHE_ENABLED", "false")
+        os.environ.setdefault("ANSWER_KEY_CACHE_ENABLED", "false")
+    return env
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+def peak_rss_mb(who: int) -> float:
+    #ru_maxrss is KiB on Linux, bytes on macOS
+    value = resource.getrusage(who).ru_maxrss
+    return value / (1024 * 1024) if sys.platform == "darwin" else value / 1024
+
+async def run_direct(args, answer_key: Path, sheets: List[Path]) -> Tuple[List[float], Dict[str, Dict], Dict[str, int]]:
+    from app.orchestrator import OrchestratorAgent
+    from app.services.llm_gateway import llm_gateway
+    from app.services.metrics import metrics
+    from app.services.pdf_extract import shutdown_pdf_pool
+
+    orchestrator = OrchestratorAgent()
+    gate = asyncio.Semaphore(args.concurrency)
+    durations: List[float] = []
+
+    async def one_job():
+        async with gate:
+            job = orchestrator.create_job()
+            file_paths = await orchestrator.register_local_files(answer_key, sheets)
+            started = time.perf_counter()
+            await orchestrator.process_job(job.job_id, file_paths)
+            durations.append(time.perf_counter() - started)
+            if job.status != "completed":
+                print(f"job {job.job_id} {job.status}", file=sys.stderr)
+            orchestrator.jobs.pop(job.job_id, None)
+
+    try:
+        await asyncio.gather(*(one_job() for _ in range(args.jobs)))
+    finally:
+        await llm_gateway.aclose()
+        await asyncio.to_thread(orchestrator.storage_agent.close)
+        shutdown_pdf_pool()
+    stages = {stage: stats.summary() for stage, stats in metrics.stages.items()}
+    return durations, stages, dict(llm_gateway.scheduler.stats)
+
+def stages_from_prometheus(text: str) -> Dict[str, Dict]:
+    """Rebuilds the stage histograms from /metrics to estimate p50/p95 on the client side."""
+    from app.services.metrics import Histogram
+
+    cumulative: Dict[str, List[int]] = {}
+    sums: Dict[str, float] = {}
+    for line in text.splitlines():
+        match = re.match(r'exam_stage_duration_seconds_bucket\{stage="([^"]+)",le="([^"]+)"\} (\d+)', line)
+        if match:
+            cumulative.setdefault(match.group(1), []).append(int(match.group(3)))
+        match = re.match(r'exam_stage_duration_seconds_sum\{stage="([^"]+)"\} ([\d.]+)', line)
+        if match:
+            sums[match.group(1)] = float(match.group(2))
+
+    stages = {}
+    for stage, counts in cumulative.items():
+        histogram = Histogram()
+        histogram.counts = [count - previous for count, previous in zip(counts, [0] + counts[:-1])]
+        histogram.count = counts[-1]
+        histogram.sum = sums.get(stage, 0.0)
+        non_empty = [i for i, count in enumerate(histogram.counts) if count]
+        last = non_empty[-1] if non_empty else 0
+        histogram.max = histogram.buckets[last] if last < len(histogram.buckets) else float("inf")
+        stages[stage] = {
+            "count": histogram.count,
+            "p50_seconds": round(histogram.quantile(0.5), 3),
+            "p95_seconds": round(histogram.quantile(0.95), 3),
+            "total_seconds": round(histogram.sum, 3),
+        }
+    return stages
+
+async def run_http(args, answer_key: Path, sheets: List[Path], workdir: Path) -> Tuple[List[float], Dict[str, Dict], Dict[str, int]]:
+    import httpx
+    import websockets
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR))
+    #run in the work dir: uploads and data/ stay out of the repo
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL if not args.verbose else None
+    )
+    gate = asyncio.Semaphore(args.concurrency)
+    durations: List[float] = []
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+            for _ in range(100):
+                with contextlib.suppress(httpx.TransportError):
+                    if (await client.get("/")).status_code == 200:
+                        break
+                if server.poll() is not None:
+                    raise RuntimeError("Server exited during startup.")
+                await asyncio.sleep(0.2)
+
+            async def one_job():
+                async with gate:
+                    started = time.perf_counter()
+                    files = [("answer_key", (answer_key.name, answer_key.read_bytes(), "application/pdf"))]
+                    files += [("student_sheets", (sheet.name, sheet.read_bytes(), "application/pdf")) for sheet in sheets]
+                    response = await client.post("/api/jobs", files=files)
+                    response.raise_for_status()
+                    job_id = response.json()["job_id"]
+                    async with websockets.connect(f"ws://127.0.0.1:{args.port}/api/jobs/{job_id}/ws", max_size=None) as ws:
+                        async for message in ws:
+                            event = json.loads(message)
+                            if event["event"] in ("job_done", "error"):
+                                if event["event"] == "error":
+                                    print(f"job {job_id} failed: {event['data']}", file=sys.stderr)
+                                break
+                    durations.append(time.perf_counter() - started)
+
+            await asyncio.gather(*(one_job() for _ in range(args.jobs)))
+            stages = stages_from_prometheus((await client.get("/metrics")).text)
+            llm_stats = (await client.get("/api/llm/stats")).json().get("scheduler", {})
+    finally:
+        server.terminate()
+        server.wait()
+    return durations, stages, llm_stats
+
+def report(args, durations: List[float], wall: float, stages: Dict[str, Dict], llm_stats: Dict[str, int]):
+    questions = args.jobs * args.students * args.questions
+    print()
+    print(f"{args.jobs} jobs x {args.students} students x {args.questions} questions, "
+          f"{args.concurrency} job(s) at a time, {'http' if args.http else 'in-process'}, "
+          f"fake llm {args.distribution} median {args.latency}s")
+    print(f"{'jobs/min':<24}{args.jobs / wall * 60:>10.2f}")
+    print(f"{'questions/s':<24}{questions / wall:>10.1f}")
+    print(f"{'job seconds p50':<24}{percentile(durations, 50):>10.2f}")
+    print(f"{'job seconds p95':<24}{percentile(durations, 95):>10.2f}")
+    if llm_stats:
+        print("llm: " + ", ".join(f"{name} {value}" for name, value in llm_stats.items()))
+    print()
+    print(f"{'stage':<14}{'count':>8}{'p50 s':>10}{'p95 s':>10}{'total s':>12}")
+    for stage, summary in sorted(stages.items(), key=lambda item: -item[1]["total_seconds"]):
+        print(f"{stage:<14}{summary['count']:>8}{summary['p50_seconds']:>10.3f}{summary['p95_seconds']:>10.3f}{summary['total_seconds']:>12.1f}")
+    print()
+    print(f"peak RSS: this process {peak_rss_mb(resource.RUSAGE_SELF):.0f} MB, "
+          f"largest child (pdf pool / server) {peak_rss_mb(resource.RUSAGE_CHILDREN):.0f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline throughput on synthetic exams with the fake LLM backend.")
+    parser.add_argument("--students", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--jobs", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1, help="jobs in flight at the same time")
+    parser.add_argument("--latency", type=float, default=0.5, help="median fake llm latency (seconds)")
+    parser.add_argument("--distribution", choices=["constant", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of llm calls answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of llm calls answered with 500")
+    parser.add_argument("--grading-mode", choices=["single", "batch"])
+    parser.add_argument("--cache", action="store_true", help="keep the grading / answer key caches on")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--http", action="store_true", help="go through a uvicorn server, POST /api/jobs + WebSocket")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workdir", help="where the exam pdfs are written (default: temp dir, removed afterwards)")
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's own output")
+    args = parser.parse_args()
+
+    configure_environment(args)
+    from benchmarks.synthetic_exam import build_exam
+
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="exam-bench-"))
+    try:
+        started = time.perf_counter()
+        answer_key, sheets = build_exam(workdir / "exam", args.students, args.questions, args.seed)
+        print(f"synthetic exam written in {time.perf_counter() - started:.1f}s: {workdir / 'exam'}")
+
+        started = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            if not args.verbose:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+            if args.http:
+                durations, stages, llm_stats = asyncio.run(run_http(args, answer_key, sheets, workdir))
+            else:
+                durations, stages, llm_stats = asyncio.run(run_direct(args, answer_key, sheets))
+        report(args, durations, time.perf_counter() - started, stages, llm_stats)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+#the pdf process pool spawns workers that re-import __main__
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# backend/benchmarks/synthetic_exam.py
+#
+# Builds exams of any size from the questions and answers in test_files/:
+# an answer key with N questions and one sheet per student, as text PDFs.
+# Used by bench_pipeline; run alone to just write the files:
+#   python -m benchmarks.synthetic_exam /tmp/exam --students 500 --questions 20
+
+import argparse
+import random
+import re
+import textwrap
+from pathlib import Path
+from typing import List, Tuple
+
+from app.services.pdf_extract import extract_pages
+
+TEST_FILES = Path(__file__).parent.parent.parent / "test_files"
+
+#Helvetica/WinAnsi has no ş, ğ, ı, İ; the rest of the Turkish letters are kept
+FOLD = str.maketrans({"ş": "s", "Ş": "S", "ğ": "g", "Ğ": "G", "ı": "i", "İ": "I"})
+
+def write_pdf(path: Path, lines: List[str], lines_per_page: int = 60):
+    """Minimal text-only PDF (Helvetica 10pt, A4), enough for both pdf text backends."""
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for page_lines in pages:
+        text = b"".join(
+            b"(" + line.translate(FOLD).encode("cp1252", errors="ignore").replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b") Tj T* "
+            for line in page_lines
+        )
+        stream = b"BT /F1 10 Tf 13 TL 50 800 Td " + text + b"ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects)))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % kid for kid in kids) + b"] /Count %d >>" % len(kids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+
+def _text(path: Path) -> str:
+    return "".join(page + "\n" for page in extract_pages(str(path), "pdfium"))
+
+def _blocks(text: str) -> List[str]:
+    return [" ".join(block.split()) for block in re.split(r"Soru \d+:", text)[1:]]
+
+def load_sources() -> Tuple[List[str], List[List[str]]]:
+    """(answer key blocks, per source student: answers) from test_files/."""
+    key_blocks = _blocks(_text(TEST_FILES / "answer_key.pdf"))
+    student_answers = []
+    for path in sorted(TEST_FILES.glob("student_*.pdf")):
+        answers = []
+        for block in _blocks(_text(path)):
+            match = re.search(r"Cevap:(.*)", block, re.IGNORECASE)
+            answers.append(match.group(1).strip() if match else "")
+        student_answers.append(answers)
+    return key_blocks, student_answers
+
+def _wrap(text: str) -> List[str]:
+    return textwrap.wrap(text, width=95) or [""]
+
+def build_exam(out_dir: Path, students: int, questions: int, seed: int = 0) -> Tuple[Path, List[Path]]:
+    """
+    Question N of the key is source question (N-1) % 6. A student's answer to it is
+    a randomly picked source student's answer, cut at a random length (now and then
+    left empty), so scores and grading cache keys differ between students.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    key_blocks, source_answers = load_sources()
+    rng = random.Random(seed)
+
+    key_lines = ["CEVAP ANAHTARI"]
+    question_texts = []
+    for number in range(1, questions + 1):
+        block = key_blocks[(number - 1) % len(key_blocks)]
+        key_lines += _wrap(f"Soru {number}: {block}")
+        question_texts.append(block[:block.find("?") + 1] or block[:200])
+    answer_key = out_dir / "answer_key.pdf"
+    write_pdf(answer_key, key_lines)
+
+    sheets = []
+    for index in range(1, students + 1):
+        lines = [f"Adi Soyadi: Ogrenci {index}"]
+        for number in range(1, questions + 1):
+            source = rng.choice(source_answers)
+            answer = source[(number - 1) % len(source)] if source else ""
+            words = answer.split()
+            if rng.random() < 0.05:
+                words = []
+            else:
+                words = words[:max(1, int(len(words) * rng.uniform(0.3, 1.0)))]
+            lines += _wrap(f"Soru {number}: {question_texts[number - 1]}")
+            lines += _wrap("Cevap: " + " ".join(words))
+        sheet = out_dir / f"student_{index}.pdf"
+        write_pdf(sheet, lines)
+        sheets.append(sheet)
+    return answer_key, sheets
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic exam built from test_files/.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--students", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    answer_key, sheets = build_exam(Path(args.out_dir), args.students, args.questions, args.seed)
+    print(f"{answer_key} + {len(sheets)} student sheets")
+
+if __name__ == "__main__":
+    main()
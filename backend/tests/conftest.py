@@ -0,0 +1,39 @@
+# backend/tests/conftest.py
+#
+# Run from backend/:  python -m pytest -q
+# Settings are read once at import, so the fake LLM backend and in-memory storage
+# are set up here before any app module is imported.
+
+import os
+import sys
+from pathlib import Path
+
+os.environ.update({
+    "LLM_BACKEND": "fake",
+    "FAKE_LLM_LATENCY_MEDIAN": "0",
+    "STORAGE_BACKEND": "memory",
+    "GRADING_CACHE_ENABLED": "false",
+    "ANSWER_KEY_CACHE_ENABLED": "false",
+})
+os.environ.pop("OPENAI_API_KEY", None)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import pytest
+
+from app import schemas
+
+@pytest.fixture
+def make_result():
+    def make(**fields) -> schemas.GradingResult:
+        data = dict(
+            job_id="job", student_id="student_1", question_id="Q1",
+            score=7.0, max_score=10,
+            question_text="Soru 1?", student_answer_text="cevap", expected_answer="beklenen cevap",
+            rubric_breakdown={"a": 3.0, "b": 4.0},
+            justification="Cevap temel noktalara değiniyor.", advice_for_full_marks="",
+            model="gpt-4o", model_params={},
+            verifier_status=schemas.VerifierStatus(valid=False),
+        )
+        data.update(fields)
+        return schemas.GradingResult(**data)
+    return make
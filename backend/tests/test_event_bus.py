@@ -0,0 +1,41 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app import schemas
+from app.config import settings
+from app.services.event_bus import EventBus
+
+def test_subscribe_to_unknown_job_does_not_create_a_channel():
+    bus = EventBus()
+    with pytest.raises(KeyError):
+        bus.subscribe("never-created")
+    assert "never-created" not in bus.channels
+
+def test_eviction_skips_running_jobs(monkeypatch):
+    monkeypatch.setattr(settings, "EVENT_BUS_MAX_JOBS", 2)
+    bus = EventBus()
+    bus.open_job("running") #oldest, never closed
+    for job_id in ("done-1", "done-2", "done-3"):
+        bus.publish(job_id, schemas.StreamEvent(event="job_done", data={}))
+        bus.close_job(job_id)
+
+    assert "running" in bus.channels
+    assert list(bus.channels) == ["running", "done-3"]
+
+def test_websocket_rejects_unknown_job():
+    from app.main import app
+    #closed before accept: the handshake itself is rejected
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with TestClient(app).websocket_connect("/api/jobs/does-not-exist/ws"):
+            pass
+    assert closed.value.code == 1008
+
+def test_websocket_replays_known_job():
+    from app.main import app, orchestrator
+    from app.services.event_bus import event_bus
+    job = orchestrator.create_job()
+    event_bus.publish(job.job_id, schemas.StreamEvent(event="job_done", data={"job_id": job.job_id}))
+    event_bus.close_job(job.job_id)
+    with TestClient(app).websocket_connect(f"/api/jobs/{job.job_id}/ws") as ws:
+        assert schemas.StreamEvent.model_validate_json(ws.receive_text()).event == "job_done"
@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.agents.follow_up_agent import HISTORY_FOLD_STEP, FollowUpAgent
+from app.agents.storage_agent import StorageAgent
+from app.services.storage_backends import InMemoryStorageBackend
+
+class RecordingLLM:
+    """Stand-in for the gateway: answers every chat after `latency`, logs prompts and overlapping calls."""
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.prompts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def chat(self, stage, **request):
+        self.prompts.append(request["messages"][-1]["content"])
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        content = f"cevap {len(self.prompts)}"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+def _agent(make_result, latency: float = 0.0) -> FollowUpAgent:
+    storage = StorageAgent(InMemoryStorageBackend())
+    storage.save_results([make_result(question_id="Q1"), make_result(question_id="Q2")])
+    agent = FollowUpAgent(storage)
+    agent.llm = RecordingLLM(latency)
+    return agent
+
+def _history(turns: int):
+    history = []
+    for i in range(turns):
+        history += [{"role": "user", "content": f"soru {i}"}, {"role": "ai", "content": f"cevap {i}"}]
+    return history
+
+def test_concurrent_questions_on_one_card_run_one_at_a_time(make_result):
+    agent = _agent(make_result, latency=0.02)
+
+    async def main():
+        return await asyncio.gather(*[
+            agent.answer_query("job", "student_1", "Q1", f"neden {i}?") for i in range(3)
+        ])
+
+    answers = asyncio.run(main())
+    assert agent.llm.max_in_flight == 1
+    #every answer made it into the history, none overwrote another
+    history = agent.storage_agent.get_chat_history("job", "student_1", "Q1")
+    assert [msg["content"] for msg in history if msg["role"] == "ai"] == answers
+    assert len(history) == 6
+    assert agent._locks._locks == {} #lock dropped once nobody waits
+
+def test_questions_on_different_cards_run_together(make_result):
+    agent = _agent(make_result, latency=0.02)
+
+    async def main():
+        await asyncio.gather(
+            agent.answer_query("job", "student_1", "Q1", "neden?"),
+            agent.answer_query("job", "student_1", "Q2", "neden?"),
+        )
+
+    asyncio.run(main())
+    assert agent.llm.max_in_flight == 2
+
+def test_rolling_summary_extends_the_cached_prefix(make_result):
+    agent = _agent(make_result)
+    history = _history(4)
+
+    first = asyncio.run(agent._summarize_older(history, HISTORY_FOLD_STEP))
+    assert first == "cevap 1"
+    assert "soru 0" in agent.llm.prompts[0] and "soru 2" not in agent.llm.prompts[0]
+
+    second = asyncio.run(agent._summarize_older(history, 2 * HISTORY_FOLD_STEP))
+    assert second == "cevap 2"
+    #only the messages after the cached prefix are sent, on top of its summary
+    assert "cevap 1" in agent.llm.prompts[1]
+    assert "soru 2" in agent.llm.prompts[1] and "soru 0" not in agent.llm.prompts[1]
+
+    #the same prefix again (next question on the card) is served from the cache
+    assert asyncio.run(agent._summarize_older(history, 2 * HISTORY_FOLD_STEP)) == second
+    assert len(agent.llm.prompts) == 2
+
+def test_summary_failure_falls_back_to_the_older_summary(make_result):
+    agent = _agent(make_result)
+    history = _history(4)
+    asyncio.run(agent._summarize_older(history, HISTORY_FOLD_STEP))
+
+    async def failing_chat(stage, **request):
+        raise RuntimeError("provider down")
+    agent.llm.chat = failing_chat
+
+    assert asyncio.run(agent._summarize_older(history, 2 * HISTORY_FOLD_STEP)) == "cevap 1"
@@ -0,0 +1,64 @@
+import asyncio
+
+from app import schemas
+from app.agents.grader_agent import GraderAgent
+from app.agents.storage_agent import StorageAgent
+from app.services.cache import TieredCache
+from app.services.llm_gateway import llm_gateway
+from app.services.storage_backends import InMemoryStorageBackend
+
+def _exam():
+    questions = [
+        schemas.QuestionObject(
+            question_id=f"Q{i}", question_text=f"Soru {i}: {{kavram}} nedir?", expected_answer="beklenen cevap",
+            max_score=10, rubric={"dogruluk": 6, "detay": 4}, metadata=schemas.PDFMetadata(page=1, raw_confidence=1.0)
+        )
+        for i in (1, 2, 3)
+    ]
+    answers = [
+        schemas.StudentAnswerObject(
+            student_id="student_1", question_id=q.question_id, student_answer_text=f"cevap {q.question_id} ğüş",
+            metadata=schemas.OCRMetadata(page=1, ocr_confidence=1.0)
+        )
+        for q in questions
+    ]
+    return questions, answers
+
+def _grader(cache_dir) -> GraderAgent:
+    grader = GraderAgent()
+    grader.cache = TieredCache(max_items=10, disk_dir=str(cache_dir), name="grading")
+    return grader
+
+def test_cached_grade_keeps_its_prompt_in_a_fresh_store(tmp_path, monkeypatch):
+    sent = []
+    chat = llm_gateway.chat
+
+    async def recording_chat(stage, **request):
+        sent.append(request["messages"][-1]["content"])
+        return await chat(stage, **request)
+    monkeypatch.setattr(llm_gateway, "chat", recording_chat)
+    questions, answers = _exam()
+
+    async def run(grader: GraderAgent, storage: StorageAgent):
+        single = await grader.grade_question(questions[0], answers[0], "job")
+        batch = await grader.grade_questions_batch(list(zip(questions[1:], answers[1:])), "job")
+        for result in [single, *batch]:
+            storage.stage_result(result)
+        storage.flush()
+
+    first_storage = StorageAgent(InMemoryStorageBackend())
+    asyncio.run(run(_grader(tmp_path), first_storage))
+    calls = len(sent)
+
+    #same disk cache, new process (empty memory tier) and a new database
+    fresh_storage = StorageAgent(InMemoryStorageBackend())
+    asyncio.run(run(_grader(tmp_path), fresh_storage))
+    assert len(sent) == calls #all served from the cache
+
+    for storage in (first_storage, fresh_storage):
+        assert storage.get_audit("job", "student_1", "Q1").llm_prompt == sent[0]
+        for question_id in ("Q2", "Q3"):
+            audit = storage.get_audit("job", "student_1", question_id)
+            assert audit.prompt_template_id == "grader_batch"
+            assert audit.llm_prompt == sent[1]
+            assert audit.llm_raw_response
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import sqlite3
+
+from app import schemas
+from app.config import settings
+from app.services.event_bus import event_bus
+from app.services.job_queue import SQLiteJobQueue
+
+def _event(name: str, **data) -> str:
+    return schemas.StreamEvent(event=name, data=data).model_dump_json()
+
+def test_relayed_events_are_deleted(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "queue.db"))
+    queue.append_events([("job-a", 1, "{}"), ("job-b", 1, "{}"), ("job-a", 1, "{}")])
+    rows = queue.events_after(0)
+    last_a = max(event_id for event_id, job_id, _, _ in rows if job_id == "job-a")
+
+    queue.delete_events(last_a, "job-a")
+    assert [job_id for _, job_id, _, _ in queue.events_after(0)] == ["job-b"]
+
+    #new rows keep increasing ids, so a relay cursor is never reused
+    queue.append_events([("job-c", 1, "{}")])
+    assert queue.events_after(last_a)[-1][1] == "job-c"
+    queue.delete_events(queue.last_event_id())
+    assert queue.events_after(0) == []
+    queue.close()
+
+def test_events_keep_their_attempt_and_old_databases_are_migrated(tmp_path):
+    path = tmp_path / "queue.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE job_events (id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, event TEXT NOT NULL)")
+    conn.execute("INSERT INTO job_events (job_id, event) VALUES ('job-a', '{}')")
+    conn.commit()
+    conn.close()
+
+    queue = SQLiteJobQueue(str(path))
+    queue.append_events([("job-a", 2, "{}")])
+    assert queue.job_events("job-a") == [(1, "{}"), (2, "{}")]
+    queue.close()
+
+def test_restart_keeps_the_events_of_active_jobs(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "queue.db"))
+    for job_id in ("running", "finished", "waiting"):
+        queue.enqueue(job_id, {}, priority=1)
+    assert queue.claim("w1", 60)[0] == "running"
+    assert queue.claim("w1", 60)[0] == "finished"
+    queue.finish("finished", "w1", "completed")
+    queue.append_events([("running", 1, "{}"), ("finished", 1, "{}")])
+
+    assert queue.active_jobs() == [("running", 1, "running"), ("waiting", 1, "queued")]
+    queue.delete_inactive_events()
+    assert [job_id for _, job_id, _, _ in queue.events_after(0)] == ["running"]
+    queue.close()
+
+def test_restarted_api_relays_a_reclaimed_job_once(tmp_path, monkeypatch):
+    from app import main
+
+    queue = SQLiteJobQueue(str(tmp_path / "queue.db"))
+    queue.enqueue("reclaimed", {}, priority=2)
+    queue.claim("dead-worker", 60)
+    #first worker died after one student, the second attempt resumed with the other one
+    queue.append_events([
+        ("reclaimed", 1, _event("job_started", total_questions=1)),
+        ("reclaimed", 1, _event("student_summary", student_id="s1")),
+        ("reclaimed", 2, _event("job_started", total_questions=1)),
+        ("reclaimed", 1, _event("student_summary_delta", student_id="s2", delta="late")),
+        ("reclaimed", 2, _event("student_summary", student_id="s2")),
+        ("reclaimed", 2, _event("job_done", timings={}, stages={})),
+    ])
+    monkeypatch.setattr(main, "job_queue", queue)
+    monkeypatch.setattr(settings, "JOB_EVENT_POLL_INTERVAL", 0.01)
+
+    async def restart():
+        await main.restore_queued_jobs()
+        job = main.orchestrator.jobs["reclaimed"]
+        assert (job.priority, job.status) == (2, "processing")
+        relay = asyncio.create_task(main.relay_worker_events())
+        while job.status == "processing":
+            await asyncio.sleep(0.01)
+        relay.cancel()
+        return job.status
+
+    try:
+        assert asyncio.run(restart()) == "completed"
+        replay = [json.loads(item[1]) for item in event_bus.channels["reclaimed"].replay]
+        assert [(e["event"], e["data"].get("student_id")) for e in replay] == [
+            ("job_started", None), ("student_summary", "s1"), ("student_summary", "s2"), ("job_done", None)
+        ]
+        assert queue.job_events("reclaimed") == []
+    finally:
+        main.orchestrator.jobs.pop("reclaimed", None)
+        queue.close()
+
+def test_reclaimed_job_skips_students_already_summarized(tmp_path, monkeypatch, make_result):
+    from app.worker import Worker
+
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(settings, "STORAGE_DB_PATH", str(tmp_path / "results.db"))
+    monkeypatch.setattr(settings, "JOB_QUEUE_DB_PATH", str(tmp_path / "queue.db"))
+    worker = Worker("w2")
+    try:
+        worker.orchestrator.storage_agent.save_results([
+            make_result(student_id="s1"), make_result(student_id="s2")
+        ])
+        worker.queue.append_events([
+            ("job", 1, _event("job_started", total_questions=1)),
+            ("job", 1, _event("student_summary", student_id="s1")),
+        ])
+        resume = asyncio.run(worker._resume_state("job"))
+        assert set(resume.graded) == {"s1", "s2"}
+        assert resume.summarized == {"s1"}
+    finally:
+        event_bus.listeners.remove(worker.relay.offer)
+        worker.orchestrator.storage_agent.close()
+        worker.queue.close()
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.services.llm_gateway import LLMGateway
+from app.services.metrics import metrics
+
+REQUEST = {"model": "gpt-4o", "temperature": 0.0, "messages": [{"role": "user", "content": "Soru 1 nedir?"}]}
+
+@pytest.fixture
+def hedging(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_STAGES", ["grader"])
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_SAMPLES", 3)
+    monkeypatch.setattr(settings, "LLM_HEDGE_PERCENTILE", 95)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MAX_FRACTION", 1.0)
+
+def _gateway(monkeypatch, latencies, hedge_delay=0.05):
+    """Gateway on the fake LLM where the n-th request sent takes latencies[n]; returns it and the send log."""
+    gateway = LLMGateway()
+    for _ in range(settings.LLM_HEDGE_MIN_SAMPLES):
+        gateway._window("grader").record(hedge_delay)
+    completions = gateway.client.chat.completions
+    create = completions.create
+    sent = []
+
+    async def delayed_create(**request):
+        index = len(sent)
+        sent.append("sent")
+        try:
+            await asyncio.sleep(latencies[index])
+        except asyncio.CancelledError:
+            sent[index] = "cancelled"
+            raise
+        sent[index] = "answered"
+        return await create(**request)
+
+    monkeypatch.setattr(completions, "create", delayed_create)
+    return gateway, sent
+
+def test_hedge_delay_needs_samples_and_a_deterministic_request(hedging):
+    gateway = LLMGateway()
+    for seconds in (0.1, 0.2):
+        gateway._window("grader").record(seconds)
+    assert gateway._hedge_delay("grader", REQUEST) is None #not enough samples yet
+    for seconds in (0.3, 0.4, 2.0):
+        gateway._window("grader").record(seconds)
+    assert gateway._hedge_delay("grader", REQUEST) == 2.0
+    assert gateway._hedge_delay("grader", {**REQUEST, "temperature": 0.7}) is None
+    assert gateway._hedge_delay("grader", {**REQUEST, "stream": True}) is None
+    assert gateway._hedge_delay("summary", REQUEST) is None
+
+def test_slow_primary_loses_to_the_hedge_and_is_cancelled(hedging, monkeypatch):
+    gateway, sent = _gateway(monkeypatch, [5.0, 0.0])
+
+    async def main():
+        return await asyncio.wait_for(gateway.chat("grader", **REQUEST), timeout=2)
+
+    response = asyncio.run(main())
+    assert response.choices[0].message.content
+    assert sent == ["cancelled", "answered"]
+    assert gateway.hedge_stats["grader"] == {"calls": 1, "hedged": 1, "hedge_won": 1}
+
+def test_fast_primary_sends_no_hedge(hedging, monkeypatch):
+    gateway, sent = _gateway(monkeypatch, [0.0])
+    asyncio.run(gateway.chat("grader", **REQUEST))
+    assert sent == ["answered"]
+    assert gateway.hedge_stats["grader"]["hedged"] == 0
+
+def test_no_hedge_while_the_primary_is_queued(hedging, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_STAGE_CONCURRENCY", {"grader": 1})
+    gateway, sent = _gateway(monkeypatch, [0.0])
+
+    async def main():
+        slot = gateway._slots_for("grader")
+        await slot.acquire() #another grading call holds the only slot
+        call = asyncio.create_task(gateway.chat("grader", **REQUEST))
+        await asyncio.sleep(0.3) #queued for well past the hedge delay
+        assert sent == []
+        assert gateway.hedge_stats["grader"]["hedged"] == 0
+        slot.release()
+        await call
+
+    asyncio.run(main())
+    assert sent == ["answered"]
+    assert gateway.hedge_stats["grader"]["hedged"] == 0
+
+def test_hedges_are_capped_per_stage(hedging, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_MAX_FRACTION", 0.5)
+    gateway, sent = _gateway(monkeypatch, [0.2, 0.0, 0.2, 0.2])
+
+    async def main():
+        for _ in range(2):
+            await gateway.chat("grader", **REQUEST)
+
+    asyncio.run(main())
+    #first call hedged (1 of 1 <= 50%), the second would make it 2 of 2
+    assert gateway.hedge_stats["grader"] == {"calls": 2, "hedged": 1, "hedge_won": 1}
+    assert sent == ["cancelled", "answered", "answered"]
+
+def test_stream_holds_the_concurrency_slot_until_closed():
+    gateway = LLMGateway()
+    limiter = gateway.scheduler.limiter
+
+    async def main():
+        deltas = gateway.stream_chat("followup", model="gpt-4o", messages=REQUEST["messages"])
+        assert await deltas.__anext__()
+        assert limiter.in_flight == 1 #still streaming
+        await deltas.aclose() #client went away mid-answer
+        assert limiter.in_flight == 0
+
+    asyncio.run(main())
+
+def test_stream_settles_the_token_budget_from_usage(monkeypatch):
+    gateway = LLMGateway()
+    tokens = gateway.scheduler.tokens
+    monkeypatch.setattr(tokens, "rate", 0.0) #no refill, only what the stream charges
+    reported = []
+    monkeypatch.setattr(metrics, "record_llm_call", lambda stage, model, usage: reported.append(usage))
+
+    async def main():
+        return "".join([delta async for delta in gateway.stream_chat("followup", model="gpt-4o", messages=REQUEST["messages"])])
+
+    assert asyncio.run(main())
+    assert gateway.scheduler.limiter.in_flight == 0
+    #the bucket is charged the reported usage, not the pre-call estimate
+    assert len(reported) == 1
+    assert tokens.capacity - tokens.tokens == reported[0].total_tokens
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+from app.config import settings
+from app.services.llm_scheduler import LLMScheduler, TokenBucket
+
+def _recorder(order, name):
+    async def call():
+        order.append(name)
+    return call
+
+def test_followup_overtakes_grading_when_rpm_is_saturated(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RPM_LIMIT", 600) #10 requests per second
+    scheduler = LLMScheduler()
+    order = []
+
+    async def main():
+        #request budget used up, every call has to wait for the refill
+        scheduler.requests.tokens = 0
+        scheduler.requests.updated_at = time.monotonic()
+        grading = [
+            asyncio.create_task(scheduler.run("grader", {"messages": []}, _recorder(order, f"grade{i}")))
+            for i in range(4)
+        ]
+        await asyncio.sleep(0) #grading calls are queued first
+        assert scheduler.requests.queued == 4
+        followup = asyncio.create_task(scheduler.run("followup", {"messages": []}, _recorder(order, "followup")))
+        await asyncio.gather(*grading, followup)
+
+    asyncio.run(main())
+    assert order == ["followup", "grade0", "grade1", "grade2", "grade3"]
+
+def test_cancelled_waiter_does_not_block_the_bucket():
+    bucket = TokenBucket(600)
+
+    async def main():
+        bucket.tokens = 0
+        bucket.updated_at = time.monotonic()
+        first = asyncio.create_task(bucket.acquire(1, (0,)))
+        second = asyncio.create_task(bucket.acquire(1, (1,)))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.wait_for(second, timeout=1.0)
+        assert bucket.queued == 0
+
+    asyncio.run(main())
+
+def _rate_limit_error(retry_after: str) -> openai.RateLimitError:
+    request = httpx.Request("POST", "https://fake-llm.local/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+def test_retry_after_is_clamped_and_jittered(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RETRY_MAX_DELAY", 5.0)
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 1.0)
+    scheduler = LLMScheduler()
+
+    delays = {scheduler._retry_delay(1, _rate_limit_error("600")) for _ in range(20)}
+    assert all(5.0 <= delay <= 6.0 for delay in delays)
+    assert len(delays) > 1 #not every waiter wakes at the same instant
+
+    #nonsense hints fall back to exponential backoff (attempt 1 -> 2s +/- 50%)
+    for bad in ("-3", "inf", "nan", "soon"):
+        assert 1.0 <= scheduler._retry_delay(1, _rate_limit_error(bad)) <= 3.0
+
+def test_rate_limited_call_is_retried_and_halves_the_concurrency_limit(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_AIMD_INITIAL", 8)
+    scheduler = LLMScheduler()
+    attempts = []
+
+    async def call():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise _rate_limit_error("0")
+        return "ok"
+
+    assert asyncio.run(scheduler.run("grader", {"messages": []}, call)) == "ok"
+    assert len(attempts) == 2
+    assert scheduler.stats["rate_limited"] == 1 and scheduler.stats["retries"] == 1
+    #halved on the 429, then +1/limit for the success
+    assert scheduler.limiter.limit == 4.25
+    assert scheduler.limiter.in_flight == 0
+
+def test_retries_give_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 2)
+    scheduler = LLMScheduler()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        raise _rate_limit_error("0")
+
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(scheduler.run("grader", {"messages": []}, call))
+    assert len(calls) == 3
+    assert scheduler.stats["failures"] == 1
+    assert scheduler.limiter.in_flight == 0
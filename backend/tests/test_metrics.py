@@ -0,0 +1,18 @@
+from app.services.cache import TieredCache
+from app.services.metrics import Metrics, metrics
+
+def test_cache_misses_and_verifier_outcomes_are_exported():
+    cache = TieredCache(max_items=10, name="test_cache")
+    cache.get("missing")
+    cache.set("key", "value")
+    cache.get("key")
+
+    text = metrics.render_prometheus()
+    assert 'exam_cache_hits_total{cache="test_cache"} 1' in text
+    assert 'exam_cache_misses_total{cache="test_cache"} 1' in text
+    assert cache.stats()["misses"] == 1
+
+    local = Metrics()
+    local.record_verifier("llm_corrections_avoided")
+    local.record_verifier("llm_corrections_avoided")
+    assert 'exam_verifier_results_total{outcome="llm_corrections_avoided"} 2' in local.render_prometheus()
@@ -0,0 +1,81 @@
+import asyncio
+import hashlib
+from pathlib import Path
+
+from app import schemas
+from app.agents.pdf_parser_agent import PDFParserAgent
+from app.config import settings
+from app.services.cache import TieredCache
+from app.services.pdf_extract import shutdown_pdf_pool
+
+ANSWER_KEY = Path(__file__).parent.parent.parent / "test_files" / "answer_key.pdf"
+
+def test_answer_key_cache_key_follows_text_settings(monkeypatch):
+    monkeypatch.setattr(settings, "PDF_WORKERS", 1)
+    agent = PDFParserAgent()
+    agent.answer_key_cache = TieredCache(max_items=10)
+    data = ANSWER_KEY.read_bytes()
+    stored = schemas.StoredFile(path=ANSWER_KEY, sha256=hashlib.sha256(data).hexdigest(), size_bytes=len(data))
+
+    async def load():
+        return await agent.load_answer_key(stored)
+
+    try:
+        questions, cached = asyncio.run(load())
+        assert questions and not cached
+        assert asyncio.run(load())[1]
+
+        #parsed under other text settings -> not served from the cache
+        monkeypatch.setattr(settings, "ANSWER_KEY_CHUNK_CHARS", settings.ANSWER_KEY_CHUNK_CHARS // 2)
+        assert not asyncio.run(load())[1]
+        monkeypatch.setattr(settings, "PDF_TEXT_BACKEND", "pdfplumber")
+        assert not asyncio.run(load())[1]
+        assert asyncio.run(load())[1]
+    finally:
+        shutdown_pdf_pool()
+
+def _chunked_agent(monkeypatch, replies):
+    """Agent whose answer key splits into len(replies) chunks; replies[chunk] is consumed one item per call."""
+    agent = PDFParserAgent()
+    calls = {chunk: 0 for chunk in replies}
+    cancelled = []
+
+    async def pages(file_path, layout_tolerance=False):
+        return ["..."]
+
+    async def extract(chunk):
+        calls[chunk] += 1
+        reply = replies[chunk][calls[chunk] - 1]
+        try:
+            await asyncio.sleep(reply if isinstance(reply, float) else 0)
+        except asyncio.CancelledError:
+            cancelled.append(chunk)
+            raise
+        if isinstance(reply, Exception):
+            raise reply
+        return [schemas.QuestionObject(
+            question_id=reply, question_text="?", expected_answer="!", max_score=10, rubric={"a": 10},
+            metadata=schemas.PDFMetadata(page=1, raw_confidence=1.0)
+        )] if isinstance(reply, str) else []
+
+    monkeypatch.setattr(agent, "_extract_pages", pages)
+    monkeypatch.setattr(agent, "_split_answer_key", lambda pages: list(replies))
+    monkeypatch.setattr(agent, "_extract_questions", extract)
+    return agent, calls, cancelled
+
+def test_failed_answer_key_chunk_is_retried(monkeypatch):
+    agent, calls, _ = _chunked_agent(monkeypatch, {"c1": [ValueError("bad json"), "Q1"], "c2": ["Q2"]})
+    questions = asyncio.run(agent.parse_answer_key(ANSWER_KEY))
+    assert [q.question_id for q in questions] == ["Q1", "Q2"]
+    assert calls == {"c1": 2, "c2": 1}
+
+def test_answer_key_chunk_failing_twice_cancels_the_others(monkeypatch):
+    agent, calls, cancelled = _chunked_agent(monkeypatch, {"c1": [ValueError("bad"), ValueError("bad")], "c2": [5.0]})
+
+    async def main():
+        assert await agent.parse_answer_key(ANSWER_KEY) == []
+        await asyncio.sleep(0.01)
+        return list(cancelled) #before asyncio.run cancels leftovers at shutdown
+
+    assert asyncio.run(main()) == ["c2"]
+    assert calls["c1"] == 2
@@ -0,0 +1,44 @@
+import asyncio
+
+from app.agents.storage_agent import StorageAgent
+from app.config import settings
+from app.services.score_matrix import ScoreMatrixStore
+from app.services.storage_backends import InMemoryStorageBackend
+
+def test_evicted_running_job_is_rebuilt_from_storage(monkeypatch, make_result):
+    monkeypatch.setattr(settings, "ANALYTICS_MAX_JOBS", 1)
+    storage = StorageAgent(InMemoryStorageBackend())
+    store = ScoreMatrixStore()
+    store.source = storage.iter_results
+
+    def grade(job_id, student_id, score):
+        result = make_result(job_id=job_id, student_id=student_id, score=score)
+        storage.stage_result(result)
+        store.add(job_id, result)
+
+    async def main():
+        store.open("job-a")
+        grade("job-a", "student_1", 7.0)
+        store.open("job-b") #evicts job-a's matrix
+        grade("job-b", "student_1", 5.0)
+        grade("job-a", "student_2", 3.0)
+        assert store.get("job-a") is None #rebuilt off the event loop
+        grade("job-a", "student_3", 4.0) #arrives during the rebuild
+        while store.get("job-a") is None:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    matrix = store.get("job-a")
+    assert matrix.students == ["student_1", "student_2", "student_3"]
+    assert matrix.totals().tolist() == [7.0, 3.0, 4.0]
+
+def test_new_job_does_not_read_storage(make_result):
+    store = ScoreMatrixStore()
+
+    def source(job_id):
+        raise AssertionError("storage read on the event loop")
+    store.source = source
+
+    store.open("job")
+    store.add("job", make_result(job_id="job"))
+    assert store.get("job").totals().tolist() == [7.0]
@@ -0,0 +1,21 @@
+import pytest
+
+from app.services.storage_backends import InMemoryStorageBackend, SQLiteStorageBackend, StorageBackend
+
+def test_incomplete_backend_fails_at_instantiation():
+    class ResultsOnly(StorageBackend):
+        def save_results(self, results, audit_texts=None):
+            pass
+
+    with pytest.raises(TypeError):
+        ResultsOnly()
+
+@pytest.mark.parametrize("backend_factory", [InMemoryStorageBackend, lambda: SQLiteStorageBackend(":memory:", pool_size=1)])
+def test_results_and_audit_texts_round_trip(backend_factory, make_result):
+    backend = backend_factory()
+    backend.save_results([make_result(), make_result(question_id="Q2")], {"k1": "metin ğüş"})
+
+    assert backend.get_result("job", "student_1", "Q2").question_id == "Q2"
+    assert [r.question_id for r in backend.list_results("job")] == ["Q1", "Q2"]
+    assert backend.get_audit_texts(["k1", "missing"]) == {"k1": "metin ğüş"}
+    backend.close()
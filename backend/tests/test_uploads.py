@@ -0,0 +1,42 @@
+import asyncio
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from app.config import settings
+from app.orchestrator import OrchestratorAgent
+from app.services.event_bus import event_bus
+
+def _upload(name: str, size: int) -> UploadFile:
+    return UploadFile(io.BytesIO(b"%PDF" + b"x" * size), filename=name)
+
+@pytest.fixture
+def orchestrator(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) #temp_uploads/ is created under the working directory
+    return OrchestratorAgent()
+
+def test_duplicate_file_names_get_their_own_file(orchestrator):
+    job = orchestrator.create_job()
+    sheets = [_upload("student_1.pdf", 10), _upload("dir/student_1.pdf", 20), _upload("../student_1.pdf", 30)]
+    stored = asyncio.run(orchestrator.save_uploaded_files(job.job_id, _upload("key.pdf", 5), sheets))
+
+    paths = [f.path for f in stored["student_sheets"]]
+    assert [p.name for p in paths] == ["student_1.pdf", "student_1_2.pdf", "student_1_3.pdf"]
+    assert [p.stat().st_size for p in paths] == [14, 24, 34]
+    assert all(p.parent == orchestrator.upload_dir / job.job_id for p in paths)
+
+def test_rejected_upload_removes_the_job(orchestrator, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_CHUNK_SIZE", 8)
+    monkeypatch.setattr(settings, "UPLOAD_MAX_BYTES", 100)
+    job = orchestrator.create_job()
+    sheets = [_upload("student_1.pdf", 50), _upload("student_2.pdf", 500)]
+
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(orchestrator.save_uploaded_files(job.job_id, _upload("key.pdf", 50), sheets))
+    assert rejected.value.status_code == 413
+    assert not (orchestrator.upload_dir / job.job_id).exists()
+
+    orchestrator.discard_job(job.job_id)
+    assert job.job_id not in orchestrator.jobs
+    assert event_bus.channels[job.job_id].closed
@@ -0,0 +1,31 @@
+import asyncio
+
+from app.agents.verifier_agent import VerifierAgent
+from app.services.metrics import metrics
+
+def test_local_repair_avoids_llm_correction(make_result):
+    verifier = VerifierAgent()
+    before = metrics.verifier_stats()
+
+    #rubric sum 7 vs score 9: fixed by trust_rubric_sum, no corrector call
+    result = asyncio.run(verifier.verify_grading_result(make_result(score=9.0)))
+
+    assert result.verifier_status.valid
+    assert result.score == 7.0
+    after = metrics.verifier_stats()
+    for outcome in ("verified", "invalid", "local_repairs", "llm_corrections_avoided"):
+        assert after.get(outcome, 0) - before.get(outcome, 0) == 1
+    assert after.get("llm_corrections", 0) == before.get("llm_corrections", 0)
+    assert verifier.stats["llm_corrections_avoided"] == 1
+
+def test_unrepairable_result_goes_to_llm_correction(make_result):
+    verifier = VerifierAgent()
+    before = metrics.verifier_stats()
+
+    #a missing justification cannot be fixed by rules
+    asyncio.run(verifier.verify_grading_result(make_result(justification="")))
+
+    after = metrics.verifier_stats()
+    assert after.get("llm_corrections", 0) - before.get("llm_corrections", 0) == 1
+    assert after.get("llm_corrections_avoided", 0) == before.get("llm_corrections_avoided", 0)
+    assert verifier.stats == {"verified": 1, "invalid": 1, "local_repairs": 0, "llm_corrections": 1, "llm_corrections_avoided": 0}